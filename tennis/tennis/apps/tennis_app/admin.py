@@ -2,7 +2,8 @@ from django.contrib import admin
 from .models import (
     Club, ClubMembership, ClubAdmin, Player, Tournament,
     Match, Game, FriendlyGame, Point, Standing, ClubEvent,
-    TournamentParticipant, ClubAdminInvite
+    TournamentParticipant, ClubAdminInvite, PlayerStats, PlayerMonthlyStats,
+    LiveFriendlyGame
 )
 
 
@@ -82,8 +83,8 @@ class FriendlyGameAdmin(admin.ModelAdmin):
 
 @admin.action(description="Пересчитать счет для выбранных партий")
 def recalculate_scores(modeladmin, request, queryset):
-    for game in queryset:
-        game.recalculate_score()
+    # Счет ведется счетчиками; полный пересчет по очкам нужен только для восстановления
+    Game.recalculate_scores(queryset)
 
 
 @admin.register(Game)
@@ -106,6 +107,26 @@ class StandingAdmin(admin.ModelAdmin):
     list_filter = ("tournament",)
 
 
+@admin.register(PlayerStats)
+class PlayerStatsAdmin(admin.ModelAdmin):
+    list_display = ("player", "matches", "friendlies_single", "friendlies_double", "scored_points", "updated_at")
+    search_fields = ("player__full_name",)
+
+
+@admin.register(PlayerMonthlyStats)
+class PlayerMonthlyStatsAdmin(admin.ModelAdmin):
+    list_display = ("player", "year", "month", "single_games", "double_games")
+    list_filter = ("year",)
+    search_fields = ("player__full_name",)
+
+
+@admin.register(LiveFriendlyGame)
+class LiveFriendlyGameAdmin(admin.ModelAdmin):
+    list_display = ("game_key", "club", "recorded_by", "started_at", "updated_at", "friendly")
+    list_filter = ("club",)
+    search_fields = ("game_key",)
+
+
 @admin.register(ClubEvent)
 class ClubEventAdmin(admin.ModelAdmin):
     list_display = ("title", "club", "date", "created_by")
@@ -0,0 +1,117 @@
+"""Кэш вычисляемых данных страниц с версионными ключами.
+
+У клуба, игрока и турнира есть счетчик версии в кэше. Ключ записи включает
+версии всех объектов, от которых она зависит; при изменении данных сигналы
+(signals.py) увеличивают счетчики (bump), и старые записи просто перестают
+читаться и вытесняются по таймауту — удалять их по списку ключей не нужно.
+
+Работает с любым бэкендом CACHES; при нескольких процессах кэш должен быть
+общим (файловый или Redis), иначе процессы не увидят сброс версий друг друга.
+"""
+import functools
+import hashlib
+import time
+from collections import Counter
+
+from django.core.cache import cache
+from django.db import transaction
+
+DEFAULT_TIMEOUT = 60 * 60
+SCOPES = ('club', 'player', 'tournament')
+
+# Попадания и промахи в этом процессе: {(имя, 'hit' | 'miss'): число}
+counters = Counter()
+_MISSING = object()
+
+
+def _version_key(scope, obj_id):
+    return f'ver:{scope}:{obj_id}'
+
+
+def get_versions(deps):
+    """Текущие версии зависимостей [(scope, id)] одним чтением кэша."""
+    keys = [_version_key(scope, obj_id) for scope, obj_id in deps]
+    versions = cache.get_many(keys)
+    for key in keys:
+        if key not in versions:
+            # Начальное значение — время: после вытеснения счетчика версии не повторяются
+            cache.add(key, int(time.time() * 1000), None)
+            versions[key] = cache.get(key)
+    return [versions[key] for key in keys]
+
+
+def get_version(scope, obj_id):
+    return get_versions([(scope, obj_id)])[0]
+
+
+def _incr(key):
+    try:
+        cache.incr(key)
+    except ValueError:  # счетчика нет (вытеснен) — следующее чтение создаст новый
+        pass
+
+
+def bump(scope, obj_id):
+    """Делает устаревшими все записи, зависящие от объекта.
+
+    Повтор после коммита нужен, чтобы устарела и запись, которую другой запрос
+    успел посчитать по еще не закоммиченным данным.
+    """
+    if obj_id is None:
+        return
+    key = _version_key(scope, obj_id)
+    _incr(key)
+    transaction.on_commit(lambda: _incr(key))
+
+
+def bump_many(scope, obj_ids):
+    for obj_id in set(obj_ids) - {None}:
+        bump(scope, obj_id)
+
+
+def cached_result(name, deps, extra, compute, timeout=DEFAULT_TIMEOUT):
+    """Значение compute() из кэша под текущими версиями зависимостей deps.
+
+    extra — часть ключа, различающая вызовы с одними зависимостями (параметры);
+    в ключ идет ее хэш, чтобы ключ годился для любого бэкенда.
+    """
+    versions = ':'.join(f'{scope}{obj_id}v{version}' for (scope, obj_id), version in zip(deps, get_versions(deps)))
+    key = f'{name}:{versions}:{hashlib.md5(repr(extra).encode()).hexdigest()}'
+    value = cache.get(key, _MISSING)
+    if value is _MISSING:
+        counters[name, 'miss'] += 1
+        value = compute()
+        cache.set(key, value, timeout)
+    else:
+        counters[name, 'hit'] += 1
+    return value
+
+
+def cached(scope, obj_id, name, compute, timeout=DEFAULT_TIMEOUT):
+    """Значение compute() из кэша под текущей версией одного объекта."""
+    return cached_result(name, [(scope, obj_id)], None, compute, timeout)
+
+
+def versioned(name, key, timeout=DEFAULT_TIMEOUT):
+    """Декоратор: кэширует результат функции.
+
+    key(*args, **kwargs) возвращает (зависимости [(scope, id)], extra) — как у cached_result.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            deps, extra = key(*args, **kwargs)
+            return cached_result(name, deps, extra, lambda: func(*args, **kwargs), timeout)
+        wrapper.uncached = func
+        return wrapper
+    return decorator
+
+
+def report():
+    """{имя: {'hits', 'misses', 'hit_ratio'}} по счетчикам этого процесса."""
+    names = sorted({name for name, _ in counters})
+    result = {}
+    for name in names:
+        hits, misses = counters[name, 'hit'], counters[name, 'miss']
+        result[name] = {'hits': hits, 'misses': misses, 'hit_ratio': round(hits / (hits + misses), 3)}
+    return result
@@ -1,13 +1,45 @@
+import asyncio
 import json
+from collections import Counter
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
-from .models import Club, FriendlyGame, Player
+from . import friendlies, live, scoreboard, wire
+from .models import Club, ClubAdmin, FriendlyGame, Match, Player
+
+
+# Счетчики рассылки game_update в этом процессе: получено от клиентов,
+# разослано группе и поглощено более новым состоянием той же игры
+fanout_counters = Counter()
+
+
+def broadcast_tick():
+    """Не чаще одной рассылки состояния игры за этот интервал (секунды)."""
+    return getattr(settings, 'FRIENDLY_BROADCAST_TICK', 0.1)
+
+
+def persist_interval():
+    """Как часто (секунды) состояние идущей игры пишется в БД."""
+    return getattr(settings, 'FRIENDLY_PERSIST_INTERVAL', 5)
 
 
 class FriendlyGameConsumer(AsyncWebsocketConsumer):
     async def connect(self):
         self.club_id = self.scope['url_route']['kwargs']['club_id']
         self.room_group_name = f'friendly_game_{self.club_id}'
+        # Версия протокола и кодировка (?v=2&enc=msgpack), см. wire.py
+        self.protocol, self.encoding = wire.negotiate(self.scope.get('query_string', b''))
+        # Отложенные (слитые) состояния игр и время последней рассылки по game_id
+        self.pending_updates = {}
+        self.last_broadcast = {}
+        self.flush_task = None
+        # Сохранение игр в БД: только для участников и администраторов клуба
+        self.can_record = await database_sync_to_async(friendlies.can_record)(self.scope.get('user'), self.club_id)
+        self.dirty_states = {}
+        self.live_ids = {}
+        self.persist_task = None
 
         # Присоединиться к группе
         await self.channel_layer.group_add(
@@ -17,7 +49,33 @@ class FriendlyGameConsumer(AsyncWebsocketConsumer):
 
         await self.accept()
 
+        # Снимок идущих игр, чтобы зритель сразу увидел текущий счет
+        await self.send_snapshot()
+
+    async def send_snapshot(self):
+        entries = await sync_to_async(scoreboard.club_snapshot_entries)(self.club_id)
+        if self.protocol == wire.PROTOCOL_VERSION:
+            await self.send_frame(wire.snapshot_frame(entries, self.encoding))
+        else:
+            games = [entry['game_data'] for entry in entries]
+            await self.send(text_data=json.dumps({'type': 'snapshot', 'games': games}))
+
+    async def send_frame(self, frame):
+        if self.encoding == 'msgpack':
+            await self.send(bytes_data=wire.encode_msgpack(frame))
+        else:
+            await self.send(text_data=wire.encode_json(frame))
+
     async def disconnect(self, close_code):
+        # Дослать последнее состояние, если оно ждало своего такта
+        if self.flush_task is not None:
+            self.flush_task.cancel()
+            self.flush_task = None
+        await self.flush_pending()
+        if self.persist_task is not None:
+            self.persist_task.cancel()
+            self.persist_task = None
+        await self.persist_dirty()
         # Покинуть группу
         await self.channel_layer.group_discard(
             self.room_group_name,
@@ -25,45 +83,239 @@ class FriendlyGameConsumer(AsyncWebsocketConsumer):
         )
 
     # Получить сообщение от WebSocket
-    async def receive(self, text_data):
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            return
         data = json.loads(text_data)
         message_type = data.get('type')
+        if message_type == 'sync':
+            await self.send_snapshot()
+            return
+        if message_type not in ('game_update', 'game_end'):
+            return
+        game_data = scoreboard.clean_game_data(data.get('game_data'))
+        if game_data is None:
+            return
+        # Старые клиенты не присылают game_id и сохраняют игру через /api/save_friendly_game/
+        persist = self.can_record and bool(data['game_data'].get('game_id'))
 
         if message_type == 'game_update':
-            # Отправить обновление всем в группе
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'game_update_message',
-                    'game_data': data.get('game_data')
-                }
-            )
-        elif message_type == 'game_end':
+            await self.queue_update(game_data)
+            if persist:
+                await self.persist_update(game_data)
+        else:
+            # Окончание игры делает ожидающее обновление ненужным
+            if self.pending_updates.pop(game_data['game_id'], None) is not None:
+                fanout_counters['merged'] += 1
+            entry = await sync_to_async(scoreboard.end_snapshot)(self.club_id, game_data)
             # Отправить уведомление об окончании игры
-            await self.channel_layer.group_send(
-                self.room_group_name,
-                {
-                    'type': 'game_end_message',
-                    'game_data': data.get('game_data')
-                }
-            )
+            await self.channel_layer.group_send(self.room_group_name, wire.frame_event(
+                'game_end_message',
+                {'type': 'game_end', 'game_data': game_data},
+                wire.end_frame(entry, game_data) if entry else None,
+            ))
+            if persist:
+                await self.persist_end(game_data)
 
-    # Обработчик для отправки обновлений игры
-    async def game_update_message(self, event):
-        game_data = event['game_data']
+    async def persist_update(self, game_data):
+        """Первое состояние игры пишется сразу (клиент получает id), дальше — пакетом раз в интервал."""
+        game_id = game_data['game_id']
+        error = friendlies.validate_game_data(game_data)
+        if error:
+            await self.send_error(game_id, error)
+            return
+        if game_id in self.live_ids:
+            self.dirty_states[game_id] = game_data
+            if self.persist_task is None:
+                self.persist_task = asyncio.ensure_future(self.persist_later(persist_interval()))
+            return
+        self.dirty_states.pop(game_id, None)
+        stored = await self.store_states({game_id: game_data})
+        if game_id in stored:
+            await self.send(text_data=json.dumps({'type': 'ack', 'game_id': game_id, 'live_id': stored[game_id]}))
+
+    async def persist_later(self, delay):
+        await asyncio.sleep(delay)
+        self.persist_task = None
+        await self.persist_dirty()
 
-        # Отправить сообщение клиенту
+    async def persist_dirty(self):
+        dirty, self.dirty_states = self.dirty_states, {}
+        if dirty:
+            await self.store_states(dirty)
+
+    async def store_states(self, states):
+        user = self.scope.get('user')
+        stored = await database_sync_to_async(friendlies.store_live_states)(self.club_id, user.pk, states)
+        self.live_ids.update(stored)
+        return stored
+
+    async def persist_end(self, game_data):
+        game_id = game_data['game_id']
+        self.dirty_states.pop(game_id, None)
+        error = friendlies.validate_game_data(game_data, final=True)
+        if error:
+            await self.send_error(game_id, error)
+            return
+        friendly_id = await database_sync_to_async(friendlies.finish_friendly)(
+            self.club_id, self.scope['user'].pk, game_data
+        )
         await self.send(text_data=json.dumps({
-            'type': 'game_update',
-            'game_data': game_data
+            'type': 'ack', 'game_id': game_id, 'friendly_id': friendly_id, 'finished': True,
+        }))
+
+    async def send_error(self, game_id, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'game_id': game_id, 'message': message}))
+
+    async def queue_update(self, game_data):
+        """Первое обновление игры уходит сразу, следующие в пределах такта сливаются в одно."""
+        fanout_counters['received'] += 1
+        game_id = game_data['game_id']
+        if game_id in self.pending_updates:
+            fanout_counters['merged'] += 1
+            self.pending_updates[game_id] = game_data
+            return
+        loop = asyncio.get_running_loop()
+        wait = self.last_broadcast.get(game_id, float('-inf')) + broadcast_tick() - loop.time()
+        if wait <= 0:
+            await self.broadcast_update(game_data)
+            return
+        self.pending_updates[game_id] = game_data
+        if self.flush_task is None:
+            self.flush_task = asyncio.ensure_future(self.flush_later(wait))
+
+    async def flush_later(self, delay):
+        await asyncio.sleep(delay)
+        self.flush_task = None
+        await self.flush_pending()
+
+    async def flush_pending(self):
+        pending, self.pending_updates = self.pending_updates, {}
+        for game_data in pending.values():
+            await self.broadcast_update(game_data)
+
+    async def broadcast_update(self, game_data):
+        self.last_broadcast[game_data['game_id']] = asyncio.get_running_loop().time()
+        fanout_counters['broadcast'] += 1
+        entry, previous = await sync_to_async(scoreboard.update_snapshot)(self.club_id, game_data)
+        # Отправить обновление всем в группе: кадры обеих версий сериализованы один раз
+        await self.channel_layer.group_send(self.room_group_name, wire.frame_event(
+            'game_update_message',
+            {'type': 'game_update', 'game_data': game_data},
+            wire.update_frame(entry, previous),
+        ))
+
+    async def send_event(self, event, message_type):
+        if self.protocol == wire.PROTOCOL_VERSION and 'v2' in event:
+            if self.encoding == 'msgpack' and 'v2b' in event:
+                await self.send(bytes_data=event['v2b'])
+            else:
+                await self.send(text_data=event['v2'])
+            return
+        # Прежний формат (и события без text — от старых воркеров)
+        await self.send(text_data=event.get('text') or json.dumps({
+            'type': message_type,
+            'game_data': event['game_data']
         }))
 
+    # Обработчик для отправки обновлений игры
+    async def game_update_message(self, event):
+        await self.send_event(event, 'game_update')
+
     # Обработчик для завершения игры
     async def game_end_message(self, event):
-        game_data = event['game_data']
+        await self.send_event(event, 'game_end')
 
-        # Отправить сообщение клиенту
-        await self.send(text_data=json.dumps({
-            'type': 'game_end',
-            'game_data': game_data
-        }))
+
+class MatchConsumer(AsyncWebsocketConsumer):
+    """Живой счет турнирного матча: зрители получают счет, администраторы клуба ведут его."""
+
+    async def connect(self):
+        self.match_id = int(self.scope['url_route']['kwargs']['match_id'])
+        info = await self.get_match_info()
+        if info is None:
+            await self.close()
+            return
+        tournament_id, self.can_score = info
+        # Рассылка идет группам матча и турнира, а сокет матча подписан только на свою:
+        # иначе каждый кадр приходил бы дважды вместе со счетом соседних матчей
+        self.room_group_name = live.match_group(self.match_id)
+        self.score_groups = [self.room_group_name, live.tournament_group(tournament_id)]
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, 'room_group_name'):
+            await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+    # Получить действия судьи от WebSocket
+    async def receive(self, text_data=None, bytes_data=None):
+        if text_data is None:
+            # Протокол судьи — только JSON-текст; бинарный кадр не молча теряется, а отклоняется
+            await self.send_error(None, 'Бинарные сообщения не поддерживаются')
+            return
+        try:
+            data = json.loads(text_data)
+        except ValueError:
+            return
+        if not isinstance(data, dict) or data.get('type') != 'score':
+            return
+        key = data.get('key')
+        if not self.can_score:
+            await self.send_error(key, 'Недостаточно прав')
+            return
+        try:
+            actions = live.parse_actions(data.get('actions'))
+            if key is not None and not isinstance(key, str):
+                raise ValueError('key')
+        except ValueError:
+            await self.send_error(key, 'Неверный формат запроса')
+            return
+
+        result, event = await self.apply_actions(actions, key, data.get('first_server', 1))
+        await self.send(text_data=json.dumps({'type': 'ack', 'key': key, **result}))
+        if result['applied']:
+            message = live.score_message(event)
+            for group in self.score_groups:
+                await self.channel_layer.group_send(group, message)
+
+    async def send_error(self, key, message):
+        await self.send(text_data=json.dumps({'type': 'error', 'key': key, 'message': message}))
+
+    # Обработчик рассылки счета
+    async def match_score(self, event):
+        await self.send(text_data=event['text'])
+
+    @database_sync_to_async
+    def get_match_info(self):
+        match = Match.objects.select_related('tournament').filter(pk=self.match_id).first()
+        if match is None:
+            return None
+        user = self.scope.get('user')
+        can_score = bool(
+            user and user.is_authenticated
+            and match.player1_id and match.player2_id
+            and ClubAdmin.objects.filter(user=user, club_id=match.tournament.club_id).exists()
+        )
+        return match.tournament_id, can_score
+
+    @database_sync_to_async
+    def apply_actions(self, actions, key, first_server):
+        match = Match.objects.select_related('player1', 'player2').get(pk=self.match_id)
+        live_match = live.get_live_match(match)
+        return live_match.apply_batch(actions, key=key, first_server=first_server), live_match.score_event()
+
+
+class TournamentConsumer(AsyncWebsocketConsumer):
+    """Зрители турнира получают счет всех его матчей (группа tournament_<id>)."""
+
+    async def connect(self):
+        self.room_group_name = live.tournament_group(self.scope['url_route']['kwargs']['tournament_id'])
+        await self.channel_layer.group_add(self.room_group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        await self.channel_layer.group_discard(self.room_group_name, self.channel_name)
+
+    async def match_score(self, event):
+        await self.send(text_data=event['text'])
@@ -0,0 +1,125 @@
+"""Сохранение товарищеских игр из WebSocket-трансляции (FriendlyGameConsumer).
+
+Пока игра идет, ее последнее состояние пакетами пишется в LiveFriendlyGame;
+game_end создает FriendlyGame с партией. Функции синхронные — консьюмер
+вызывает их через database_sync_to_async.
+"""
+from django.db import transaction
+from django.utils import timezone
+
+from .models import ClubAdmin, ClubMembership, FriendlyGame, Game, LiveFriendlyGame, Player
+
+MAX_SCORE = 99
+TEAM_FIELDS = ('team1_player1', 'team1_player2', 'team2_player1', 'team2_player2')
+
+
+def can_record(user, club_id):
+    """Сохранять игры клуба могут его активные участники и администраторы."""
+    if not (user and user.is_authenticated):
+        return False
+    return (ClubMembership.objects.filter(user=user, club_id=club_id, is_active=True).exists()
+            or ClubAdmin.objects.filter(user=user, club_id=club_id).exists())
+
+
+def player_names(game_data):
+    if game_data.get('game_type', 'single') == 'double':
+        return [game_data.get(field) for field in TEAM_FIELDS]
+    return [game_data.get('player1'), game_data.get('player2')]
+
+
+def validate_game_data(game_data, final=False):
+    """Текст ошибки для кадра game_update / game_end (final=True) или None, если кадр корректен."""
+    if game_data.get('game_type', 'single') not in dict(FriendlyGame.GAME_TYPE_CHOICES):
+        return 'Неизвестный тип игры'
+    names = player_names(game_data)
+    if not all(isinstance(name, str) and name.strip() for name in names):
+        return 'Не указаны игроки'
+    if len(set(names)) != len(names):
+        return 'Игроки должны быть уникальны'
+    scores = [game_data.get('score1', 0), game_data.get('score2', 0)]
+    if not all(isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_SCORE for value in scores):
+        return 'Неверный счет'
+    if final:
+        s1, s2 = scores
+        if max(s1, s2) < 11 or abs(s1 - s2) < 2:
+            return 'Игра не завершена'
+        expected = game_data.get('player1') if s1 > s2 else game_data.get('player2')
+        if game_data.get('winner') != expected:
+            return 'Победитель не совпадает со счетом'
+    return None
+
+
+def store_live_states(club_id, user_id, states):
+    """Пакетно сохраняет последние состояния идущих игр {game_key: game_data}.
+
+    Возвращает {game_key: id LiveFriendlyGame}; уже завершенные игры не меняются.
+    """
+    rows = {row.game_key: row for row in LiveFriendlyGame.objects.filter(club_id=club_id, game_key__in=list(states))}
+    created = [
+        LiveFriendlyGame(club_id=club_id, game_key=key, game_data=game_data, recorded_by_id=user_id)
+        for key, game_data in states.items() if key not in rows
+    ]
+    updated = []
+    now = timezone.now()
+    for key, row in rows.items():
+        if row.friendly_id is None:
+            row.game_data, row.updated_at = states[key], now
+            updated.append(row)
+    with transaction.atomic():
+        LiveFriendlyGame.objects.bulk_create(created)
+        LiveFriendlyGame.objects.bulk_update(updated, ['game_data', 'updated_at'])
+    return {row.game_key: row.pk for row in created + updated}
+
+
+def _club_player(club_id, name):
+    player = Player.objects.filter(club_id=club_id, full_name=name).order_by('id').first()
+    return player or Player.objects.create(full_name=name, club_id=club_id)
+
+
+def finish_friendly(club_id, user_id, game_data):
+    """Создает FriendlyGame и партию по кадру game_end; повторный вызов возвращает ту же игру."""
+    with transaction.atomic():
+        live, _ = LiveFriendlyGame.objects.select_for_update().get_or_create(
+            club_id=club_id, game_key=game_data['game_id'],
+            defaults={'game_data': game_data, 'recorded_by_id': user_id},
+        )
+        if live.friendly_id:
+            return live.friendly_id
+
+        s1, s2 = game_data.get('score1', 0), game_data.get('score2', 0)
+        end_time = timezone.now()
+        fields = {
+            'club_id': club_id,
+            'game_type': game_data.get('game_type', 'single'),
+            'score_team1': s1,
+            'score_team2': s2,
+            'recorded_by_id': user_id,
+        }
+        if fields['game_type'] == 'double':
+            t1p1, t1p2, t2p1, t2p2 = (_club_player(club_id, name) for name in player_names(game_data))
+            fields.update(
+                player1=t1p1, player2=t2p1,  # для совместимости, как в save_friendly_game
+                team1_player1=t1p1, team1_player2=t1p2, team2_player1=t2p1, team2_player2=t2p2,
+                winning_team=1 if s1 > s2 else 2,
+            )
+        else:
+            player1, player2 = (_club_player(club_id, name) for name in player_names(game_data))
+            fields.update(player1=player1, player2=player2, winner=player1 if s1 > s2 else player2)
+        friendly = FriendlyGame.objects.create(**fields)
+        Game.objects.create(friendly=friendly, start_time=live.started_at, end_time=end_time,
+                            score_player1=s1, score_player2=s2)
+
+        live.friendly, live.game_data = friendly, game_data
+        live.save(update_fields=['friendly', 'game_data', 'updated_at'])
+        return friendly.pk
+
+
+def finished_friendly_id(club_id, game_key, user_id):
+    """Id игры, уже сохраненной из трансляции с этим ключом (для запасного POST).
+
+    Ключ присылает клиент, поэтому поиск ограничен клубом и записавшим
+    пользователем — так же, как строки store_live_states.
+    """
+    return (LiveFriendlyGame.objects.filter(club_id=club_id, game_key=game_key, recorded_by_id=user_id,
+                                            friendly__isnull=False)
+            .values_list('friendly_id', flat=True).first())
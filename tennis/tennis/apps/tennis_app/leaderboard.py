@@ -0,0 +1,105 @@
+"""Рейтинг-лист игроков: общий или по клубу, с фильтром по руке.
+
+Порядок — (rating, id) по убыванию, как в индексах Player. Страницы
+отдаются по курсору (keyset): следующая начинается строго после последней
+строки предыдущей, поэтому глубокая страница стоит столько же, сколько
+первая, и не «съезжает», если между запросами рейтинги изменились.
+
+Курсор из next несет (rating, id) последней строки вместе с ее номером и
+местом и подписан сервером (соль включает фильтры), поэтому следующая
+страница продолжает нумерацию без подсчета, а подделанный курсор или курсор
+другого списка отклоняется. Курсор «rating:id», собранный клиентом, — явный
+переход к строке: только для него номер считается подсчетом строк выше
+курсора по тому же индексу.
+"""
+from django.core import signing
+from django.db.models import Count, Q
+
+from .models import Player
+
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 200
+HANDS = ('right', 'left')
+
+
+def _signer(club_id, hand):
+    return signing.Signer(salt=f'leaderboard:{club_id}:{hand}')
+
+
+def encode_cursor(row, club_id=None, hand=None):
+    return _signer(club_id, hand).sign(f"{row['rating']}:{row['id']}:{row['position']}:{row['rank']}")
+
+
+def decode_cursor(cursor, club_id=None, hand=None):
+    """Курсор строки: (рейтинг, id) для явного перехода или (рейтинг, id, номер, место) из next.
+
+    ValueError для неверной строки, чужой или поддельной подписи.
+    """
+    if cursor.count(':') != 1:
+        try:
+            cursor = _signer(club_id, hand).unsign(cursor)
+        except signing.BadSignature:
+            raise ValueError('Неверная подпись курсора')
+        if cursor.count(':') != 3:
+            raise ValueError('Неверный курсор')
+    return tuple(map(int, cursor.split(':')))
+
+
+def _below(rating, player_id):
+    """Строки после (rating, player_id) в порядке списка.
+
+    Сравнение кортежей (rating, id) < (r, i) записано так, что внешнее
+    rating <= r задает границу диапазона индекса, а OR только отсекает
+    строки с тем же рейтингом.
+    """
+    return Q(rating__lte=rating) & (Q(rating__lt=rating) | Q(id__lt=player_id))
+
+
+def page(club_id=None, hand=None, after=None, limit=DEFAULT_LIMIT):
+    """{'results': [...], 'next': курсор или None} — limit строк после курсора after (из decode_cursor).
+
+    У каждой строки position — порядковый номер в списке и rank — место с
+    учетом равенства рейтингов (равные делят место, как 1, 2, 2, 4).
+    """
+    players = Player.objects.all()
+    if club_id is not None:
+        players = players.filter(club_id=club_id)
+    if hand is not None:
+        players = players.filter(dominant_hand=hand)
+
+    rows = players.order_by('-rating', '-id')
+    # Предыдущая строка: (рейтинг, номер, место); для первой страницы — воображаемая нулевая
+    previous_rating, position, rank = None, 0, 0
+    if after is not None:
+        rating, player_id, *placed = after
+        if placed:
+            # Подписанный курсор: номер и место последней строки предыдущей страницы
+            position, rank = placed
+        else:
+            # Явный переход: строки до курсора включительно — с большим рейтингом и с тем же рейтингом не ниже по id
+            counts = players.filter(rating__gte=rating).aggregate(
+                higher=Count('pk', filter=Q(rating__gt=rating)),
+                tied=Count('pk', filter=Q(rating=rating, id__gte=player_id)),
+            )
+            position, rank = counts['higher'] + counts['tied'], counts['higher'] + 1
+        previous_rating = rating
+        rows = rows.filter(_below(rating, player_id))
+    rows = list(rows.values('id', 'full_name', 'rating', 'dominant_hand', 'club_id', 'club__name')[:limit + 1])
+    has_next, rows = len(rows) > limit, rows[:limit]
+
+    results = []
+    for row in rows:
+        position += 1
+        if row['rating'] != previous_rating:
+            rank = position
+        previous_rating = row['rating']
+        results.append({
+            'position': position,
+            'rank': rank,
+            'id': row['id'],
+            'full_name': row['full_name'],
+            'rating': row['rating'],
+            'dominant_hand': row['dominant_hand'],
+            'club': {'id': row['club_id'], 'name': row['club__name']},
+        })
+    return {'results': results, 'next': encode_cursor(results[-1], club_id, hand) if has_next else None}
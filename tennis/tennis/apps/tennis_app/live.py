@@ -0,0 +1,376 @@
+"""Живой счет турнирных матчей в памяти процесса с отложенной записью в БД.
+
+Счет активной партии хранится в LiveMatch и является авторитетным: судья
+получает ответ сразу, а очки пишутся в БД пакетами (LIVE_SCORING_BATCH_SIZE
+очков или раз в LIVE_SCORING_FLUSH_SECONDS секунд) и обязательно — в конце
+партии. После перезапуска процесса состояние восстанавливается из БД.
+Номер последнего действия судьи и ключи недавних пакетов пишутся в Match в
+той же транзакции, что и очки: повтор пакета после перезапуска пропускает
+ровно то, что уже записано, и заново применяет потерянное вместе с памятью.
+
+Один матч должен обслуживаться одним процессом (процессом судьи): состояние
+не синхронизируется между воркерами.
+"""
+import atexit
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from . import caching, stats
+from .models import Game, Match, Point
+
+logger = logging.getLogger(__name__)
+
+POINTS_TO_WIN = 11
+SETS_TO_WIN = 2
+
+ACTIONS = ('start_set', 'new_set', 'p1', 'p2', 'undo_p1', 'undo_p2')
+# Сколько последних ключей идемпотентности помнить на матч
+IDEMPOTENCY_KEYS_LIMIT = 64
+MAX_BATCH_ACTIONS = 200
+
+
+def parse_actions(actions):
+    """Проверяет пакет действий судьи; строки допускаются как сокращение {'action': ...}.
+
+    Бросает ValueError при неверном формате.
+    """
+    if not isinstance(actions, list) or len(actions) > MAX_BATCH_ACTIONS:
+        raise ValueError('actions')
+    parsed = []
+    for item in actions:
+        if isinstance(item, str):
+            item = {'action': item}
+        if not isinstance(item, dict) or item.get('action') not in ACTIONS:
+            raise ValueError('action')
+        if not isinstance(item.get('seq', 0), int):
+            raise ValueError('seq')
+        parsed.append(item)
+    return parsed
+
+
+def match_group(match_id):
+    return f'match_{match_id}'
+
+
+def tournament_group(tournament_id):
+    return f'tournament_{tournament_id}'
+
+
+def game_finished(score1, score2):
+    """Партия до 11 очков с разницей не меньше двух."""
+    return (score1 >= POINTS_TO_WIN or score2 >= POINTS_TO_WIN) and abs(score1 - score2) >= 2
+
+
+class LiveMatch:
+    """Состояние одного матча: сеты, текущая партия и ее очки (записанные и ожидающие записи)."""
+
+    def __init__(self, match):
+        self.lock = threading.RLock()
+        self.match_id = match.pk
+        self.tournament_id = match.tournament_id
+        self.player_ids = (match.player1_id, match.player2_id)
+        self.player_names = (match.player1.full_name, match.player2.full_name)
+        self.sets = [match.sets_player1, match.sets_player2]
+        self.finished = match.finished
+        # Последний примененный номер действия клиента и ответы на недавние пакеты.
+        # Для ключей, известных только из БД, ответа нет (None)
+        self.last_seq = match.live_seq
+        self.recent_batches = OrderedDict.fromkeys(match.live_batch_keys)
+        self._saved_progress = self._progress()
+        self._load_game(match.get_current_game())
+
+    def matches(self, match):
+        return (
+            self.player_ids == (match.player1_id, match.player2_id)
+            and self.sets == [match.sets_player1, match.sets_player2]
+            and self.finished == match.finished
+        )
+
+    @property
+    def batch_size(self):
+        return getattr(settings, 'LIVE_SCORING_BATCH_SIZE', 5)
+
+    @property
+    def flush_seconds(self):
+        return getattr(settings, 'LIVE_SCORING_FLUSH_SECONDS', 10)
+
+    def _load_game(self, game):
+        """Восстанавливает текущую партию из БД (или сбрасывает, если партии нет)."""
+        self.game_id = game.pk if game else None
+        self.first_server = game.first_server if game else 1
+        # Очки партии по порядку: (номер игрока 1/2, order)
+        self.points = []
+        self.pending = []
+        self.last_flush = time.monotonic()
+        if game:
+            slot_by_player = {self.player_ids[0]: 1, self.player_ids[1]: 2}
+            for scored_by, order in game.points.order_by('order').values_list('scored_by_id', 'order'):
+                self.points.append((slot_by_player.get(scored_by, 1), order))
+
+    @property
+    def score(self):
+        s1 = sum(1 for slot, _ in self.points if slot == 1)
+        return [s1, len(self.points) - s1]
+
+    def _response(self, **extra):
+        data = {
+            'success': False,
+            'message': '',
+            'message_type': 'info',
+            'match_finished': False,
+            'set_finished': False,
+            'current_game': self.game_id is not None,
+            'score': self.score if self.game_id else [0, 0],
+            'sets': {'p1': self.sets[0], 'p2': self.sets[1]},
+            'player1_name': self.player_names[0],
+            'player2_name': self.player_names[1],
+            'first_server': self.first_server,
+        }
+        data.update(extra)
+        return data
+
+    # ------------------ Запись в БД ------------------
+
+    def _progress(self):
+        return self.last_seq, list(self.recent_batches)
+
+    def flush(self):
+        """Записывает ожидающие очки одним INSERT, обновляет счет партии и прогресс судьи."""
+        with self.lock:
+            self.last_flush = time.monotonic()
+            progress = self._progress()
+            if not self.pending and progress == self._saved_progress:
+                return
+            pending, self.pending = self.pending, []
+            added = [sum(1 for slot, _ in pending if slot == s) for s in (1, 2)]
+            with transaction.atomic():
+                if pending:
+                    Point.objects.bulk_create([
+                        Point(game_id=self.game_id, scored_by_id=self.player_ids[slot - 1], order=order)
+                        for slot, order in pending
+                    ])
+                    # bulk_create не отправляет сигналы — сдвигаем счетчики партии и статистики вручную
+                    Game.shift_score(self.game_id, *added)
+                    for player_id, count in zip(self.player_ids, added):
+                        if count:
+                            stats.add_scored_points(player_id, count)
+                            caching.bump('player', player_id)
+                if progress != self._saved_progress:
+                    Match.objects.filter(pk=self.match_id).update(live_seq=progress[0], live_batch_keys=progress[1])
+            self._saved_progress = progress
+
+    def _maybe_flush(self):
+        if len(self.pending) >= self.batch_size or time.monotonic() - self.last_flush >= self.flush_seconds:
+            self.flush()
+
+    # ------------------ Действия судьи ------------------
+
+    def apply(self, action, first_server=1):
+        """Применяет действие судьи и возвращает ответ в формате play_match_live."""
+        with self.lock:
+            if self.finished:
+                return self._response()
+            if action in ('start_set', 'new_set'):
+                return self.start_game(first_server)
+            if action in ('p1', 'p2'):
+                return self.add_point(1 if action == 'p1' else 2)
+            if action in ('undo_p1', 'undo_p2'):
+                return self.undo_point(1 if action == 'undo_p1' else 2)
+            return self._response()
+
+    def compact_state(self):
+        """Сжатое состояние для JSON API: только то, что меняется от очка к очку."""
+        return {
+            'seq': self.last_seq,
+            'score': self.score if self.game_id else [0, 0],
+            'sets': list(self.sets),
+            'game': self.game_id is not None,
+            'server': self.first_server,
+            'finished': self.finished,
+        }
+
+    def score_event(self):
+        """Счет для рассылки зрителям матча и турнира."""
+        return {'match_id': self.match_id, 'players': list(self.player_ids), **self.compact_state()}
+
+    def apply_batch(self, actions, key=None, first_server=1):
+        """Применяет упорядоченный пакет действий [{'seq': n, 'action': ...}].
+
+        Действия с seq не больше уже примененного пропускаются, а повтор пакета
+        с тем же ключом возвращает сохраненный ответ — повторная отправка после
+        обрыва связи не засчитывает очки дважды. Если ключ восстановлен из БД
+        после перезапуска, вместо ответа возвращается текущее состояние.
+        """
+        with self.lock:
+            if key and key in self.recent_batches:
+                data = self.recent_batches[key]
+                return data if data is not None else dict(self.compact_state(), applied=0, set_finished=False)
+            applied = 0
+            game_changed = False
+            for item in actions:
+                seq = item.get('seq')
+                if seq is not None and seq <= self.last_seq:
+                    continue
+                if seq is not None:
+                    # Номер занимается до применения: если действие запишет очки в БД,
+                    # в той же транзакции сохранится и он
+                    self.last_seq = seq
+                result = self.apply(item['action'], first_server=item.get('first_server', first_server))
+                if result['success']:
+                    applied += 1
+                game_changed = game_changed or result['set_finished']
+            data = self.compact_state()
+            data.update(applied=applied, set_finished=game_changed)
+            if key:
+                self.recent_batches[key] = data
+                while len(self.recent_batches) > IDEMPOTENCY_KEYS_LIMIT:
+                    self.recent_batches.popitem(last=False)
+            return data
+
+    def start_game(self, first_server=1):
+        with self.lock:
+            if self.game_id is not None or self.finished:
+                return self._response()
+            first_server = 2 if str(first_server) == '2' else 1
+            game = Game.objects.create(match_id=self.match_id, start_time=timezone.now(), first_server=first_server)
+            self._load_game(game)
+            return self._response(
+                success=True,
+                message='Новая партия начата!',
+                set_finished=True,  # Чтобы обновить страницу
+            )
+
+    def add_point(self, slot):
+        with self.lock:
+            if self.game_id is None or self.finished:
+                return self._response()
+            order = (self.points[-1][1] if self.points else 0) + 1
+            self.points.append((slot, order))
+            self.pending.append((slot, order))
+            s1, s2 = self.score
+            if game_finished(s1, s2):
+                return self._finish_game(s1, s2)
+            self._maybe_flush()
+            return self._response(success=True, message=f'Очко для {self.player_names[slot - 1]}!')
+
+    def undo_point(self, slot):
+        with self.lock:
+            name = self.player_names[slot - 1]
+            if self.game_id is None or self.finished:
+                return self._response()
+            index = next((i for i in range(len(self.points) - 1, -1, -1) if self.points[i][0] == slot), None)
+            if index is None:
+                return self._response(message=f'Нет очков для отмены у {name}', message_type='error')
+            point = self.points.pop(index)
+            if point in self.pending:
+                self.pending.remove(point)
+            else:
+                with transaction.atomic():
+                    self.flush()
+                    # Счетчики партии и статистики уменьшаются сигналом удаления очка
+                    Point.objects.filter(game_id=self.game_id, order=point[1]).delete()
+            return self._response(success=True, message=f'Очко отменено для {name}')
+
+    def _finish_game(self, s1, s2):
+        winner_slot = 1 if s1 > s2 else 2
+        with transaction.atomic():
+            self.flush()
+            Game.objects.filter(pk=self.game_id).update(end_time=timezone.now())
+            self.sets[winner_slot - 1] += 1
+            match = Match.objects.select_related('tournament', 'player1', 'player2').get(pk=self.match_id)
+            match.sets_player1, match.sets_player2 = self.sets
+            match.save(update_fields=['sets_player1', 'sets_player2'])
+
+            winner_name = self.player_names[winner_slot - 1]
+            won, lost = (s1, s2) if winner_slot == 1 else (s2, s1)
+            data = self._response(
+                success=True,
+                score=[s1, s2],
+                message=f'Партия завершена! Победитель: {winner_name} ({won}:{lost})',
+                message_type='success',
+                set_finished=True,
+            )
+            # Проверка победы в матче (до 2 выигранных партий)
+            if self.sets[winner_slot - 1] == SETS_TO_WIN:
+                match.set_winner(match.player1 if winner_slot == 1 else match.player2)
+                match.finished = True
+                match.save(update_fields=['finished'])
+                self.finished = True
+                data['message'] = f'Матч завершен! Победитель: {winner_name} (2:{self.sets[2 - winner_slot]})'
+                data['match_finished'] = True
+                discard(self.match_id)
+            else:
+                # Матч продолжается, партия завершена
+                self._load_game(None)
+                data['current_game'] = False
+        return data
+
+
+_registry = {}
+_registry_lock = threading.Lock()
+
+
+def get_live_match(match):
+    """LiveMatch для матча; при первом обращении состояние загружается из БД.
+
+    Сеты и состав пишутся в БД сразу, поэтому расхождение с загруженным матчем
+    (правка через админку) означает устаревшее состояние — оно перечитывается.
+    """
+    with _registry_lock:
+        live = _registry.get(match.pk)
+        if live is not None and not live.matches(match):
+            live.flush()
+            live = None
+        if live is None:
+            live = _registry[match.pk] = LiveMatch(match)
+        return live
+
+
+def score_message(score):
+    """Событие группы со счетом, сериализованным один раз на рассылку."""
+    return {'type': 'match_score', 'text': json.dumps({'type': 'match_score', **score})}
+
+
+def broadcast(live):
+    """Рассылает счет группам матча и турнира из синхронного кода (HTTP-представления)."""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+    event = score_message(live.score_event())
+    for group in (match_group(live.match_id), tournament_group(live.tournament_id)):
+        async_to_sync(layer.group_send)(group, event)
+
+
+def discard(match_id):
+    with _registry_lock:
+        _registry.pop(match_id, None)
+
+
+def reset():
+    """Забывает все состояния без записи в БД (для тестов)."""
+    with _registry_lock:
+        _registry.clear()
+
+
+def flush_all():
+    """Записывает ожидающие очки всех матчей (например, при остановке процесса)."""
+    with _registry_lock:
+        matches = list(_registry.values())
+    for live in matches:
+        try:
+            live.flush()
+        except Exception:
+            logger.exception('Не удалось записать очки матча %s', live.match_id)
+
+
+atexit.register(flush_all)
@@ -0,0 +1,104 @@
+import asyncio
+import multiprocessing
+import statistics
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+MESSAGE_TYPE = 'bench.message'
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+def _worker(group, messages, timeout, ready, results):
+    """Процесс-подписчик: отдельный экземпляр слоя, как у отдельного воркера daphne."""
+    import django
+    django.setup()
+    from channels.layers import get_channel_layer
+
+    async def run():
+        layer = get_channel_layer()
+        channel = await layer.new_channel()
+        await layer.group_add(group, channel)
+        ready.set()
+        latencies = []
+        try:
+            while len(latencies) < messages:
+                message = await asyncio.wait_for(layer.receive(channel), timeout)
+                if message.get('type') == MESSAGE_TYPE:
+                    latencies.append((time.time() - message['sent']) * 1000)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            await layer.group_discard(group, channel)
+        return latencies
+
+    results.put(asyncio.run(run()))
+
+
+class Command(BaseCommand):
+    help = 'Замеряет задержку group_send между процессами через настроенный channel layer (нужен CHANNEL_REDIS_URL)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=4, help='Число процессов-подписчиков')
+        parser.add_argument('--messages', type=int, default=200, help='Сколько сообщений разослать')
+        parser.add_argument('--interval', type=float, default=5, help='Пауза между сообщениями, мс')
+        parser.add_argument('--group', default='friendly_game_bench', help='Имя группы')
+        parser.add_argument('--timeout', type=float, default=5, help='Сколько ждать очередное сообщение, с')
+
+    def handle(self, *args, **options):
+        backend = settings.CHANNEL_LAYERS['default']['BACKEND']
+        if backend.endswith('InMemoryChannelLayer'):
+            raise CommandError('InMemoryChannelLayer не делит группы между процессами — задайте CHANNEL_REDIS_URL')
+
+        workers, messages = options['workers'], options['messages']
+        ctx = multiprocessing.get_context('spawn')
+        results = ctx.Queue()
+        ready = [ctx.Event() for _ in range(workers)]
+        processes = [
+            ctx.Process(target=_worker, args=(options['group'], messages, options['timeout'], event, results))
+            for event in ready
+        ]
+        for process in processes:
+            process.start()
+        for event in ready:
+            if not event.wait(60):
+                for process in processes:
+                    process.terminate()
+                raise CommandError('Процессы-подписчики не запустились')
+
+        from channels.layers import get_channel_layer
+
+        async def send_all():
+            layer = get_channel_layer()
+            started = time.perf_counter()
+            for seq in range(messages):
+                await layer.group_send(options['group'], {'type': MESSAGE_TYPE, 'seq': seq, 'sent': time.time()})
+                await asyncio.sleep(options['interval'] / 1000)
+            return time.perf_counter() - started
+
+        elapsed = asyncio.run(send_all())
+        per_worker = [results.get(timeout=options['timeout'] * 2 + 60) for _ in processes]
+        for process in processes:
+            process.join()
+
+        latencies = [value for worker in per_worker for value in worker]
+        expected = workers * messages
+        self.stdout.write(f'Слой: {backend}')
+        self.stdout.write(f'Процессов: {workers}, сообщений: {messages}, отправка заняла {elapsed:.2f} с')
+        self.stdout.write(f'Доставлено: {len(latencies)} из {expected} ({", ".join(str(len(w)) for w in per_worker)})')
+        if latencies:
+            self.stdout.write(
+                f'Задержка, мс: p50={statistics.median(latencies):.2f} '
+                f'p95={_percentile(latencies, 95):.2f} p99={_percentile(latencies, 99):.2f} max={max(latencies):.2f}'
+            )
+        if len(latencies) < expected:
+            self.stdout.write(self.style.WARNING('Часть сообщений не доставлена (переполнение очереди или таймаут)'))
+        else:
+            self.stdout.write(self.style.SUCCESS('Все сообщения доставлены во все процессы.'))
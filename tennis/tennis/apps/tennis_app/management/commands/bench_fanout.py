@@ -0,0 +1,328 @@
+import asyncio
+import json
+import resource
+import statistics
+import time
+from datetime import date
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.test.utils import override_settings
+
+from .bench_channel_layer import _percentile
+
+# Синтетические клубы бенчмарка, чтобы не смешивать снимки с настоящими играми
+CLUB_ID_BASE = 900000
+
+
+def _rss_mb():
+    """Текущий RSS процесса (Linux), иначе пиковый."""
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmRSS:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    return round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1)
+
+
+def _summary(values, percentiles=(50, 95, 99)):
+    data = {f'p{pct}': round(statistics.median(values) if pct == 50 else _percentile(values, pct), 2)
+            for pct in percentiles} if values else {f'p{pct}': 0.0 for pct in percentiles}
+    data['max'] = round(max(values), 2) if values else 0.0
+    return data
+
+
+def _parse_message(text, protocol):
+    """(вид, счет первого игрока) из сообщения зрителю: вид 'update', 'end' или None."""
+    message = json.loads(text)
+    if protocol == 2:
+        if not isinstance(message, list):
+            return None, None
+        if message[0] == 'f':
+            return 'update', message[3].get('score1')
+        if message[0] == 'u':
+            return 'update', message[3]
+        return ('end', None) if message[0] == 'e' else (None, None)
+    if message.get('type') == 'game_update':
+        return 'update', message['game_data'].get('score1')
+    return ('end', None) if message.get('type') == 'game_end' else (None, None)
+
+
+async def _connect(application, path, timeout, user=None, snapshot=True):
+    """(сокет, мс до подключения); snapshot — дождаться первого кадра со снимком."""
+    from channels.testing import WebsocketCommunicator
+
+    communicator = WebsocketCommunicator(application, path)
+    if user is not None:
+        communicator.scope['user'] = user
+    started = time.perf_counter()
+    connected, _ = await communicator.connect(timeout=timeout)
+    if not connected:
+        raise CommandError(f'Сокет {path} не подключился')
+    if snapshot:
+        await communicator.receive_from(timeout)
+    return communicator, (time.perf_counter() - started) * 1000
+
+
+def _match_fixtures(count):
+    """Клубы с турниром, матчем и администратором-судьей для прогона MatchConsumer.
+
+    Вызывается внутри транзакции, которая затем откатывается. Возвращает
+    (судья, [(id матча, id турнира)]).
+    """
+    from django.contrib.auth.models import User
+    from ...models import Club, ClubAdmin, Match, Player, Tournament
+
+    referee = User.objects.create_user(username='bench_fanout_referee')
+    matches = []
+    for i in range(count):
+        club = Club.objects.create(name=f'bench_fanout {i}')
+        ClubAdmin.objects.create(user=referee, club=club)
+        player1, player2 = (Player.objects.create(full_name=f'Игрок {n}', club=club) for n in (1, 2))
+        tournament = Tournament.objects.create(club=club, name='bench_fanout', start_date=date.today())
+        match = Match.objects.create(tournament=tournament, player1=player1, player2=player2)
+        matches.append((match.id, tournament.id))
+    return referee, matches
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный тест рассылки живого счета: N сокетов-зрителей FriendlyGameConsumer, MatchConsumer '
+            'или TournamentConsumer в нескольких клубах, поток счета от судьи; результат — JSON')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consumer', choices=('friendly', 'match', 'tournament'), default='friendly',
+                            help='Кого слушают зрители: товарищеские клуба, матч или турнир '
+                                 '(в двух последних счет ведет судья через MatchConsumer)')
+        parser.add_argument('--sizes', default='10,100,1000', help='Число сокетов-зрителей в прогонах, через запятую')
+        parser.add_argument('--clubs', type=int, default=4, help='Между сколькими клубами делятся зрители')
+        parser.add_argument('--points', type=int, default=50, help='Очков в партии каждого клуба')
+        parser.add_argument('--interval', type=float, default=20, help='Пауза между очками, мс')
+        parser.add_argument('--protocol', type=int, choices=(1, 2), default=2,
+                            help='Версия протокола зрителей (2 — как у страницы клуба)')
+        parser.add_argument('--tick', type=float, default=None,
+                            help='FRIENDLY_BROADCAST_TICK на время прогона (по умолчанию — из настроек)')
+        parser.add_argument('--timeout', type=float, default=10, help='Ожидание подключения и сообщений, с')
+        parser.add_argument('--output', help='Записать JSON в файл вместо вывода')
+
+    def handle(self, *args, **options):
+        try:
+            sizes = [int(size) for size in options['sizes'].split(',') if size.strip()]
+        except ValueError:
+            raise CommandError('--sizes: ожидаются целые числа через запятую')
+        if not sizes or min(sizes) < 1 or options['clubs'] < 1 or options['points'] < 1:
+            raise CommandError('Размеры, число клубов и очков должны быть положительными')
+
+        from ... import consumers
+        tick = {} if options['tick'] is None else {'FRIENDLY_BROADCAST_TICK': options['tick']}
+        counters_before = consumers.fanout_counters.copy()
+        with override_settings(**tick):
+            if options['consumer'] == 'friendly':
+                results = [asyncio.run(self.run_size(size, options)) for size in sizes]
+            else:
+                results = [self.run_match_size(size, options) for size in sizes]
+
+        report = {
+            'consumer': options['consumer'],
+            'layer': settings.CHANNEL_LAYERS['default']['BACKEND'],
+            'protocol': options['protocol'],
+            'clubs': options['clubs'],
+            'points': options['points'],
+            'interval_ms': options['interval'],
+            'tick': consumers.broadcast_tick() if options['tick'] is None else options['tick'],
+            'results': results,
+            'fanout_counters': dict(consumers.fanout_counters - counters_before),
+        }
+        text = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                output.write(text + '\n')
+            self.stdout.write(self.style.SUCCESS(f'Результат записан в {options["output"]}'))
+        else:
+            self.stdout.write(text)
+
+    async def run_size(self, size, options):
+        from channels.routing import URLRouter
+        from ...routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+        protocol, timeout, points = options['protocol'], options['timeout'], options['points']
+        clubs = [CLUB_ID_BASE + i for i in range(min(options['clubs'], size))]
+        query = '?v=2' if protocol == 2 else ''
+        rss_before = _rss_mb()
+
+        def connect(path):
+            return _connect(application, path, timeout)
+
+        spectator_clubs = [clubs[i % len(clubs)] for i in range(size)]
+        connect_started = time.perf_counter()
+        connected = await asyncio.gather(*(
+            connect(f'/ws/friendly_game/{club_id}/{query}') for club_id in spectator_clubs
+        ))
+        spectators = [communicator for communicator, _ in connected]
+        connect_ms = [duration for _, duration in connected]
+        connect_wall = (time.perf_counter() - connect_started) * 1000
+        scorers = [communicator for communicator, _ in await asyncio.gather(*(
+            connect(f'/ws/friendly_game/{club_id}/') for club_id in clubs
+        ))]
+        rss_connected = _rss_mb()
+
+        # Время отправки каждого очка: {клуб: {счет: perf_counter}}
+        sent = {club_id: {} for club_id in clubs}
+        latencies = []
+
+        async def read(communicator, club_id, measure=True):
+            delivered = 0
+            while True:
+                kind, score = _parse_message(await communicator.receive_from(timeout), 2 if measure and protocol == 2 else 1)
+                if kind == 'end':
+                    return delivered
+                if kind == 'update' and measure and score in sent[club_id]:
+                    latencies.append((time.perf_counter() - sent[club_id][score]) * 1000)
+                    delivered += 1
+
+        async def score_game(communicator, club_id):
+            game = {'game_id': f'bench-{size}-{club_id}', 'game_type': 'single',
+                    'player1': 'Игрок 1', 'player2': 'Игрок 2', 'score2': 0, 'server': 1}
+            for score in range(1, points + 1):
+                sent[club_id][score] = time.perf_counter()
+                await communicator.send_json_to({'type': 'game_update', 'game_data': {**game, 'score1': score}})
+                await asyncio.sleep(options['interval'] / 1000)
+            await communicator.send_json_to({'type': 'game_end', 'game_data': {**game, 'score1': points, 'winner': 'Игрок 1'}})
+
+        readers = [asyncio.ensure_future(read(communicator, club_id))
+                   for communicator, club_id in zip(spectators, spectator_clubs)]
+        readers += [asyncio.ensure_future(read(communicator, club_id, measure=False))
+                    for communicator, club_id in zip(scorers, clubs)]
+        started = time.perf_counter()
+        await asyncio.gather(*(score_game(communicator, club_id) for communicator, club_id in zip(scorers, clubs)))
+        delivered = sum((await asyncio.gather(*readers))[:size])
+        elapsed = time.perf_counter() - started
+        rss_peak = _rss_mb()
+
+        await asyncio.gather(*(communicator.disconnect(timeout=timeout) for communicator in spectators + scorers))
+        return {
+            'sockets': size,
+            'connect_ms': {**_summary(connect_ms, (50, 95)), 'all_sockets': round(connect_wall, 2)},
+            'latency_ms': _summary(latencies),
+            'updates_sent': points * len(clubs),
+            'delivered': delivered,
+            'expected': points * size,
+            'seconds': round(elapsed, 3),
+            'messages_per_sec': round(delivered / elapsed, 1) if elapsed else 0.0,
+            'rss_mb': {'before': rss_before, 'connected': rss_connected, 'after_stream': rss_peak},
+        }
+
+    def run_match_size(self, size, options):
+        """Прогон MatchConsumer: судьи ведут матчи, зрители слушают матч или турнир.
+
+        Матчи создаются в транзакции и откатываются вместе с записанными очками.
+        async_to_sync выполняет обращения потребителей к БД в этом же потоке —
+        внутри транзакции.
+        """
+        from ... import live
+
+        # database_sync_to_async закрывает соединение вне режима autocommit —
+        # внутри транзакции это оборвало бы ее, поэтому на прогон закрытие отключено
+        try:
+            with transaction.atomic(), mock.patch('channels.db.close_old_connections', lambda: None):
+                referee, matches = _match_fixtures(min(options['clubs'], size))
+                result = async_to_sync(self.stream_match_scores)(size, options, referee, matches)
+                transaction.set_rollback(True)
+        finally:
+            live.reset()  # состояния откаченных матчей не должны записываться при выходе
+        return result
+
+    async def stream_match_scores(self, size, options, referee, matches):
+        from channels.routing import URLRouter
+        from django.contrib.auth.models import AnonymousUser
+        from ...routing import websocket_urlpatterns
+
+        application = URLRouter(websocket_urlpatterns)
+        timeout, points = options['timeout'], options['points']
+        rss_before = _rss_mb()
+
+        # Зрители делятся между матчами; у каждого матча свой турнир
+        listened = [matches[i % len(matches)] for i in range(size)]
+        if options['consumer'] == 'match':
+            paths = [f'/ws/match/{match_id}/' for match_id, _ in listened]
+        else:
+            paths = [f'/ws/tournament/{tournament_id}/' for _, tournament_id in listened]
+        connect_started = time.perf_counter()
+        connected = await asyncio.gather(*(
+            _connect(application, path, timeout, AnonymousUser(), snapshot=False) for path in paths
+        ))
+        spectators = [communicator for communicator, _ in connected]
+        connect_ms = [duration for _, duration in connected]
+        connect_wall = (time.perf_counter() - connect_started) * 1000
+        referees = [communicator for communicator, _ in await asyncio.gather(*(
+            _connect(application, f'/ws/match/{match_id}/', timeout, referee, snapshot=False)
+            for match_id, _ in matches
+        ))]
+        rss_connected = _rss_mb()
+
+        # Номер последнего действия: start_set и points очков; очки чередуются,
+        # поэтому партия не заканчивается и каждое очко — отдельная рассылка
+        last_seq = points + 1
+        sent = {match_id: {} for match_id, _ in matches}
+        latencies = []
+
+        async def read(communicator, match_id):
+            frames = 0
+            while True:
+                # Считаются все кадры счета: лишние (чужие матчи, дубли) превысят expected
+                message = json.loads(await communicator.receive_from(timeout))
+                if message.get('type') != 'match_score':
+                    continue
+                frames += 1
+                if message['match_id'] != match_id:
+                    continue
+                seq = message['seq']
+                latencies.append((time.perf_counter() - sent[match_id][seq]) * 1000)
+                if seq == last_seq:
+                    return frames
+
+        async def score_match(communicator, match_id):
+            for seq in range(1, last_seq + 1):
+                action = 'start_set' if seq == 1 else ('p1' if seq % 2 else 'p2')
+                sent[match_id][seq] = time.perf_counter()
+                await communicator.send_json_to({'type': 'score', 'key': f'bench-{seq}',
+                                                 'actions': [{'seq': seq, 'action': action}]})
+                await asyncio.sleep(options['interval'] / 1000)
+
+        async def drain(communicator):
+            # Судья получает ответы и собственную рассылку; они не меряются
+            while True:
+                try:
+                    await communicator.receive_from(timeout)
+                except asyncio.TimeoutError:
+                    return
+
+        readers = [asyncio.ensure_future(read(communicator, match_id))
+                   for communicator, (match_id, _) in zip(spectators, listened)]
+        drains = [asyncio.ensure_future(drain(communicator)) for communicator in referees]
+        started = time.perf_counter()
+        await asyncio.gather(*(score_match(communicator, match_id)
+                               for communicator, (match_id, _) in zip(referees, matches)))
+        delivered = sum(await asyncio.gather(*readers))
+        elapsed = time.perf_counter() - started
+        rss_peak = _rss_mb()
+        for task in drains:
+            task.cancel()
+
+        await asyncio.gather(*(communicator.disconnect(timeout=timeout) for communicator in spectators + referees))
+        return {
+            'sockets': size,
+            'connect_ms': {**_summary(connect_ms, (50, 95)), 'all_sockets': round(connect_wall, 2)},
+            'latency_ms': _summary(latencies),
+            'updates_sent': last_seq * len(matches),
+            'delivered': delivered,
+            'expected': last_seq * size,
+            'seconds': round(elapsed, 3),
+            'messages_per_sec': round(delivered / elapsed, 1) if elapsed else 0.0,
+            'rss_mb': {'before': rss_before, 'connected': rss_connected, 'after_stream': rss_peak},
+        }
@@ -0,0 +1,59 @@
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import CaptureQueriesContext
+
+from ...models import Club, Player, Tournament, TournamentParticipant
+
+
+class Command(BaseCommand):
+    help = ('Замеряет Tournament.generate_matches на больших турнирах (круговой и олимпийка). '
+            'Данные создаются во временной транзакции и откатываются')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--round-robin', type=int, default=200, help='Участников кругового турнира')
+        parser.add_argument('--elimination', type=int, default=512, help='Участников олимпийки')
+        parser.add_argument('--repeat', type=int, default=3, help='Сколько прогонов каждого типа (выводится лучший)')
+        parser.add_argument('--max-ms', type=float, default=1000,
+                            help='Предел лучшего прогона в мс; при превышении команда завершается ошибкой')
+
+    def handle(self, *args, **options):
+        if options['round_robin'] < 2 or options['elimination'] < 2 or options['repeat'] < 1:
+            raise CommandError('Нужно не меньше двух участников и одного прогона')
+        slow = []
+        for tournament_type, count in ((Tournament.ROUND_ROBIN, options['round_robin']),
+                                       (Tournament.ELIMINATION, options['elimination'])):
+            runs = [self.run(tournament_type, count) for _ in range(options['repeat'])]
+            seconds, queries, matches = min(runs)
+            self.stdout.write(
+                f'{dict(Tournament.TOURNAMENT_TYPES)[tournament_type]}: {count} участников, {matches} матчей, '
+                f'{seconds * 1000:.1f} мс, запросов: {queries}'
+            )
+            if seconds * 1000 > options['max_ms']:
+                slow.append(dict(Tournament.TOURNAMENT_TYPES)[tournament_type])
+        if slow:
+            raise CommandError(f"Медленнее {options['max_ms']:.0f} мс: {', '.join(slow)}")
+
+    def run(self, tournament_type, count):
+        """(секунды, число запросов, число матчей) одного прогона; все изменения откатываются."""
+        with transaction.atomic():
+            club = Club.objects.create(name='bench_generate_matches')
+            players = Player.objects.bulk_create(
+                [Player(full_name=f'Игрок {i}', club=club) for i in range(count)], batch_size=500,
+            )
+            tournament = Tournament.objects.create(
+                club=club, name='bench', start_date=date.today(), tournament_type=tournament_type,
+            )
+            TournamentParticipant.objects.bulk_create(
+                [TournamentParticipant(tournament=tournament, player=player, seed=i) for i, player in enumerate(players)],
+                batch_size=500,
+            )
+            with CaptureQueriesContext(connection) as queries:
+                started = time.perf_counter()
+                tournament.generate_matches()
+                seconds = time.perf_counter() - started
+            matches = tournament.matches.count()
+            transaction.set_rollback(True)
+        return seconds, len(queries), matches
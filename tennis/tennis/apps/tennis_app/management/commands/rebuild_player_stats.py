@@ -0,0 +1,21 @@
+from django.core.management.base import BaseCommand, CommandError
+from tennis_app import stats
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает PlayerStats / PlayerMonthlyStats с нуля или сверяет их с живым расчетом (--check)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--check', action='store_true', help='Только сравнить агрегаты с живым расчетом')
+
+    def handle(self, *args, **options):
+        if options['check']:
+            problems = stats.check_consistency()
+            for problem in problems:
+                self.stdout.write(self.style.WARNING(problem))
+            if problems:
+                raise CommandError(f'Найдено расхождений: {len(problems)}')
+            self.stdout.write(self.style.SUCCESS('Агрегаты совпадают с живым расчетом.'))
+            return
+        stats.rebuild_all()
+        self.stdout.write(self.style.SUCCESS('Статистика игроков пересобрана.'))
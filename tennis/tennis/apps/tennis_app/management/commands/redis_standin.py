@@ -0,0 +1,47 @@
+import threading
+
+from django.core.management.base import BaseCommand, CommandError
+
+try:
+    import lupa  # noqa: F401 — Lua-скрипты channels_redis
+    from fakeredis import TcpFakeServer
+except ImportError:  # fakeredis[lua] нужен только для проверки без настоящего Redis
+    TcpFakeServer = None
+
+
+def start(host='127.0.0.1', port=0):
+    """Запускает заменитель Redis в фоновом потоке; возвращает (URL, сервер).
+
+    Протокол и Lua-скрипты (нужны channels_redis) обслуживает fakeredis, поэтому
+    воркеры-процессы подключаются к нему как к обычному Redis. port=0 — любой
+    свободный порт. Остановка — server.shutdown().
+    """
+    if TcpFakeServer is None:
+        raise RuntimeError('Нужен пакет fakeredis[lua]')
+    server = TcpFakeServer((host, port), server_type='redis')
+    # Соединения воркеров не должны держать процесс после остановки сервера
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f'redis://{host}:{server.server_address[1]}/0', server
+
+
+class Command(BaseCommand):
+    help = ('Локальный заменитель Redis (fakeredis) для проверки нескольких воркеров без установленного Redis. '
+            'Данные только в памяти; не для продакшена')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1')
+        parser.add_argument('--port', type=int, default=6379)
+
+    def handle(self, *args, **options):
+        try:
+            url, server = start(options['host'], options['port'])
+        except (RuntimeError, OSError) as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f'Заменитель Redis слушает {url} (Ctrl+C — остановить)')
+        try:
+            threading.Event().wait()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
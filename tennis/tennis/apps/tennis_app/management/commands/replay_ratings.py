@@ -0,0 +1,46 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from tennis_app import ratings
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает рейтинги Эло всех игроков по полной истории результатов '
+            '(например, после смены RATING_K_FACTOR или исправления старых результатов)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--k', type=float, default=None, help='K-фактор (по умолчанию RATING_K_FACTOR)')
+        parser.add_argument('--dry-run', action='store_true', help='Только посчитать, ничего не записывая')
+        parser.add_argument('--benchmark', type=int, metavar='N',
+                            help='Не трогать БД: замерить пересчет N синтетических игр в памяти')
+
+    def handle(self, *args, **options):
+        k = options['k']
+        if k is not None and k <= 0:
+            raise CommandError('K-фактор должен быть положительным')
+        if options['benchmark']:
+            self.benchmark(options['benchmark'], ratings.k_factor() if k is None else k)
+            return
+        result = ratings.replay(k=k, dry_run=options['dry_run'])
+        verb = 'изменились бы' if options['dry_run'] else 'изменены'
+        self.stdout.write(self.style.SUCCESS(
+            f'Результатов: {result["results"]}, игроков: {result["players"]}, '
+            f'рейтинги {verb} у {result["changed"]}, {result["seconds"]} с'
+        ))
+
+    def benchmark(self, count, k, players=10000):
+        rng = random.Random(1)
+        results = []
+        for when in range(count):
+            if rng.random() < 0.8:
+                a, b = rng.sample(range(players), 2)
+                results.append((when, (a,), (b,)))
+            else:
+                a1, a2, b1, b2 = rng.sample(range(players), 4)
+                results.append((when, (a1, a2), (b1, b2)))
+        started = time.perf_counter()
+        ratings.replay_results(results, {}, k, history={})
+        seconds = time.perf_counter() - started
+        self.stdout.write(f'{count} игр ({players} игроков): {seconds:.2f} с, {count / seconds:,.0f} игр/с')
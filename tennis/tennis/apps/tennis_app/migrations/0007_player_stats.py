@@ -0,0 +1,57 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0006_add_score_and_referee_to_friendly'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerStats',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats_row', serialize=False, to='tennis_app.player', verbose_name='Игрок')),
+                ('matches', models.PositiveIntegerField(default=0, verbose_name='Матчи')),
+                ('match_wins', models.PositiveIntegerField(default=0, verbose_name='Победы в матчах')),
+                ('match_losses', models.PositiveIntegerField(default=0, verbose_name='Поражения в матчах')),
+                ('friendlies_single', models.PositiveIntegerField(default=0, verbose_name='Одиночные товарищеские')),
+                ('single_wins', models.PositiveIntegerField(default=0, verbose_name='Победы в одиночных')),
+                ('single_losses', models.PositiveIntegerField(default=0, verbose_name='Поражения в одиночных')),
+                ('friendlies_double', models.PositiveIntegerField(default=0, verbose_name='Парные товарищеские')),
+                ('double_wins', models.PositiveIntegerField(default=0, verbose_name='Победы в парных')),
+                ('double_losses', models.PositiveIntegerField(default=0, verbose_name='Поражения в парных')),
+                ('parties', models.PositiveIntegerField(default=0, verbose_name='Партии (без парных)')),
+                ('parties_with_doubles', models.PositiveIntegerField(default=0, verbose_name='Партии (с парными)')),
+                ('scored_points', models.PositiveIntegerField(default=0, verbose_name='Набранные очки')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+            ],
+            options={
+                'verbose_name': 'Статистика игрока',
+                'verbose_name_plural': 'Статистика игроков',
+            },
+        ),
+        migrations.CreateModel(
+            name='PlayerMonthlyStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveSmallIntegerField(verbose_name='Год')),
+                ('month', models.PositiveSmallIntegerField(verbose_name='Месяц')),
+                ('single_games', models.PositiveIntegerField(default=0, verbose_name='Игры')),
+                ('single_wins', models.PositiveIntegerField(default=0, verbose_name='Победы')),
+                ('single_losses', models.PositiveIntegerField(default=0, verbose_name='Поражения')),
+                ('double_games', models.PositiveIntegerField(default=0, verbose_name='Парные игры')),
+                ('double_wins', models.PositiveIntegerField(default=0, verbose_name='Победы в парных')),
+                ('double_losses', models.PositiveIntegerField(default=0, verbose_name='Поражения в парных')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='monthly_stats_rows', to='tennis_app.player', verbose_name='Игрок')),
+            ],
+            options={
+                'verbose_name': 'Статистика игрока за месяц',
+                'verbose_name_plural': 'Статистика игроков по месяцам',
+                'unique_together': {('player', 'year', 'month')},
+            },
+        ),
+    ]
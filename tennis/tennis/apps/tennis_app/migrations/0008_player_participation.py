@@ -0,0 +1,74 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:25
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_participations(apps, schema_editor):
+    """Заполняет индекс участия по существующим матчам и товарищеским играм."""
+    Match = apps.get_model('tennis_app', 'Match')
+    FriendlyGame = apps.get_model('tennis_app', 'FriendlyGame')
+    PlayerParticipation = apps.get_model('tennis_app', 'PlayerParticipation')
+
+    def won(result, mine):
+        return None if result is None else result == mine
+
+    rows = []
+    matches = Match.objects.values_list('id', 'player1_id', 'player2_id', 'winner_id', 'played_at', 'tournament__club_id')
+    for pk, p1, p2, winner, played_at, club_id in matches.iterator():
+        for team, pid in ((1, p1), (2, p2)):
+            if pid is not None and not (team == 2 and pid == p1):
+                rows.append(PlayerParticipation(
+                    player_id=pid, source_type='match', source_id=pk, game_type='single', team=team,
+                    won=won(winner, pid), played_at=played_at, club_id=club_id,
+                ))
+    friendlies = FriendlyGame.objects.values_list(
+        'id', 'game_type', 'player1_id', 'player2_id', 'winner_id', 'team1_player1_id', 'team1_player2_id',
+        'team2_player1_id', 'team2_player2_id', 'winning_team', 'played_at', 'club_id',
+    )
+    for pk, game_type, p1, p2, winner, t1p1, t1p2, t2p1, t2p2, winning_team, played_at, club_id in friendlies.iterator():
+        if game_type == 'double':
+            slots, result = ((1, t1p1), (1, t1p2), (2, t2p1), (2, t2p2)), winning_team
+        else:
+            slots, result = ((1, p1), (2, p2)), winner
+        seen = set()
+        for team, pid in slots:
+            if pid is None or pid in seen:
+                continue
+            seen.add(pid)
+            rows.append(PlayerParticipation(
+                player_id=pid, source_type='friendly', source_id=pk, game_type=game_type, team=team,
+                won=won(result, team if game_type == 'double' else pid), played_at=played_at, club_id=club_id,
+            ))
+    PlayerParticipation.objects.bulk_create(rows, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0007_player_stats'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlayerParticipation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source_type', models.CharField(choices=[('match', 'Турнирный матч'), ('friendly', 'Товарищеская игра')], max_length=10, verbose_name='Источник')),
+                ('source_id', models.BigIntegerField(verbose_name='ID игры')),
+                ('game_type', models.CharField(choices=[('single', 'Одиночная'), ('double', 'Парная')], default='single', max_length=10, verbose_name='Тип игры')),
+                ('team', models.PositiveSmallIntegerField(choices=[(1, 'Команда 1'), (2, 'Команда 2')], verbose_name='Сторона')),
+                ('won', models.BooleanField(blank=True, null=True, verbose_name='Победа')),
+                ('played_at', models.DateTimeField(verbose_name='Дата проведения')),
+                ('club', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='tennis_app.club', verbose_name='Клуб')),
+                ('player', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='participations', to='tennis_app.player', verbose_name='Игрок')),
+            ],
+            options={
+                'verbose_name': 'Участие в игре',
+                'verbose_name_plural': 'Участие в играх',
+                'indexes': [models.Index(fields=['player', 'played_at'], name='tennis_app__player__a67d17_idx')],
+                'unique_together': {('source_type', 'source_id', 'player')},
+            },
+        ),
+        migrations.RunPython(backfill_participations, migrations.RunPython.noop),
+    ]
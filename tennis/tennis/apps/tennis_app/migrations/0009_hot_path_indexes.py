@@ -0,0 +1,47 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:27
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0008_player_participation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='friendlygame',
+            index=models.Index(fields=['game_type', 'played_at'], name='tennis_app__game_ty_c1c3a0_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendlygame',
+            index=models.Index(fields=['team1_player1', 'game_type'], name='tennis_app__team1_p_17d64e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendlygame',
+            index=models.Index(fields=['team1_player2', 'game_type'], name='tennis_app__team1_p_6e9cab_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendlygame',
+            index=models.Index(fields=['team2_player1', 'game_type'], name='tennis_app__team2_p_c931b8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='friendlygame',
+            index=models.Index(fields=['team2_player2', 'game_type'], name='tennis_app__team2_p_02d0eb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='game',
+            index=models.Index(fields=['match', 'end_time', 'created_at'], name='tennis_app__match_i_68f43b_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['tournament', 'player1', 'player2'], name='tennis_app__tournam_562654_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='point',
+            index=models.Index(fields=['game', 'scored_by', 'order'], name='tennis_app__game_id_a74016_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.1.7 on 2026-10-18 17:47
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0009_hot_path_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LiveFriendlyGame',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('game_key', models.CharField(max_length=100, verbose_name='Ключ трансляции')),
+                ('game_data', models.JSONField(default=dict, verbose_name='Последнее состояние')),
+                ('started_at', models.DateTimeField(auto_now_add=True, verbose_name='Начало')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Обновлено')),
+                ('club', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='live_friendlies', to='tennis_app.club', verbose_name='Клуб')),
+                ('friendly', models.OneToOneField(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='live_source', to='tennis_app.friendlygame', verbose_name='Сохраненная игра')),
+                ('recorded_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Записал')),
+            ],
+            options={
+                'verbose_name': 'Идущая товарищеская игра',
+                'verbose_name_plural': 'Идущие товарищеские игры',
+                'unique_together': {('club', 'game_key')},
+            },
+        ),
+    ]
@@ -0,0 +1,26 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0010_live_friendly_game'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingHistory',
+            fields=[
+                ('player', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='rating_history', serialize=False, to='tennis_app.player', verbose_name='Игрок')),
+                ('times', models.BinaryField(default=bytes, verbose_name='Моменты')),
+                ('values', models.BinaryField(default=bytes, verbose_name='Рейтинги')),
+            ],
+            options={
+                'verbose_name': 'История рейтинга',
+                'verbose_name_plural': 'Истории рейтинга',
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0011_rating_history'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['rating', 'id'], name='tennis_app__rating_63d56e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['club', 'rating', 'id'], name='tennis_app__club_id_5197ef_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='player',
+            index=models.Index(fields=['dominant_hand', 'rating', 'id'], name='tennis_app__dominan_24085d_idx'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:05
+
+from django.db import migrations, models
+
+
+def backfill_decided_at(apps, schema_editor):
+    # Время прежних результатов неизвестно — берется время создания матча, как раньше в replay_ratings
+    Match = apps.get_model('tennis_app', 'Match')
+    Match.objects.filter(winner__isnull=False).update(decided_at=models.F('played_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0012_leaderboard_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='decided_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Время результата'),
+        ),
+        migrations.RunPython(backfill_decided_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.1.7 on 2026-10-18 18:54
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0013_match_decided_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='match',
+            name='live_batch_keys',
+            field=models.JSONField(blank=True, default=list, verbose_name='Недавние ключи пакетов судьи'),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='live_seq',
+            field=models.PositiveIntegerField(default=0, verbose_name='Последний номер действия судьи'),
+        ),
+    ]
@@ -0,0 +1,90 @@
+from collections import Counter, defaultdict
+
+from django.db import migrations, models
+from django.utils import timezone
+
+
+def backfill_player_stats(apps, schema_editor):
+    """Строит PlayerStats и PlayerMonthlyStats для игроков, у которых строки еще нет.
+
+    0007 создала таблицы пустыми; без заполнения первая новая игра создала бы
+    строку игрока и пересчитала только свой месяц, а прежние месяцы пропали бы.
+    Счет идет по индексу участия (заполнен в 0008) так же, как в stats.py.
+    """
+    Player = apps.get_model('tennis_app', 'Player')
+    PlayerStats = apps.get_model('tennis_app', 'PlayerStats')
+    PlayerMonthlyStats = apps.get_model('tennis_app', 'PlayerMonthlyStats')
+    PlayerParticipation = apps.get_model('tennis_app', 'PlayerParticipation')
+    Game = apps.get_model('tennis_app', 'Game')
+    Point = apps.get_model('tennis_app', 'Point')
+
+    player_ids = set(Player.objects.filter(stats_row__isnull=True).values_list('pk', flat=True))
+    if not player_ids:
+        return
+
+    counters = defaultdict(Counter)
+    monthly = defaultdict(lambda: [0] * 6)
+    for pid, source_type, game_type, won, played_at in PlayerParticipation.objects.filter(
+        player_id__in=player_ids,
+    ).values_list('player_id', 'source_type', 'game_type', 'won', 'played_at').iterator():
+        row = counters[pid]
+        if source_type == 'match':
+            prefix, total = 'match', 'matches'
+        elif game_type == 'single':
+            prefix, total = 'single', 'friendlies_single'
+        else:
+            prefix, total = 'double', 'friendlies_double'
+        row[total] += 1
+        if won:
+            row[f'{prefix}_wins'] += 1
+        elif won is False or game_type == 'single':
+            # Незавершенный матч/одиночная игра в PlayerStats — поражение, парная — нет
+            row[f'{prefix}_losses'] += 1
+
+        local = timezone.localtime(played_at)
+        offset = 3 if game_type == 'double' else 0
+        month = monthly[pid, local.year, local.month]
+        month[offset] += 1
+        month[offset + 1] += int(won is True)
+        month[offset + 2] += int(won is False)
+
+    # Партии: без парных — по полям player1/player2, с парными — еще и по слотам команд
+    games = Game.objects.values_list(
+        'match__player1_id', 'match__player2_id', 'friendly__player1_id', 'friendly__player2_id',
+        'friendly__team1_player1_id', 'friendly__team1_player2_id',
+        'friendly__team2_player1_id', 'friendly__team2_player2_id',
+    )
+    for slots in games.iterator():
+        singles = set(slots[:4]) & player_ids
+        for pid in singles:
+            counters[pid]['parties'] += 1
+        for pid in set(slots) & player_ids:
+            counters[pid]['parties_with_doubles'] += 1
+    points = Point.objects.filter(scored_by_id__in=player_ids).order_by().values('scored_by_id') \
+        .annotate(total=models.Count('pk')).values_list('scored_by_id', 'total')
+    for pid, total in points:
+        counters[pid]['scored_points'] = total
+
+    PlayerStats.objects.bulk_create(
+        [PlayerStats(player_id=pid, **counters[pid]) for pid in player_ids], batch_size=500,
+    )
+    PlayerMonthlyStats.objects.filter(player_id__in=player_ids).delete()
+    PlayerMonthlyStats.objects.bulk_create([
+        PlayerMonthlyStats(
+            player_id=pid, year=year, month=month_number,
+            single_games=values[0], single_wins=values[1], single_losses=values[2],
+            double_games=values[3], double_wins=values[4], double_losses=values[5],
+        )
+        for (pid, year, month_number), values in monthly.items()
+    ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0014_match_live_progress'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_player_stats, migrations.RunPython.noop),
+    ]
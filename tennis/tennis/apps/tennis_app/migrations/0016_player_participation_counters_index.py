@@ -0,0 +1,17 @@
+# Generated by Django 5.1.7 on 2026-10-18 19:44
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('tennis_app', '0015_backfill_player_stats'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='playerparticipation',
+            index=models.Index(fields=['player', 'source_type', 'game_type', 'won'], name='tennis_app__player__d04a14_idx'),
+        ),
+    ]
@@ -1,9 +1,34 @@
-from django.db import models
+from django.db import connection, models, transaction
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
 from django.utils import timezone
 import math, secrets
 
+from .caching import bump
+
+
+def sql_names(model, *fields):
+    """Экранированные имя таблицы и колонки полей модели для сырого SQL."""
+    quote = connection.ops.quote_name
+    return (quote(model._meta.db_table), *(quote(model._meta.get_field(name).column) for name in fields))
+
+
+def insert_from_select(model, fields, select_sql, params=()):
+    """INSERT INTO таблица модели (fields) SELECT ... одним запросом.
+
+    Для пакетов в десятки тысяч строк: строки не создаются в Python и не
+    передаются в базу по одной, как в bulk_create. Колонки select_sql идут в
+    порядке fields; остальные поля со значением по умолчанию получают его.
+    Сигналы не отправляются.
+    """
+    defaults = [f for f in model._meta.concrete_fields
+                if not f.primary_key and f.name not in fields and f.has_default()]
+    table, *columns = sql_names(model, *fields, *(f.name for f in defaults))
+    select_sql = f'SELECT s.*{", %s" * len(defaults)} FROM ({select_sql}) s'
+    params = [*(f.get_db_prep_save(f.get_default(), connection) for f in defaults), *params]
+    with connection.cursor() as cursor:
+        cursor.execute(f'INSERT INTO {table} ({", ".join(columns)}) {select_sql}', params)
+
 
 class Club(models.Model):
     name = models.CharField("Название клуба", max_length=100, unique=True)
@@ -42,6 +67,63 @@ class ClubAdmin(models.Model):
         verbose_name_plural = "Администраторы клуба"
 
 
+def _count_subquery(queryset):
+    """Коррелированный подзапрос COUNT(*) для аннотаций (без GROUP BY)."""
+    counted = queryset.order_by().annotate(_cnt=models.Func(models.F('pk'), function='COUNT')).values('_cnt')
+    return models.Subquery(counted, output_field=models.IntegerField())
+
+
+class PlayerQuerySet(models.QuerySet):
+    def with_stats(self, include_doubles=True):
+        """Аннотирует игроков статистикой в формате PlayerStats одним SQL-запросом.
+
+        Игры, победы и поражения — один GROUP BY по индексу участия
+        (PlayerParticipation) с условными COUNT; партии и очки — подзапросы,
+        которые база выполняет поиском по индексам.
+        """
+        me = models.OuterRef('pk')
+        match = models.Q(participations__source_type=PlayerParticipation.SOURCE_MATCH)
+        friendly = models.Q(participations__source_type=PlayerParticipation.SOURCE_FRIENDLY)
+        single = friendly & models.Q(participations__game_type='single')
+        double = friendly & models.Q(participations__game_type='double')
+        won, lost = models.Q(participations__won=True), models.Q(participations__won=False)
+        # Незавершенный матч или одиночная игра (won IS NULL) считается поражением, как в PlayerStats
+        not_won = lost | models.Q(participations__won__isnull=True)
+
+        def count(condition):
+            return models.Count('participations', filter=condition)
+
+        # Партии считаются из Game двумя подзапросами (партия принадлежит матчу или
+        # товарищеской): OR по колонкам двух присоединенных таблиц заставлял базу
+        # перебирать всю Game. В каждом подзапросе база идет от игр игрока по индексам
+        # слотов к их партиям по индексу FK. Товарищеские — по полям player1/player2
+        # (в парной игре они дублируют первых игроков команд) и, с парными, по слотам команд
+        friendly_slots = models.Q(friendly__player1=me) | models.Q(friendly__player2=me)
+        if include_doubles:
+            for slot in ('team1_player1', 'team1_player2', 'team2_player1', 'team2_player2'):
+                friendly_slots |= models.Q(**{f'friendly__{slot}': me})
+        match_parties = _count_subquery(Game.objects.filter(models.Q(match__player1=me) | models.Q(match__player2=me)))
+        friendly_parties = _count_subquery(Game.objects.filter(friendly_slots))
+        # Сумма обернута в подзапрос по тому же игроку: иначе она попадает в GROUP BY и
+        # вычисляется для каждой строки участия, а не один раз на игрока
+        parties = Player.objects.filter(pk=me).annotate(n=match_parties + friendly_parties).values('n')
+
+        zero = models.Value(0, output_field=models.IntegerField())
+        return self.annotate(
+            stats_matches=count(match),
+            stats_match_wins=count(match & won),
+            stats_match_losses=count(match & not_won),
+            stats_friendlies_single=count(single),
+            stats_single_wins=count(single & won),
+            stats_single_losses=count(single & not_won),
+            stats_friendlies_double=count(double) if include_doubles else zero,
+            stats_double_wins=count(double & won) if include_doubles else zero,
+            stats_double_losses=count(double & lost) if include_doubles else zero,
+            stats_total_parties=models.Subquery(parties, output_field=models.IntegerField()),
+            stats_scored_points=_count_subquery(Point.objects.filter(scored_by=me)),
+        )
+
+
 class Player(models.Model):
     full_name = models.CharField("ФИО", max_length=100)
     club = models.ForeignKey(Club, on_delete=models.CASCADE, verbose_name="Клуб")
@@ -49,170 +131,37 @@ class Player(models.Model):
     rating = models.IntegerField("Рейтинг", default=1000)
     dominant_hand = models.CharField("Преобладающая рука", max_length=10, choices=[('right', 'Правая'), ('left', 'Левая')], default='right')
 
+    objects = PlayerQuerySet.as_manager()
+
     class Meta:
         verbose_name = "Игрок"
         verbose_name_plural = "Игроки"
+        indexes = [
+            # Рейтинг-лист (leaderboard.py): страницы и ранги — диапазоны по (rating, id)
+            models.Index(fields=['rating', 'id']),
+            models.Index(fields=['club', 'rating', 'id']),
+            models.Index(fields=['dominant_hand', 'rating', 'id']),
+        ]
 
     def __str__(self):
         return self.full_name
 
     def get_stats(self, include_doubles=True):
-        matches = Match.objects.filter(models.Q(player1=self) | models.Q(player2=self))
-        # Одиночные товарищеские
-        friendlies_single = FriendlyGame.objects.filter(game_type='single').filter(models.Q(player1=self) | models.Q(player2=self))
-        
-        if include_doubles:
-            # Парные товарищеские (искать во всех слотах команды)
-            friendlies_double = FriendlyGame.objects.filter(game_type='double').filter(
-                models.Q(team1_player1=self) | models.Q(team1_player2=self) | models.Q(team2_player1=self) | models.Q(team2_player2=self)
-            )
-            friendlies = friendlies_single.union(friendlies_double)
-        else:
-            friendlies_double = FriendlyGame.objects.none()
-            friendlies = friendlies_single
-        
-        match_wins = matches.filter(winner=self).count()
-        # Победы в одиночных как раньше + победы в парных, где его команда выиграла (если включены парные)
-        friendly_single_wins = friendlies_single.filter(winner=self).count()
-        
-        if include_doubles:
-            friendly_double_wins = FriendlyGame.objects.filter(game_type='double', winning_team__isnull=False).filter(
-                (
-                    (models.Q(team1_player1=self) | models.Q(team1_player2=self)) & models.Q(winning_team=1)
-                ) | (
-                    (models.Q(team2_player1=self) | models.Q(team2_player2=self)) & models.Q(winning_team=2)
-                )
-            ).count()
-        else:
-            friendly_double_wins = 0
-            
-        friendly_wins = friendly_single_wins + friendly_double_wins
-        total_points = Point.objects.filter(scored_by=self).count()
-        
-        if include_doubles:
-            games = Game.objects.filter(models.Q(match__player1=self) | models.Q(match__player2=self) |
-                                         models.Q(friendly__player1=self) | models.Q(friendly__player2=self) |
-                                         models.Q(friendly__team1_player1=self) | models.Q(friendly__team1_player2=self) |
-                                         models.Q(friendly__team2_player1=self) | models.Q(friendly__team2_player2=self))
-        else:
-            games = Game.objects.filter(models.Q(match__player1=self) | models.Q(match__player2=self) |
-                                         models.Q(friendly__player1=self) | models.Q(friendly__player2=self))
-        
-        # Поражения: одиночные где не winner + парные где его команда проиграла (если включены парные)
-        losses = (
-            matches.exclude(winner=self).count() +
-            friendlies_single.exclude(winner=self).count()
-        )
-        
-        if include_doubles:
-            losses += FriendlyGame.objects.filter(game_type='double', winning_team__isnull=False).filter(
-                (
-                    (models.Q(team1_player1=self) | models.Q(team1_player2=self)) & models.Q(winning_team=2)
-                ) | (
-                    (models.Q(team2_player1=self) | models.Q(team2_player2=self)) & models.Q(winning_team=1)
-                )
-            ).count()
-        
-        return {
-            'matches': matches.count(),
-            'friendlies': friendlies.count(),  # общее число товарищеских (single + double если включены)
-            'total_games': matches.count() + friendlies.count(),
-            'total_parties': games.count(),
-            'wins': match_wins + friendly_wins,
-            'losses': losses,
-            'scored_points': total_points
-        }
+        """Общая статистика игрока из PlayerStats — та же, что на страницах (stats.player_stats_map)."""
+        from .stats import player_stats_map
+
+        # Свежая строка, а не закэшированная на экземпляре self.stats_row
+        player = Player.objects.select_related('stats_row').get(pk=self.pk)
+        return player_stats_map([player], include_doubles)[self.pk]
 
     def get_monthly_stats(self, year=None, include_doubles=True):
-        """Получает статистику игрока по месяцам за указанный год"""
-        from django.db.models import Q
+        """Получает статистику игрока по месяцам за указанный год (как API monthly_stats)"""
         from datetime import datetime
-        from collections import defaultdict
-        
+        from .stats import monthly_stats_from_table
+
         if year is None:
             year = datetime.now().year
-        
-        # Инициализируем словарь для каждого месяца
-        monthly_data = {}
-        for month in range(1, 13):
-            monthly_data[month] = {
-                'month': month,
-                'month_name': datetime(year, month, 1).strftime('%B'),
-                'total_games': 0,
-                'wins': 0,
-                'losses': 0,
-                'win_percent': 0
-            }
-        
-        # Получаем все матчи игрока за год
-        matches = Match.objects.filter(
-            Q(player1=self) | Q(player2=self),
-            played_at__year=year
-        )
-        
-        # Получаем все товарищеские игры за год
-        friendlies_single = FriendlyGame.objects.filter(
-            game_type='single',
-            played_at__year=year
-        ).filter(Q(player1=self) | Q(player2=self))
-        
-        if include_doubles:
-            friendlies_double = FriendlyGame.objects.filter(
-                game_type='double',
-                played_at__year=year
-            ).filter(
-                Q(team1_player1=self) | Q(team1_player2=self) | 
-                Q(team2_player1=self) | Q(team2_player2=self)
-            )
-        else:
-            friendlies_double = FriendlyGame.objects.none()
-        
-        # Обрабатываем матчи турниров
-        for match in matches:
-            month = match.played_at.month
-            monthly_data[month]['total_games'] += 1
-            
-            if match.winner == self:
-                monthly_data[month]['wins'] += 1
-            elif match.winner is not None:  # Матч завершен, но игрок проиграл
-                monthly_data[month]['losses'] += 1
-        
-        # Обрабатываем одиночные товарищеские игры
-        for friendly in friendlies_single:
-            month = friendly.played_at.month
-            monthly_data[month]['total_games'] += 1
-            
-            if friendly.winner == self:
-                monthly_data[month]['wins'] += 1
-            elif friendly.winner is not None:
-                monthly_data[month]['losses'] += 1
-        
-        # Обрабатываем парные товарищеские игры (только если include_doubles=True)
-        if include_doubles:
-            for friendly in friendlies_double:
-                month = friendly.played_at.month
-                monthly_data[month]['total_games'] += 1
-                
-                if friendly.winning_team is not None:
-                    # Определяем, в какой команде играл игрок
-                    player_team = None
-                    if friendly.team1_player1 == self or friendly.team1_player2 == self:
-                        player_team = 1
-                    elif friendly.team2_player1 == self or friendly.team2_player2 == self:
-                        player_team = 2
-                    
-                    if player_team == friendly.winning_team:
-                        monthly_data[month]['wins'] += 1
-                    else:
-                        monthly_data[month]['losses'] += 1
-        
-        # Вычисляем процент побед для каждого месяца
-        for month_data in monthly_data.values():
-            completed_games = month_data['wins'] + month_data['losses']
-            if completed_games > 0:
-                month_data['win_percent'] = round((month_data['wins'] / completed_games) * 100, 1)
-        
-        return list(monthly_data.values())
+        return monthly_stats_from_table(self, (year, 1), (year, 12), include_doubles)
 
 
 class Tournament(models.Model):
@@ -242,87 +191,135 @@ class Tournament(models.Model):
         return Player.objects.filter(tournamentparticipant__tournament=self)
 
     def generate_matches(self):
-        """Генерация матчей для турнира в зависимости от типа."""
+        """Генерация матчей для турнира в зависимости от типа.
+
+        Олимпийская сетка строится в памяти и пишется bulk_create, круговая —
+        одним INSERT ... SELECT; все в одной транзакции. Пакетная вставка не
+        отправляет сигналы, поэтому индекс участия и
+        статистика игроков обновляются явно (stats.register_new_matches).
+        """
         if self.matches.exists():
             return  # Уже сгенерированы
-        players = list(self.participants)
-        if len(players) < 2:
+        if self.participants_links.count() < 2:
             return
-        if self.tournament_type == self.ROUND_ROBIN:
-            # Каждый с каждым один раз
-            for i in range(len(players)):
-                for j in range(i + 1, len(players)):
-                    Match.objects.create(tournament=self, player1=players[i], player2=players[j], round_number=1)
-        else:  # ELIMINATION
-            # Формируем олимпийскую сетку ближайшей степени двойки
-            n = len(players)
-            size = 1
-            while size < n:
-                size *= 2
-            # Сортировка по seed если задан, иначе по id
-            participants = list(TournamentParticipant.objects.filter(tournament=self).select_related('player').order_by('seed', 'id'))
-            player_list = [p.player for p in participants]
-            # Добавляем None для byes
-            while len(player_list) < size:
-                player_list.append(None)
-            # Создаем первый раунд
-            matches_current_round = []
-            for i in range(0, size, 2):
-                p1 = player_list[i]
-                p2 = player_list[i+1]
-                m = Match.objects.create(
+        from .stats import register_new_matches
+
+        with transaction.atomic():
+            if self.tournament_type == self.ROUND_ROBIN:
+                # Каждый с каждым один раз. Матчей O(n²), поэтому пары строит сама база
+                # соединением участников с собой, минуя Python
+                table, tournament_col, player_col = sql_names(TournamentParticipant, 'tournament', 'player')
+                insert_from_select(
+                    Match, ['tournament', 'played_at', 'player1', 'player2'],
+                    f'SELECT %s, %s, a.{player_col}, b.{player_col} '
+                    f'FROM {table} a JOIN {table} b '
+                    f'ON b.{tournament_col} = a.{tournament_col} AND b.{player_col} > a.{player_col} '
+                    f'WHERE a.{tournament_col} = %s',
+                    [self.pk, Match._meta.get_field('played_at').get_db_prep_save(timezone.now(), connection), self.pk],
+                )
+            else:  # ELIMINATION
+                rounds = self._build_bracket()
+                matches = [m for round_matches in rounds for m in round_matches]
+                Match.objects.bulk_create(matches, batch_size=500)
+                # Ссылки на следующий матч проставляются после вставки, когда известны id
+                linked = []
+                for prev_round, next_round in zip(rounds, rounds[1:]):
+                    for idx, m in enumerate(prev_round):
+                        m.next_match = next_round[idx // 2]
+                        linked.append(m)
+                Match.objects.bulk_update(linked, ['next_match'], batch_size=500)
+            register_new_matches(self)
+            bump('tournament', self.pk)
+
+    def _build_bracket(self):
+        """Олимпийская сетка (без сохранения): список раундов, каждый — список матчей."""
+        # Сортировка по seed если задан, иначе по id
+        participants = list(TournamentParticipant.objects.filter(tournament=self).select_related('player').order_by('seed', 'id'))
+        player_list = [p.player for p in participants]
+        # Ближайшая степень двойки, недостающие места — bye (None)
+        size = 1
+        while size < len(player_list):
+            size *= 2
+        player_list += [None] * (size - len(player_list))
+        # Первый раунд
+        first_round = []
+        for i in range(0, size, 2):
+            p1 = player_list[i]
+            p2 = player_list[i+1]
+            m = Match(
+                tournament=self,
+                player1=p1 if p1 else p2,  # временно, чтобы не было null обоих
+                player2=p2,
+                round_number=1,
+                bracket_position=i//2 + 1
+            )
+            # Автовыигрыш при bye
+            if p1 and not p2:
+                m.winner = p1
+            elif p2 and not p1:
+                m.winner = p2
+            first_round.append(m)
+        # Заготовки следующих раундов
+        rounds = [first_round]
+        while len(rounds[-1]) > 1:
+            prev_round = rounds[-1]
+            rounds.append([
+                Match(
                     tournament=self,
-                    player1=p1 if p1 else player_list[i+1],  # временно, чтобы не было null обоих
-                    player2=p2,
-                    round_number=1,
-                    bracket_position=i//2 + 1
+                    player1=prev_round[idx].winner if prev_round[idx].winner else prev_round[idx].player1,
+                    player2=prev_round[idx+1].winner if prev_round[idx+1].winner else prev_round[idx+1].player1,
+                    round_number=len(rounds) + 1,
+                    bracket_position=idx//2 + 1
                 )
-                matches_current_round.append(m)
-                # Автовыигрыш при bye
-                if p1 and not p2:
-                    m.winner = p1
-                    m.save()
-                elif p2 and not p1:
-                    m.winner = p2
-                    m.save()
-            # Создаем заготовки следующих раундов
-            round_num = 2
-            prev_round = matches_current_round
-            while len(prev_round) > 1:
-                next_round = []
-                for idx in range(0, len(prev_round), 2):
-                    m = Match.objects.create(
-                        tournament=self,
-                        player1=prev_round[idx].winner if prev_round[idx].winner else prev_round[idx].player1,
-                        player2=prev_round[idx+1].winner if prev_round[idx+1].winner else prev_round[idx+1].player1,
-                        round_number=round_num,
-                        bracket_position=idx//2 + 1
-                    )
-                    prev_round[idx].next_match = m
-                    prev_round[idx].save(update_fields=["next_match"])
-                    prev_round[idx+1].next_match = m
-                    prev_round[idx+1].save(update_fields=["next_match"])
-                    next_round.append(m)
-                prev_round = next_round
-                round_num += 1
+                for idx in range(0, len(prev_round), 2)
+            ])
+        return rounds
+
+    # Очки за победу в круговом турнире (поражение — 0)
+    POINTS_PER_WIN = 2
 
     def recalculate_standings(self):
+        """Полная пересборка таблицы: один агрегатный запрос и один bulk_update очков и мест."""
         if self.tournament_type != self.ROUND_ROBIN:
             return
-        # Simple win = 2 pts, loss = 0
-        for standing in self.standings.all():
-            standing.points = 0
-            standing.save(update_fields=['points'])
-        for match in self.matches.exclude(winner__isnull=True):
-            st = Standing.objects.filter(tournament=self, player=match.winner).first()
-            if st:
-                st.points += 2
-                st.save(update_fields=['points'])
-        # Ранжирование
-        ordered = self.standings.order_by('-points', 'player__full_name')
-        for idx, st in enumerate(ordered, start=1):
-            st.rank = idx
-            st.save(update_fields=['rank'])
+        wins = (
+            self.matches.exclude(winner__isnull=True).order_by().values('winner_id')
+            .annotate(total=models.Count('id')).values_list('winner_id', 'total')
+        )
+        with transaction.atomic():
+            self._rerank({player_id: total * self.POINTS_PER_WIN for player_id, total in wins})
+
+    def apply_result(self, old_winner_id, new_winner_id):
+        """Инкрементально переносит очки за матч при установке или смене победителя."""
+        if self.tournament_type != self.ROUND_ROBIN or old_winner_id == new_winner_id:
+            return
+        with transaction.atomic():
+            for player_id, delta in ((old_winner_id, -self.POINTS_PER_WIN), (new_winner_id, self.POINTS_PER_WIN)):
+                if player_id is not None:
+                    self.standings.filter(player_id=player_id).update(points=models.F('points') + delta)
+            self._rerank()
+
+    def _rerank(self, points=None):
+        """Ранжирование с дополнительными показателями (tiebreaks.py); записываются только сдвинутые строки.
+
+        points — новые очки {player_id: очки} при полной пересборке (у остальных 0);
+        они ранжируются в памяти и пишутся тем же bulk_update, что и места.
+        """
+        from .tiebreaks import load_table
+
+        standings = list(self.standings.only('id', 'player_id', 'points', 'rank'))
+        if points is not None:
+            points = {st.player_id: points.get(st.player_id, 0) for st in standings}
+        place = {player_id: idx for idx, player_id in enumerate(load_table(self, points).ranking(), start=1)}
+        changed = []
+        for st in standings:
+            new = (st.points if points is None else points[st.player_id], place[st.player_id])
+            if (st.points, st.rank) != new:
+                st.points, st.rank = new
+                changed.append(st)
+        Standing.objects.bulk_update(changed, ['rank'] if points is None else ['points', 'rank'])
+        # bulk_update и update() не отправляют сигналы — кэш страницы турнира сбрасывается здесь
+        bump('tournament', self.pk)
 
 
 class TournamentParticipant(models.Model):
@@ -353,11 +350,21 @@ class Match(models.Model):
     sets_player1 = models.PositiveIntegerField("Сеты игрока 1", default=0)
     sets_player2 = models.PositiveIntegerField("Сеты игрока 2", default=0)
     finished = models.BooleanField("Завершен", default=False)
+    # Когда сообщен текущий результат (played_at — время создания матча); по нему упорядочен пересчет рейтинга
+    decided_at = models.DateTimeField("Время результата", null=True, blank=True)
+    # Прогресс судьи в живом счете (см. live.py): пишется вместе с очками, чтобы повтор
+    # пакета после перезапуска процесса не засчитывал очки дважды
+    live_seq = models.PositiveIntegerField("Последний номер действия судьи", default=0)
+    live_batch_keys = models.JSONField("Недавние ключи пакетов судьи", default=list, blank=True)
 
     class Meta:
         verbose_name = "Матч"
         verbose_name_plural = "Матчи"
         ordering = ['round_number', 'bracket_position', 'id']
+        indexes = [
+            # Проверка дубликата матча в tournament_detail
+            models.Index(fields=['tournament', 'player1', 'player2']),
+        ]
 
     def __str__(self):
         if self.finished:
@@ -365,20 +372,44 @@ class Match(models.Model):
         else:
             return f"{self.player1 or '-'} vs {self.player2 or '-'} ({self.sets_player1}:{self.sets_player2}) - В процессе"
 
+    PLAYER_FIELDS = ('player1_id', 'player2_id')
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Запоминаем исходный состав, чтобы пересчитать статистику и тех, кого заменили
+        instance._loaded_player_ids = instance.participant_ids()
+        instance._loaded_played_at = instance.__dict__.get('played_at')
+        return instance
+
+    def participant_ids(self):
+        return {self.__dict__.get(f) for f in self.PLAYER_FIELDS} - {None}
+
     def set_winner(self, player: Player):
-        self.winner = player
-        self.save(update_fields=['winner'])
-        # Если олимпийка — передаем победителя в следующий матч
-        if self.tournament.tournament_type == Tournament.ELIMINATION and self.next_match:
-            nm = self.next_match
-            # Вставляем в свободный слот
-            if nm.player1 is None or nm.player1 == self.player1 or nm.player1 == self.player2:
-                nm.player1 = player if nm.player2 != player else nm.player1
-            elif nm.player2 is None or nm.player2 == self.player1 or nm.player2 == self.player2:
-                nm.player2 = player if nm.player1 != player else nm.player2
-            nm.save()
-        # Пересчет standings для кругового
-        self.tournament.recalculate_standings()
+        with transaction.atomic():
+            previous_winner_id = (Match.objects.select_for_update().filter(pk=self.pk)
+                                  .values_list('winner_id', flat=True).first())
+            self.winner = player
+            if previous_winner_id != self.winner_id:
+                self.decided_at = timezone.now() if player else None
+            self.save(update_fields=['winner', 'decided_at'])
+            # Если олимпийка — передаем победителя в следующий матч
+            if self.tournament.tournament_type == Tournament.ELIMINATION and self.next_match:
+                nm = self.next_match
+                # Вставляем в свободный слот
+                if nm.player1 is None or nm.player1 == self.player1 or nm.player1 == self.player2:
+                    nm.player1 = player if nm.player2 != player else nm.player1
+                elif nm.player2 is None or nm.player2 == self.player1 or nm.player2 == self.player2:
+                    nm.player2 = player if nm.player1 != player else nm.player2
+                nm.save()
+            # Очки в таблице кругового турнира переносятся инкрементально
+            self.tournament.apply_result(previous_winner_id, self.winner_id)
+            if previous_winner_id != self.winner_id:
+                from . import ratings
+                if previous_winner_id is not None:
+                    ratings.revert_result([previous_winner_id], list(self.participant_ids() - {previous_winner_id}),
+                                          ratings.result_time(self))
+                ratings.record_result(self)
 
     def get_match_status(self):
         """Возвращает строку с текущим статусом матча"""
@@ -411,6 +442,10 @@ class Game(models.Model):
     class Meta:
         verbose_name = "Партия"
         verbose_name_plural = "Партии"
+        indexes = [
+            # Match.get_current_game / get_completed_games
+            models.Index(fields=['match', 'end_time', 'created_at']),
+        ]
 
     def clean(self):
         if bool(self.match) == bool(self.friendly):
@@ -419,7 +454,30 @@ class Game(models.Model):
     def get_score(self):
         return self.score_player1, self.score_player2
 
+    @classmethod
+    def shift_score(cls, game_id, delta1=0, delta2=0):
+        """Атомарно сдвигает счетчики очков партии (F-выражение, без пересчета очков)."""
+        if delta1 or delta2:
+            cls.objects.filter(pk=game_id).update(
+                score_player1=models.F('score_player1') + delta1,
+                score_player2=models.F('score_player2') + delta2,
+            )
+
+    @classmethod
+    def shift_score_for(cls, game_id, player_id, delta):
+        """Сдвигает счетчик того игрока партии, которым является player_id."""
+        row = cls.objects.filter(pk=game_id).values_list(
+            'match__player1_id', 'match__player2_id', 'friendly__player1_id', 'friendly__player2_id').first()
+        if not row:
+            return
+        p1, p2 = row[:2] if row[0] or row[1] else row[2:]
+        if player_id == p1:
+            cls.shift_score(game_id, delta1=delta)
+        elif player_id == p2:
+            cls.shift_score(game_id, delta2=delta)
+
     def recalculate_score(self):
+        """Полный пересчет счета по очкам — только для восстановления счетчиков."""
         if self.match:
             p1 = self.match.player1
             p2 = self.match.player2
@@ -431,6 +489,23 @@ class Game(models.Model):
         self.score_player1 = self.points.filter(scored_by=p1).count()
         self.score_player2 = self.points.filter(scored_by=p2).count()
         self.save(update_fields=['score_player1', 'score_player2'])
+
+    @classmethod
+    def recalculate_scores(cls, games):
+        """Пересчет счета нескольких партий одним запросом по очкам (восстановление)."""
+        games = list(games.select_related('match', 'friendly'))
+        counts = {}
+        rows = (Point.objects.filter(game__in=games).values('game_id', 'scored_by_id')
+                .annotate(total=models.Count('id')).values_list('game_id', 'scored_by_id', 'total'))
+        for game_id, player_id, total in rows:
+            counts[game_id, player_id] = total
+        for game in games:
+            owner = game.match or game.friendly
+            if owner is None:
+                continue
+            game.score_player1 = counts.get((game.pk, owner.player1_id), 0)
+            game.score_player2 = counts.get((game.pk, owner.player2_id), 0)
+        cls.objects.bulk_update(games, ['score_player1', 'score_player2'])
     
     def get_winner(self):
         """Возвращает победителя партии или None если партия не завершена"""
@@ -466,9 +541,29 @@ class FriendlyGame(models.Model):
     score_team2 = models.PositiveIntegerField("Счет команды 2", default=0) 
     recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Записал результат")
 
+    PLAYER_FIELDS = ('player1_id', 'player2_id', 'team1_player1_id', 'team1_player2_id', 'team2_player1_id', 'team2_player2_id')
+
     class Meta:
         verbose_name = "Свободная игра"
         verbose_name_plural = "Свободные игры"
+        indexes = [
+            models.Index(fields=['game_type', 'played_at']),
+            # Поиск парных игр игрока по слотам команд
+            models.Index(fields=['team1_player1', 'game_type']),
+            models.Index(fields=['team1_player2', 'game_type']),
+            models.Index(fields=['team2_player1', 'game_type']),
+            models.Index(fields=['team2_player2', 'game_type']),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._loaded_player_ids = instance.participant_ids()
+        instance._loaded_played_at = instance.__dict__.get('played_at')
+        return instance
+
+    def participant_ids(self):
+        return {self.__dict__.get(f) for f in self.PLAYER_FIELDS} - {None}
 
     def __str__(self):
         if self.game_type == 'double':
@@ -488,6 +583,10 @@ class Point(models.Model):
         ordering = ['order']
         verbose_name = "Очко"
         verbose_name_plural = "Очки"
+        indexes = [
+            # Game.recalculate_score (восстановление) и отмена последнего очка игрока
+            models.Index(fields=['game', 'scored_by', 'order']),
+        ]
 
 
 class Standing(models.Model):
@@ -502,6 +601,138 @@ class Standing(models.Model):
         verbose_name_plural = "Турнирные таблицы"
 
 
+class PlayerStats(models.Model):
+    """Денормализованная статистика игрока (см. stats.py).
+
+    Парные счетчики хранятся отдельно, чтобы отдавать get_stats() для обоих
+    значений include_doubles без обращения к таблицам игр.
+    """
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, primary_key=True, related_name='stats_row', verbose_name="Игрок")
+    matches = models.PositiveIntegerField("Матчи", default=0)
+    match_wins = models.PositiveIntegerField("Победы в матчах", default=0)
+    match_losses = models.PositiveIntegerField("Поражения в матчах", default=0)
+    friendlies_single = models.PositiveIntegerField("Одиночные товарищеские", default=0)
+    single_wins = models.PositiveIntegerField("Победы в одиночных", default=0)
+    single_losses = models.PositiveIntegerField("Поражения в одиночных", default=0)
+    friendlies_double = models.PositiveIntegerField("Парные товарищеские", default=0)
+    double_wins = models.PositiveIntegerField("Победы в парных", default=0)
+    double_losses = models.PositiveIntegerField("Поражения в парных", default=0)
+    parties = models.PositiveIntegerField("Партии (без парных)", default=0)
+    parties_with_doubles = models.PositiveIntegerField("Партии (с парными)", default=0)
+    scored_points = models.PositiveIntegerField("Набранные очки", default=0)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+
+    class Meta:
+        verbose_name = "Статистика игрока"
+        verbose_name_plural = "Статистика игроков"
+
+    def as_dict(self, include_doubles=True):
+        """Та же структура, что возвращает Player.get_stats()."""
+        friendlies = self.friendlies_single + (self.friendlies_double if include_doubles else 0)
+        return {
+            'matches': self.matches,
+            'friendlies': friendlies,
+            'total_games': self.matches + friendlies,
+            'total_parties': self.parties_with_doubles if include_doubles else self.parties,
+            'wins': self.match_wins + self.single_wins + (self.double_wins if include_doubles else 0),
+            'losses': self.match_losses + self.single_losses + (self.double_losses if include_doubles else 0),
+            'scored_points': self.scored_points,
+        }
+
+
+class PlayerMonthlyStats(models.Model):
+    """Помесячные итоги игрока; single_* включают турнирные матчи и одиночные товарищеские."""
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='monthly_stats_rows', verbose_name="Игрок")
+    year = models.PositiveSmallIntegerField("Год")
+    month = models.PositiveSmallIntegerField("Месяц")
+    single_games = models.PositiveIntegerField("Игры", default=0)
+    single_wins = models.PositiveIntegerField("Победы", default=0)
+    single_losses = models.PositiveIntegerField("Поражения", default=0)
+    double_games = models.PositiveIntegerField("Парные игры", default=0)
+    double_wins = models.PositiveIntegerField("Победы в парных", default=0)
+    double_losses = models.PositiveIntegerField("Поражения в парных", default=0)
+
+    class Meta:
+        unique_together = ('player', 'year', 'month')
+        verbose_name = "Статистика игрока за месяц"
+        verbose_name_plural = "Статистика игроков по месяцам"
+
+
+class PlayerParticipation(models.Model):
+    """Узкий индекс участия игрока в играх: турнирных матчах и товарищеских.
+
+    Одна строка на игрока в каждой игре, поэтому «все игры игрока X» — это
+    один диапазон индекса (player, played_at) вместо OR по шести FK-колонкам.
+    Строки поддерживаются сигналами (см. stats.sync_participations).
+    """
+    SOURCE_MATCH = 'match'
+    SOURCE_FRIENDLY = 'friendly'
+    SOURCE_TYPES = [
+        (SOURCE_MATCH, 'Турнирный матч'),
+        (SOURCE_FRIENDLY, 'Товарищеская игра'),
+    ]
+
+    player = models.ForeignKey(Player, on_delete=models.CASCADE, related_name='participations', verbose_name="Игрок")
+    source_type = models.CharField("Источник", max_length=10, choices=SOURCE_TYPES)
+    source_id = models.BigIntegerField("ID игры")
+    game_type = models.CharField("Тип игры", max_length=10, choices=FriendlyGame.GAME_TYPE_CHOICES, default='single')
+    team = models.PositiveSmallIntegerField("Сторона", choices=[(1, 'Команда 1'), (2, 'Команда 2')])
+    won = models.BooleanField("Победа", null=True, blank=True)
+    played_at = models.DateTimeField("Дата проведения")
+    club = models.ForeignKey(Club, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Клуб")
+
+    class Meta:
+        unique_together = ('source_type', 'source_id', 'player')
+        indexes = [
+            models.Index(fields=['player', 'played_at']),
+            # Счетчики игрока (with_stats) читаются из индекса, без обращения к строкам
+            models.Index(fields=['player', 'source_type', 'game_type', 'won']),
+        ]
+        verbose_name = "Участие в игре"
+        verbose_name_plural = "Участие в играх"
+
+
+class LiveFriendlyGame(models.Model):
+    """Идущая товарищеская игра, сохраняемая из WebSocket-трансляции (см. friendlies.py).
+
+    Последнее состояние пишется пакетами, пока идет игра; по game_end создается
+    FriendlyGame и ссылка на нее сохраняется здесь — повторное окончание той же
+    игры (или запасной POST save_friendly_game) не создает дубль.
+    """
+    club = models.ForeignKey(Club, on_delete=models.CASCADE, related_name='live_friendlies', verbose_name="Клуб")
+    game_key = models.CharField("Ключ трансляции", max_length=100)
+    game_data = models.JSONField("Последнее состояние", default=dict)
+    started_at = models.DateTimeField("Начало", auto_now_add=True)
+    updated_at = models.DateTimeField("Обновлено", auto_now=True)
+    recorded_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, verbose_name="Записал")
+    friendly = models.OneToOneField(FriendlyGame, on_delete=models.SET_NULL, null=True, blank=True,
+                                    related_name='live_source', verbose_name="Сохраненная игра")
+
+    class Meta:
+        unique_together = ('club', 'game_key')
+        verbose_name = "Идущая товарищеская игра"
+        verbose_name_plural = "Идущие товарищеские игры"
+
+    def __str__(self):
+        return f"{self.game_data.get('player1', '—')} vs {self.game_data.get('player2', '—')} ({self.game_key})"
+
+
+class RatingHistory(models.Model):
+    """История рейтинга игрока одной строкой (см. ratings.py).
+
+    times и values — упакованные массивы одинаковой длины: секунды Unix (int64)
+    и рейтинг после результата (int32), 12 байт на точку. Новые точки
+    дописываются в конец, times не убывает.
+    """
+    player = models.OneToOneField(Player, on_delete=models.CASCADE, primary_key=True, related_name='rating_history', verbose_name="Игрок")
+    times = models.BinaryField("Моменты", default=bytes)
+    values = models.BinaryField("Рейтинги", default=bytes)
+
+    class Meta:
+        verbose_name = "История рейтинга"
+        verbose_name_plural = "Истории рейтинга"
+
+
 class ClubEvent(models.Model):
     club = models.ForeignKey(Club, on_delete=models.CASCADE, verbose_name="Клуб")
     title = models.CharField("Название события", max_length=200)
@@ -0,0 +1,277 @@
+"""Рейтинг Эло игроков (Player.rating).
+
+Результат обновляет рейтинг сразу: Match.set_winner и сигнал создания
+FriendlyGame (signals.py) вызывают record_result. В парной игре рейтинг
+команды — среднее ее игроков, изменение получают оба игрока. Изменение
+округляется до целого на каждом шаге, поэтому replay() по той же истории
+дает ровно те же числа: результаты проходятся в том порядке, в котором о
+них сообщили, — по Match.decided_at (а не по времени создания матча) и по
+played_at товарищеской игры, которая создается уже с результатом.
+
+Исправленные и удаленные результаты учитываются приближенно (обратным
+изменением от текущих рейтингов); точные значения восстанавливает команда
+replay_ratings — полный проход по истории.
+
+История для графиков хранится в RatingHistory: по строке на игрока с
+упакованными массивами моментов и рейтингов, новые точки дописываются в конец.
+Момент точки — момент результата (result_time), тот же, что пишет replay().
+"""
+import heapq
+import sys
+import time
+from array import array
+from bisect import bisect_left, bisect_right
+from datetime import datetime
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import CharField, F
+from django.db.models.functions import Cast, Coalesce
+from django.utils import timezone
+
+from . import caching
+from .models import FriendlyGame, Match, Player, RatingHistory
+
+INITIAL_RATING = Player._meta.get_field('rating').default
+DEFAULT_K_FACTOR = 32
+# Строковое представление одной базы упорядочено так же, как сами даты.
+# Матч без decided_at (результат записан в обход set_winner) стоит по времени создания
+DECIDED_AT = Cast(Coalesce('decided_at', 'played_at'), CharField())
+PLAYED_AT = Cast('played_at', CharField())
+
+
+def k_factor():
+    return getattr(settings, 'RATING_K_FACTOR', DEFAULT_K_FACTOR)
+
+
+def rating_delta(winner_rating, loser_rating, k):
+    """Сколько очков победитель получает (а проигравший теряет)."""
+    expected = 1 / (1 + 10 ** ((loser_rating - winner_rating) / 400))
+    return round(k * (1 - expected))
+
+
+def result_sides(result):
+    """(id победителей, id проигравших) для Match / FriendlyGame или None, если результата нет."""
+    if isinstance(result, FriendlyGame) and result.game_type == 'double':
+        team1 = [result.team1_player1_id, result.team1_player2_id]
+        team2 = [result.team2_player1_id, result.team2_player2_id]
+        if result.winning_team not in (1, 2) or None in team1 + team2:
+            return None
+        return (team1, team2) if result.winning_team == 1 else (team2, team1)
+    pair = [result.player1_id, result.player2_id]
+    if result.winner_id is None or None in pair or result.winner_id not in pair:
+        return None
+    return [result.winner_id], [pid for pid in pair if pid != result.winner_id]
+
+
+def result_time(result):
+    """Момент результата: его же получают точки истории и по нему упорядочен replay()."""
+    if isinstance(result, Match) and result.decided_at is not None:
+        return result.decided_at
+    return result.played_at
+
+
+def _apply(winners, losers, when):
+    if not winners or not losers:
+        return 0
+    with transaction.atomic():
+        ratings = dict(Player.objects.select_for_update().filter(pk__in=winners + losers).values_list('pk', 'rating'))
+        if len(ratings) < len(set(winners + losers)):
+            return 0
+        delta = rating_delta(sum(ratings[pid] for pid in winners) / len(winners),
+                             sum(ratings[pid] for pid in losers) / len(losers), k_factor())
+        if delta:
+            Player.objects.filter(pk__in=winners).update(rating=F('rating') + delta)
+            Player.objects.filter(pk__in=losers).update(rating=F('rating') - delta)
+        new_ratings = {pid: ratings[pid] + delta for pid in winners}
+        new_ratings.update({pid: ratings[pid] - delta for pid in losers})
+        append_history(new_ratings, when)
+        caching.bump_many('player', new_ratings)
+        return delta
+
+
+def record_result(result):
+    """Учитывает новый результат; возвращает изменение рейтинга победителей."""
+    sides = result_sides(result)
+    return _apply(*sides, result_time(result)) if sides else 0
+
+
+def revert_result(winners, losers, when):
+    """Приближенно отменяет результат «winners обыграли losers» (см. docstring модуля); when — момент отмены."""
+    return _apply(losers, winners, when)
+
+
+# ------------------ История ------------------
+
+def _pack(typecode, items):
+    data = array(typecode, items)
+    if sys.byteorder == 'big':  # в базе всегда little-endian
+        data.byteswap()
+    return data.tobytes()
+
+
+def _unpack(typecode, blob):
+    data = array(typecode)
+    data.frombytes(bytes(blob))
+    if sys.byteorder == 'big':
+        data.byteswap()
+    return data
+
+
+def append_history(new_ratings, when):
+    """Дописывает точку (when, рейтинг) в историю каждого игрока {id: рейтинг}."""
+    ts = int(when.timestamp())
+    rows = {
+        pid: (bytes(times), bytes(values))
+        for pid, times, values in RatingHistory.objects.filter(player_id__in=list(new_ratings))
+        .values_list('player_id', 'times', 'values')
+    }
+    created, updated = [], []
+    for pid, rating in new_ratings.items():
+        times, values = rows.get(pid, (b'', b''))
+        # Моменты не убывают, даже если часы сервера сдвинулись назад
+        point_ts = max(ts, _unpack('q', times[-8:])[0]) if times else ts
+        row = RatingHistory(player_id=pid, times=times + _pack('q', [point_ts]), values=values + _pack('i', [rating]))
+        (updated if pid in rows else created).append(row)
+    RatingHistory.objects.bulk_update(updated, ['times', 'values'])
+    RatingHistory.objects.bulk_create(created)
+
+
+def downsample(series, limit):
+    """Не больше limit точек [(момент, рейтинг)] для графика.
+
+    Первая и последняя точки сохраняются, остальные делятся на корзины, и из
+    каждой берутся минимум и максимум — пики и провалы кривой не пропадают.
+    """
+    if limit is None or len(series) <= limit:
+        return list(series)
+    buckets = max(1, (limit - 2) // 2)
+    inner = series[1:-1]
+    size = len(inner) / buckets
+    result = [series[0]]
+    for bucket in range(buckets):
+        chunk = inner[int(bucket * size):int((bucket + 1) * size)]
+        if chunk:
+            result += sorted({min(chunk, key=itemgetter(1)), max(chunk, key=itemgetter(1))})
+    result.append(series[-1])
+    return result
+
+
+def rating_series(player_id, start=None, end=None, limit=None):
+    """[(секунды Unix, рейтинг)] игрока за [start, end] (datetime), не больше limit точек."""
+    row = RatingHistory.objects.filter(player_id=player_id).values_list('times', 'values').first()
+    if row is None:
+        return []
+    times, values = _unpack('q', row[0]), _unpack('i', row[1])
+    lo = bisect_left(times, int(start.timestamp())) if start else 0
+    hi = bisect_right(times, int(end.timestamp())) if end else len(times)
+    return downsample(list(zip(times[lo:hi], values[lo:hi])), limit)
+
+
+# ------------------ Полный пересчет ------------------
+
+_EPOCH = datetime(1970, 1, 1)
+
+
+def _epoch(played_at):
+    """Секунды Unix из строкового момента результата (см. DECIDED_AT, PLAYED_AT).
+
+    При USE_TZ соединение работает в UTC, поэтому первые 19 символов строки —
+    время UTC с точностью до секунды; зона и доли секунды не разбираются.
+    """
+    return int((datetime.fromisoformat(played_at[:19]) - _EPOCH).total_seconds())
+
+def _history(chunk_size=5000):
+    """Результаты в хронологическом порядке: (момент, тип, id, победители, проигравшие).
+
+    Момент — decided_at матча или played_at товарищеской игры. Каждая таблица
+    уже упорядочена базой; момент нужен только для слияния потоков и читается
+    строкой — разбор datetime занимал большую часть прохода.
+    """
+    matches = (
+        (decided_at, 0, pk, (winner,), (p2 if winner == p1 else p1,))
+        for decided_at, pk, p1, p2, winner in Match.objects.filter(
+            winner__isnull=False, player1__isnull=False, player2__isnull=False,
+        ).annotate(moment=DECIDED_AT).order_by('moment', 'id')
+        .values_list('moment', 'id', 'player1_id', 'player2_id', 'winner_id')
+        .iterator(chunk_size=chunk_size)
+        if winner in (p1, p2)
+    )
+    singles = (
+        (played_at, 1, pk, (winner,), (p2 if winner == p1 else p1,))
+        for played_at, pk, p1, p2, winner in FriendlyGame.objects.filter(
+            game_type='single', winner__isnull=False, player1__isnull=False, player2__isnull=False,
+        ).order_by('played_at', 'id').values_list(PLAYED_AT, 'id', 'player1_id', 'player2_id', 'winner_id')
+        .iterator(chunk_size=chunk_size)
+        if winner in (p1, p2)
+    )
+    doubles = (
+        (played_at, 1, pk, (a1, a2) if team == 1 else (b1, b2), (b1, b2) if team == 1 else (a1, a2))
+        for played_at, pk, team, a1, a2, b1, b2 in FriendlyGame.objects.filter(
+            game_type='double', winning_team__in=(1, 2), team1_player1__isnull=False, team1_player2__isnull=False,
+            team2_player1__isnull=False, team2_player2__isnull=False,
+        ).order_by('played_at', 'id').values_list(
+            PLAYED_AT, 'id', 'winning_team', 'team1_player1_id', 'team1_player2_id', 'team2_player1_id', 'team2_player2_id',
+        ).iterator(chunk_size=chunk_size)
+    )
+    # Товарищеские одиночные и парные — одна таблица, поэтому сравнение по (момент, тип, id) однозначно
+    return heapq.merge(matches, singles, doubles, key=lambda row: row[:3])
+
+
+def replay_results(results, ratings, k, history=None):
+    """Прогоняет результаты [(момент, победители, проигравшие)] по словарю рейтингов {id: рейтинг} на месте.
+
+    Горячий цикл без ORM: рейтинги отсутствующих игроков начинаются с INITIAL_RATING.
+    history, если передан, заполняется {id: ([моменты], [рейтинги])}.
+    Возвращает число учтенных результатов.
+    """
+    get = ratings.get
+    count = 0
+    for when, winners, losers in results:
+        if len(winners) == 1:
+            w, l = get(winners[0], INITIAL_RATING), get(losers[0], INITIAL_RATING)
+        else:
+            w = sum(get(pid, INITIAL_RATING) for pid in winners) / len(winners)
+            l = sum(get(pid, INITIAL_RATING) for pid in losers) / len(losers)
+        delta = round(k * (1 - 1 / (1 + 10 ** ((l - w) / 400))))
+        for pid in winners:
+            ratings[pid] = get(pid, INITIAL_RATING) + delta
+        for pid in losers:
+            ratings[pid] = get(pid, INITIAL_RATING) - delta
+        if history is not None:
+            for pid in winners + losers:
+                points = history.get(pid)
+                if points is None:
+                    points = history[pid] = ([], [])
+                points[0].append(when)
+                points[1].append(ratings[pid])
+        count += 1
+    return count
+
+
+def replay(k=None, dry_run=False, batch_size=1000):
+    """Пересчитывает рейтинги всех игроков по полной истории результатов.
+
+    Возвращает {'results', 'players', 'changed', 'seconds'}; с dry_run ничего не пишет.
+    """
+    k = k_factor() if k is None else k
+    started = time.perf_counter()
+    current = dict(Player.objects.values_list('pk', 'rating'))
+    ratings = dict.fromkeys(current, INITIAL_RATING)
+    history = None if dry_run else {}
+    results = ((_epoch(moment), winners, losers) for moment, _, _, winners, losers in _history())
+    count = replay_results(results, ratings, k, history)
+    changed = [Player(pk=pid, rating=rating) for pid, rating in ratings.items()
+               if pid in current and current[pid] != rating]
+    if not dry_run:
+        with transaction.atomic():
+            Player.objects.bulk_update(changed, ['rating'], batch_size=batch_size)
+            RatingHistory.objects.all().delete()
+            RatingHistory.objects.bulk_create([
+                RatingHistory(player_id=pid, times=_pack('q', times), values=_pack('i', values))
+                for pid, (times, values) in history.items() if pid in current
+            ], batch_size=batch_size)
+            caching.bump_many('player', history.keys() | {player.pk for player in changed})
+    return {'results': count, 'players': len(current), 'changed': len(changed),
+            'seconds': round(time.perf_counter() - started, 3)}
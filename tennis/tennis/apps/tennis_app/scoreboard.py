@@ -0,0 +1,134 @@
+"""Последнее состояние идущих товарищеских игр клуба (снимок для поздно подключившихся).
+
+FriendlyGameConsumer пишет сюда каждый game_update и удаляет игру на game_end;
+снимок отправляется новому сокету при подключении и отрисовывается на странице
+клуба без обращения к БД. Хранится в кэше Django: при нескольких воркерах кэш
+должен быть общим (см. CACHES).
+
+Снимок клуба — один ключ кэша, поэтому чтение-изменение-запись идет под
+коротким локом на cache.add: иначе обновления двух игр клуба из разных
+воркеров затирают друг друга.
+"""
+import itertools
+import time
+import uuid
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+
+# Поля game_data, которые принимаются от клиента и рассылаются зрителям
+GAME_DATA_FIELDS = (
+    'game_id', 'game_type', 'score1', 'score2', 'player1', 'player2', 'is_finished', 'server', 'winner',
+    'team1_player1', 'team1_player2', 'team2_player1', 'team2_player2',
+)
+MAX_TEXT_LENGTH = 100
+
+
+def snapshot_ttl():
+    """Игра без обновлений дольше этого срока (секунды) считается брошенной."""
+    return getattr(settings, 'FRIENDLY_SNAPSHOT_TTL', 15 * 60)
+
+
+def snapshot_max_games():
+    return getattr(settings, 'FRIENDLY_SNAPSHOT_MAX_GAMES', 8)
+
+
+def _cache_key(club_id):
+    return f'friendly_live:{club_id}'
+
+
+# Лок истекает сам, если воркер упал, не успев его снять
+LOCK_TIMEOUT = 5
+LOCK_POLL_SECONDS = 0.005
+
+
+@contextmanager
+def _club_lock(club_id):
+    """Эксклюзивное изменение снимка клуба между процессами.
+
+    Если лок не удалось взять за LOCK_TIMEOUT (его срок уже должен был
+    истечь), снимок обновляется без него — счет важнее редкой гонки.
+    """
+    key, token = f'{_cache_key(club_id)}:lock', uuid.uuid4().hex
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    acquired = cache.add(key, token, LOCK_TIMEOUT)
+    while not acquired and time.monotonic() < deadline:
+        time.sleep(LOCK_POLL_SECONDS)
+        acquired = cache.add(key, token, LOCK_TIMEOUT)
+    try:
+        yield
+    finally:
+        if acquired and cache.get(key) == token:
+            cache.delete(key)
+
+
+def clean_game_data(game_data):
+    """Оставляет известные поля и задает game_id (старые клиенты его не присылают)."""
+    if not isinstance(game_data, dict):
+        return None
+    cleaned = {}
+    for field in GAME_DATA_FIELDS:
+        value = game_data.get(field)
+        if isinstance(value, str):
+            value = value[:MAX_TEXT_LENGTH]
+        elif value is not None and not isinstance(value, (int, float, bool)):
+            continue
+        if value is not None:
+            cleaned[field] = value
+    if not cleaned.get('game_id'):
+        cleaned['game_id'] = f"{cleaned.get('player1', '')}|{cleaned.get('player2', '')}"
+    cleaned['game_id'] = str(cleaned['game_id'])
+    return cleaned
+
+
+def _live_games(club_id, now):
+    games = cache.get(_cache_key(club_id)) or {}
+    ttl = snapshot_ttl()
+    return {key: entry for key, entry in games.items() if now - entry['updated'] < ttl}
+
+
+def update_snapshot(club_id, game_data):
+    """Запоминает последнее состояние игры; хранится не больше snapshot_max_games() игр.
+
+    Возвращает (запись, прежнее game_data или None). В записи n — короткий номер
+    игры в клубе, seq — номер обновления игры (для дельта-протокола, wire.py).
+    """
+    with _club_lock(club_id):
+        now = time.time()
+        games = _live_games(club_id, now)
+        previous = games.get(game_data['game_id'])
+        if previous and previous.get('n'):
+            n, seq = previous['n'], previous.get('seq', 0) + 1
+        else:
+            used = {entry.get('n') for entry in games.values()}
+            n, seq = next(i for i in itertools.count(1) if i not in used), 1
+        entry = games[game_data['game_id']] = {'game_data': game_data, 'updated': now, 'n': n, 'seq': seq}
+        if len(games) > snapshot_max_games():
+            newest = sorted(games.items(), key=lambda item: item[1]['updated'])[-snapshot_max_games():]
+            games = dict(newest)
+        cache.set(_cache_key(club_id), games, snapshot_ttl())
+    return entry, previous['game_data'] if previous else None
+
+
+def end_snapshot(club_id, game_data):
+    """Забывает игру; возвращает ее последнюю запись (или None, если игры нет в снимке)."""
+    with _club_lock(club_id):
+        games = _live_games(club_id, time.time())
+        entry = games.pop(game_data['game_id'], None)
+        if games:
+            cache.set(_cache_key(club_id), games, snapshot_ttl())
+        else:
+            cache.delete(_cache_key(club_id))
+    return entry
+
+
+def club_snapshot_entries(club_id):
+    """Записи идущих игр клуба в порядке последнего обновления."""
+    games = _live_games(club_id, time.time())
+    return sorted(games.values(), key=lambda entry: entry['updated'])
+
+
+def club_snapshot(club_id):
+    """Состояния идущих игр клуба в порядке последнего обновления."""
+    return [entry['game_data'] for entry in club_snapshot_entries(club_id)]
@@ -0,0 +1,148 @@
+"""Обработчики сигналов моделей: индекс участия, денормализованная статистика (stats.py)
+и версии кэша (caching.py)."""
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from . import caching, ratings, stats
+from .models import Club, ClubAdmin, FriendlyGame, Game, Match, Player, PlayerStats, Point, Standing, Tournament, TournamentParticipant
+
+
+# Поля, изменение которых влияет на статистику матча/товарищеской игры
+MATCH_STATS_FIELDS = {'player1', 'player2', 'winner', 'played_at'}
+FRIENDLY_STATS_FIELDS = {
+    'club', 'player1', 'player2', 'winner', 'played_at', 'game_type', 'winning_team',
+    'team1_player1', 'team1_player2', 'team2_player1', 'team2_player2',
+}
+
+
+def _month(dt):
+    return (dt.year, dt.month) if dt else None
+
+
+def _refresh_for_result(instance, created, update_fields, relevant_fields):
+    if not created and update_fields is not None and not (set(update_fields) & relevant_fields):
+        return
+    stats.sync_participations(instance)
+    player_ids = instance.participant_ids() | getattr(instance, '_loaded_player_ids', set())
+    months = {_month(instance.played_at), _month(getattr(instance, '_loaded_played_at', None))} - {None}
+    stats.refresh_player_stats(player_ids)
+    stats.refresh_monthly_stats(player_ids, months)
+    caching.bump_many('player', player_ids)
+    # Следующее сохранение сравнивается уже с текущим состоянием
+    instance._loaded_player_ids = instance.participant_ids()
+    instance._loaded_played_at = instance.played_at
+
+
+@receiver(post_save, sender=Match)
+def match_saved(sender, instance, created, update_fields=None, **kwargs):
+    _refresh_for_result(instance, created, update_fields, MATCH_STATS_FIELDS)
+
+
+@receiver(post_save, sender=FriendlyGame)
+def friendly_saved(sender, instance, created, update_fields=None, **kwargs):
+    _refresh_for_result(instance, created, update_fields, FRIENDLY_STATS_FIELDS)
+    caching.bump('club', instance.club_id)
+    if created:
+        ratings.record_result(instance)
+
+
+@receiver(post_delete, sender=Match)
+@receiver(post_delete, sender=FriendlyGame)
+def result_deleted(sender, instance, **kwargs):
+    stats.delete_participations(instance)
+    player_ids = instance.participant_ids() | getattr(instance, '_loaded_player_ids', set())
+    stats.refresh_player_stats(player_ids)
+    stats.refresh_monthly_stats(player_ids, {_month(instance.played_at)} - {None})
+    caching.bump_many('player', player_ids)
+    if isinstance(instance, FriendlyGame):
+        caching.bump('club', instance.club_id)
+
+
+@receiver(post_save, sender=Match)
+@receiver(post_delete, sender=Match)
+@receiver(post_save, sender=TournamentParticipant)
+@receiver(post_delete, sender=TournamentParticipant)
+@receiver(post_save, sender=Standing)
+@receiver(post_delete, sender=Standing)
+def tournament_changed(sender, instance, **kwargs):
+    # Кэш страницы турнира (tournament_detail) становится устаревшим
+    caching.bump('tournament', instance.tournament_id)
+
+
+@receiver(post_save, sender=Tournament)
+def tournament_saved(sender, instance, **kwargs):
+    caching.bump('tournament', instance.pk)
+
+
+@receiver(post_save, sender=Club)
+@receiver(post_delete, sender=Club)
+def club_changed(sender, instance, **kwargs):
+    caching.bump('club', instance.pk)
+
+
+@receiver(post_save, sender=ClubAdmin)
+@receiver(post_delete, sender=ClubAdmin)
+def club_admins_changed(sender, instance, **kwargs):
+    # Состав администраторов кэшируется под версией клуба (views.is_club_admin)
+    caching.bump('club', instance.club_id)
+
+
+def _game_player_ids(game):
+    if game.match_id:
+        return set(Match.objects.filter(pk=game.match_id).values_list('player1_id', 'player2_id').first() or ())
+    if game.friendly_id:
+        return set(FriendlyGame.objects.filter(pk=game.friendly_id).values_list(*FriendlyGame.PLAYER_FIELDS).first() or ())
+    return set()
+
+
+@receiver(post_save, sender=Game)
+def game_saved(sender, instance, created, **kwargs):
+    # Счет партии на статистику не влияет, важен только сам факт партии
+    if created:
+        player_ids = _game_player_ids(instance)
+        stats.refresh_player_stats(player_ids)
+        caching.bump_many('player', player_ids)
+
+
+@receiver(post_delete, sender=Game)
+def game_deleted(sender, instance, **kwargs):
+    player_ids = _game_player_ids(instance)
+    stats.refresh_player_stats(player_ids)
+    caching.bump_many('player', player_ids)
+
+
+@receiver(post_save, sender=Point)
+def point_saved(sender, instance, created, **kwargs):
+    if created:
+        Game.shift_score_for(instance.game_id, instance.scored_by_id, 1)
+        stats.add_scored_points(instance.scored_by_id, 1)
+        caching.bump('player', instance.scored_by_id)
+    else:
+        # Очко могли переназначить другому игроку — пересчитываем партию и обоих игроков
+        game = instance.game
+        game.recalculate_score()
+        player_ids = _game_player_ids(game) | {instance.scored_by_id}
+        stats.refresh_player_stats(player_ids)
+        caching.bump_many('player', player_ids)
+
+
+@receiver(post_delete, sender=Point)
+def point_deleted(sender, instance, **kwargs):
+    Game.shift_score_for(instance.game_id, instance.scored_by_id, -1)
+    stats.add_scored_points(instance.scored_by_id, -1)
+    caching.bump('player', instance.scored_by_id)
+
+
+@receiver(post_save, sender=Player)
+def player_saved(sender, instance, created, **kwargs):
+    if created:
+        PlayerStats.objects.get_or_create(player=instance)
+    # Имя и клуб игрока видны в H2H и таблицах клуба
+    caching.bump('player', instance.pk)
+    caching.bump('club', instance.club_id)
+
+
+@receiver(post_delete, sender=Player)
+def player_deleted(sender, instance, **kwargs):
+    caching.bump('player', instance.pk)
+    caching.bump('club', instance.club_id)
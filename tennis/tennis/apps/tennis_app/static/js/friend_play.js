@@ -5,6 +5,11 @@ let startTime = null;
 let currentGameType = 'single';
 let websocket = null;
 let clubId = null;
+// Идентификатор трансляции этой партии (по нему зрители различают игры клуба)
+let liveGameId = null;
+// Ожидание подтверждения сервера о сохранении игры (ack с friendly_id)
+let pendingFinish = null;
+const FINISH_ACK_TIMEOUT = 3000;
 
 // Инициализация WebSocket
 function initWebSocket() {
@@ -25,8 +30,21 @@ function initWebSocket() {
     
     websocket.onopen = function(e) {
         console.log('WebSocket connection established');
+        // Сразу сообщаем текущий счет, чтобы партия появилась у зрителей
+        sendGameUpdate();
     };
     
+    websocket.onmessage = function(e) {
+        if (typeof e.data !== 'string') return;
+        const data = JSON.parse(e.data);
+        if (!pendingFinish || data.game_id !== pendingFinish.gameId) return;
+        if (data.type === 'ack' && data.finished) {
+            pendingFinish.resolve(data.friendly_id);
+        } else if (data.type === 'error') {
+            pendingFinish.resolve(null);
+        }
+    };
+
     websocket.onclose = function(e) {
         console.log('WebSocket connection closed');
     };
@@ -39,13 +57,15 @@ function initWebSocket() {
 function sendGameUpdate() {
     if (websocket && websocket.readyState === WebSocket.OPEN) {
         const gameData = {
+            game_id: liveGameId,
             game_type: currentGameType,
             score1: score[0],
             score2: score[1],
             player1: document.getElementById('name1').innerText,
             player2: document.getElementById('name2').innerText,
             is_finished: gameOver,
-            server: currentServer
+            server: currentServer,
+            ...teamPlayers()
         };
         
         websocket.send(JSON.stringify({
@@ -55,6 +75,31 @@ function sendGameUpdate() {
     }
 }
 
+// Составы команд парной игры (сервер сохраняет игру по ним)
+function teamPlayers() {
+    if (currentGameType !== 'double') return {};
+    const team = {};
+    ['team1_player1', 'team1_player2', 'team2_player1', 'team2_player2'].forEach(id => {
+        team[id] = document.getElementById(id)?.value || '';
+    });
+    return team;
+}
+
+// Ждет подтверждения сохранения игры через WebSocket; null — сохранить через HTTP
+function waitFinishAck(gameId) {
+    return new Promise(resolve => {
+        const timer = setTimeout(() => resolve(null), FINISH_ACK_TIMEOUT);
+        pendingFinish = {
+            gameId,
+            resolve: friendlyId => {
+                clearTimeout(timer);
+                pendingFinish = null;
+                resolve(friendlyId);
+            }
+        };
+    });
+}
+
 function toggleGameType() {
     const type = document.querySelector('input[name="game_type"]:checked')?.value || 'single';
     currentGameType = type;
@@ -114,6 +159,7 @@ function startGame() {
     score = [0, 0];
     gameOver = false;
     startTime = new Date().toISOString();
+    liveGameId = `${Date.now()}-${Math.random().toString(36).slice(2, 8)}`;
     updateTurn();
     initWebSocket();
     sendGameUpdate();
@@ -210,6 +256,8 @@ function finishGame() {
     }
     const winnerText = document.getElementById('winner').innerText.replace("Победитель: ", "");
     let payload = {
+        game_id: liveGameId,
+        club_id: clubId,
         game_type: currentGameType,
         score1: score[0],
         score2: score[1],
@@ -231,35 +279,47 @@ function finishGame() {
         payload.winning_team = (winnerText === team1Label) ? 1 : 2;
     }
     
-    // Отправить уведомление об окончании игры через WebSocket
+    // Отправить уведомление об окончании игры через WebSocket: сервер сохраняет игру сам
+    let saved = Promise.resolve(null);
     if (websocket && websocket.readyState === WebSocket.OPEN) {
+        saved = waitFinishAck(liveGameId);
         websocket.send(JSON.stringify({
             type: 'game_end',
             game_data: {
+                game_id: liveGameId,
                 game_type: currentGameType,
                 score1: score[0],
                 score2: score[1],
                 player1: document.getElementById('name1').innerText,
                 player2: document.getElementById('name2').innerText,
-                winner: winnerText
+                winner: winnerText,
+                ...teamPlayers()
             }
         }));
     }
-    
-    fetch("/api/save_friendly_game/", {
-        method: "POST",
-        headers: { "Content-Type": "application/json", "X-CSRFToken": getCSRFToken() },
-        body: JSON.stringify(payload)
-    })
-        .then(res => res.json())
-        .then(res => {
-            if (res.status === 'ok') {
-                alert('Игра успешно сохранена!');
-                location.reload();
-            } else {
-                alert('Ошибка при сохранении: ' + res.error);
-            }
-        });
+
+    saved.then(friendlyId => {
+        if (friendlyId) {
+            alert('Игра успешно сохранена!');
+            location.reload();
+            return;
+        }
+        // Нет подтверждения (нет сокета, нет прав или таймаут) — прежнее сохранение через HTTP
+        fetch("/api/save_friendly_game/", {
+            method: "POST",
+            headers: { "Content-Type": "application/json", "X-CSRFToken": getCSRFToken() },
+            body: JSON.stringify(payload)
+        })
+            .then(res => res.json())
+            .then(res => {
+                if (res.status === 'ok') {
+                    alert('Игра успешно сохранена!');
+                    location.reload();
+                } else {
+                    alert('Ошибка при сохранении: ' + res.error);
+                }
+            });
+    });
 }
 
 // Динамическое отключение уже выбранных игроков в парном режиме
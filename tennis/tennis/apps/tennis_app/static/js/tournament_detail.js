@@ -18,6 +18,59 @@ function initializeTournamentDetail() {
     initializeMatchesToggle();
     initializeModalHandlers();
     loadPlayersData();
+    initializeLiveScores();
+}
+
+/**
+ * Подписка на живой счет матчей турнира (WebSocket ws/tournament/<id>/)
+ */
+function initializeLiveScores() {
+    const liveEl = document.getElementById('tournament-live');
+    if (!liveEl || !window.WebSocket) return;
+    const tournamentId = liveEl.getAttribute('data-tournament-id');
+    const wsScheme = window.location.protocol === 'https:' ? 'wss' : 'ws';
+
+    function connect() {
+        const socket = new WebSocket(`${wsScheme}://${window.location.host}/ws/tournament/${tournamentId}/`);
+        socket.onmessage = function(e) {
+            const data = JSON.parse(e.data);
+            if (data.type === 'match_score') {
+                applyMatchScore(data);
+            }
+        };
+        socket.onclose = function() {
+            setTimeout(connect, 5000);
+        };
+    }
+    connect();
+}
+
+/**
+ * Обновление счета матча в матрице и в списке матчей
+ */
+function applyMatchScore(data) {
+    const [sets1, sets2] = data.sets;
+    const [player1Id] = data.players;
+
+    document.querySelectorAll(`.matrix-cell[data-match-id="${data.match_id}"]`).forEach(cell => {
+        const setsEl = cell.querySelector('.sets-score');
+        if (!setsEl) return;
+        // Ячейка показывает счет с точки зрения игрока строки
+        const rowIsPlayer1 = String(cell.getAttribute('data-player1')) === String(player1Id);
+        setsEl.textContent = rowIsPlayer1 ? `${sets1}:${sets2}` : `${sets2}:${sets1}`;
+    });
+
+    const item = document.querySelector(`.match-item[data-match-id="${data.match_id}"]`);
+    if (item) {
+        const setsEl = item.querySelector('.sets-score');
+        if (setsEl) {
+            setsEl.textContent = data.game ? `${sets1} - ${sets2} (${data.score[0]}:${data.score[1]})` : `${sets1} - ${sets2}`;
+        }
+        const statusEl = item.querySelector('.match-status');
+        if (statusEl && data.finished) {
+            statusEl.textContent = 'Завершен';
+        }
+    }
 }
 
 /**
@@ -0,0 +1,564 @@
+"""Поддержка денормализованной статистики игроков.
+
+PlayerStats и PlayerMonthlyStats пересчитываются точечно (только для затронутых
+игроков и месяцев) из сигналов в signals.py, поэтому чтение статистики на
+страницах — это выборка по первичному ключу. rebuild_all() и check_consistency()
+используются командой rebuild_player_stats.
+
+Рабочие расчеты идут по индексу участия PlayerParticipation; функции с
+суффиксом _from_games считают напрямую по Match/FriendlyGame и служат эталоном
+для сверки.
+"""
+from collections import Counter, defaultdict
+from datetime import datetime
+
+from django.db import connection, transaction
+from django.db.models import Count, F, Q
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import caching
+from .models import FriendlyGame, Match, Player, PlayerMonthlyStats, PlayerParticipation, PlayerStats
+from .models import insert_from_select, sql_names
+
+
+STATS_FIELDS = [
+    'matches', 'match_wins', 'match_losses',
+    'friendlies_single', 'single_wins', 'single_losses',
+    'friendlies_double', 'double_wins', 'double_losses',
+    'parties', 'parties_with_doubles', 'scored_points',
+]
+# Поля, которые считаются по индексу участия
+GAME_STATS_FIELDS = STATS_FIELDS[:9]
+MONTHLY_FIELDS = ['single_games', 'single_wins', 'single_losses', 'double_games', 'double_wins', 'double_losses']
+
+# Слоты парной игры в порядке, в котором get_monthly_stats определяет команду игрока
+DOUBLES_SLOTS = [('team1_player1', 1), ('team1_player2', 1), ('team2_player1', 2), ('team2_player2', 2)]
+
+
+# ------------------ Индекс участия ------------------
+
+def _won(result, mine):
+    return None if result is None else result == mine
+
+
+def participation_rows(source):
+    """Строки PlayerParticipation для матча или товарищеской игры (без сохранения)."""
+    common = {'source_id': source.pk, 'played_at': source.played_at}
+    if isinstance(source, Match):
+        common.update(source_type=PlayerParticipation.SOURCE_MATCH, game_type='single',
+                      club_id=source.tournament.club_id)
+        slots, result = ((1, source.player1_id), (2, source.player2_id)), source.winner_id
+    else:
+        common.update(source_type=PlayerParticipation.SOURCE_FRIENDLY, game_type=source.game_type,
+                      club_id=source.club_id)
+        if source.game_type == 'double':
+            slots = ((1, source.team1_player1_id), (1, source.team1_player2_id),
+                     (2, source.team2_player1_id), (2, source.team2_player2_id))
+            result = source.winning_team
+        else:
+            slots, result = ((1, source.player1_id), (2, source.player2_id)), source.winner_id
+    rows, seen = [], set()
+    for team, pid in slots:
+        # Игрок, по ошибке занявший несколько слотов, учитывается один раз (по первому слоту)
+        if pid is None or pid in seen:
+            continue
+        seen.add(pid)
+        mine = team if common['game_type'] == 'double' else pid
+        rows.append(PlayerParticipation(player_id=pid, team=team, won=_won(result, mine), **common))
+    return rows
+
+
+def _source_type(source):
+    return PlayerParticipation.SOURCE_MATCH if isinstance(source, Match) else PlayerParticipation.SOURCE_FRIENDLY
+
+
+def sync_participations(source):
+    """Приводит строки участия игры в соответствие с ее текущим состоянием."""
+    with transaction.atomic():
+        delete_participations(source)
+        PlayerParticipation.objects.bulk_create(participation_rows(source))
+
+
+def delete_participations(source):
+    PlayerParticipation.objects.filter(source_type=_source_type(source), source_id=source.pk).delete()
+
+
+def register_new_matches(tournament):
+    """Индекс участия и статистика для только что сгенерированных матчей турнира (сигналы не срабатывали).
+
+    Строки участия переносятся из матчей одним INSERT ... SELECT. Новые матчи
+    еще не сыграны, поэтому агрегаты не пересчитываются, а сдвигаются на
+    приращения, посчитанные по этим строкам: незавершенный матч — поражение в
+    PlayerStats и игра в помесячной статистике, bye — победа.
+    """
+    table, pk, player1, player2, winner, played_at, tournament_col = sql_names(
+        Match, 'id', 'player1', 'player2', 'winner', 'played_at', 'tournament')
+    # Игрок, по ошибке занявший оба слота, учитывается один раз, как в participation_rows
+    slots = [(1, player1, f'{player1} IS NOT NULL'),
+             (2, player2, f'{player2} IS NOT NULL AND ({player1} IS NULL OR {player2} <> {player1})')]
+    select_sql = ' UNION ALL '.join(
+        f'SELECT {column}, %s, {pk}, %s, {team}, '
+        f'CASE WHEN {winner} IS NULL THEN NULL WHEN {winner} = {column} THEN %s ELSE %s END, {played_at}, %s '
+        f'FROM {table} WHERE {tournament_col} = %s AND {condition}'
+        for team, column, condition in slots
+    )
+    params = [PlayerParticipation.SOURCE_MATCH, 'single', True, False, tournament.club_id, tournament.pk] * len(slots)
+
+    new_rows = PlayerParticipation.objects.filter(
+        source_type=PlayerParticipation.SOURCE_MATCH, source_id__in=tournament.matches.values('id'),
+    )
+    with transaction.atomic():
+        # Недостающие строки PlayerStats достраиваются по истории до новых матчей
+        ensure_player_stats(tournament.participants.select_related('stats_row'))
+        insert_from_select(PlayerParticipation,
+                           ['player', 'source_type', 'source_id', 'game_type', 'team', 'won', 'played_at', 'club'],
+                           select_sql, params)
+        # Группировка по самому played_at, без TruncMonth: у сгенерированных матчей
+        # моментов мало (у кругового — один), а месяц считается уже в Python
+        counts = new_rows.order_by().values('player_id', 'played_at').annotate(
+            games=Count('pk'), wins=Count('pk', filter=Q(won=True)), losses=Count('pk', filter=Q(won=False)),
+        ).values_list('player_id', 'played_at', 'games', 'wins', 'losses')
+        stats_deltas, monthly_deltas = defaultdict(Counter), defaultdict(Counter)
+        for pid, moment, games, wins, losses in counts:
+            local = timezone.localtime(moment)
+            # Незавершенный матч в PlayerStats — поражение, в помесячной — только игра
+            stats_deltas[pid].update(matches=games, match_wins=wins, match_losses=games - wins)
+            monthly_deltas[pid, local.year, local.month].update(
+                single_games=games, single_wins=wins, single_losses=losses)
+        _add_counters(stats_deltas, monthly_deltas)
+        caching.bump_many('player', stats_deltas)
+
+
+def _add_counters(stats_deltas, monthly_deltas):
+    """Прибавляет {игрок: Counter} к PlayerStats и {(игрок, год, месяц): Counter} к PlayerMonthlyStats.
+
+    Строки PlayerStats игроков должны существовать (см. ensure_player_stats).
+    Игроки с одинаковым приращением сдвигаются одним UPDATE через F():
+    в круговом турнире это один запрос на всех, и параллельные записи не теряются.
+    """
+    groups = defaultdict(list)
+    for pid, delta in stats_deltas.items():
+        groups[frozenset((+delta).items())].append(pid)
+    now = timezone.now()
+    for delta, pids in groups.items():
+        PlayerStats.objects.filter(player_id__in=pids).update(
+            updated_at=now, **{field: F(field) + value for field, value in delta},
+        )
+
+    # Недостающие помесячные строки создаются нулевыми, затем сдвигаются так же
+    PlayerMonthlyStats.objects.bulk_create(
+        [PlayerMonthlyStats(player_id=pid, year=year, month=month) for pid, year, month in monthly_deltas],
+        ignore_conflicts=True, batch_size=500,
+    )
+    groups = defaultdict(list)
+    for (pid, year, month), delta in monthly_deltas.items():
+        groups[year, month, frozenset((+delta).items())].append(pid)
+    for (year, month, delta), pids in groups.items():
+        PlayerMonthlyStats.objects.filter(player_id__in=pids, year=year, month=month).update(
+            **{field: F(field) + value for field, value in delta},
+        )
+
+
+def rebuild_participations():
+    with transaction.atomic():
+        PlayerParticipation.objects.all().delete()
+        rows = []
+        for match in Match.objects.select_related('tournament').iterator(chunk_size=500):
+            rows.extend(participation_rows(match))
+        for friendly in FriendlyGame.objects.iterator(chunk_size=500):
+            rows.extend(participation_rows(friendly))
+        PlayerParticipation.objects.bulk_create(rows, batch_size=500)
+
+
+# ------------------ Общая статистика ------------------
+
+def compute_player_stats(player_ids=None):
+    """Живой расчет строк PlayerStats (без сохранения). None — все игроки.
+
+    Игры, победы и поражения считаются одним группированным запросом по
+    индексу участия; партии и очки — подзапросами PlayerQuerySet.with_stats().
+    """
+    players = Player.objects.all()
+    participations = PlayerParticipation.objects.all()
+    if player_ids is not None:
+        players = players.filter(pk__in=player_ids)
+        participations = participations.filter(player_id__in=player_ids)
+
+    match = Q(source_type=PlayerParticipation.SOURCE_MATCH)
+    single = Q(source_type=PlayerParticipation.SOURCE_FRIENDLY, game_type='single')
+    double = Q(source_type=PlayerParticipation.SOURCE_FRIENDLY, game_type='double')
+    won, not_won = Q(won=True), Q(won=False) | Q(won__isnull=True)
+    counters = {
+        row['player_id']: row for row in participations.order_by().values('player_id').annotate(
+            matches=Count('pk', filter=match),
+            match_wins=Count('pk', filter=match & won),
+            # Как в get_stats(): незавершенный матч/одиночная игра считается поражением
+            match_losses=Count('pk', filter=match & not_won),
+            friendlies_single=Count('pk', filter=single),
+            single_wins=Count('pk', filter=single & won),
+            single_losses=Count('pk', filter=single & not_won),
+            friendlies_double=Count('pk', filter=double),
+            double_wins=Count('pk', filter=double & won),
+            double_losses=Count('pk', filter=double & Q(won=False)),
+        )
+    }
+    parties = dict(players.with_stats(include_doubles=False).values_list('pk', 'stats_total_parties'))
+    extra = players.with_stats(include_doubles=True).values_list('pk', 'stats_total_parties', 'stats_scored_points')
+    rows = {}
+    for pk, parties_with_doubles, scored_points in extra:
+        row = counters.get(pk, {})
+        rows[pk] = PlayerStats(
+            player_id=pk,
+            parties=parties.get(pk, 0),
+            parties_with_doubles=parties_with_doubles,
+            scored_points=scored_points,
+            **{field: row.get(field, 0) for field in GAME_STATS_FIELDS},
+        )
+    return rows
+
+
+def compute_player_stats_from_games(player_ids=None):
+    """Расчет строк PlayerStats одним запросом PlayerQuerySet.with_stats() (для сверки в check_consistency)."""
+    players = Player.objects.all()
+    if player_ids is not None:
+        players = players.filter(pk__in=player_ids)
+    parties = dict(players.with_stats(include_doubles=False).values_list('pk', 'stats_total_parties'))
+    rows = {}
+    for p in players.with_stats(include_doubles=True):
+        rows[p.pk] = PlayerStats(
+            player_id=p.pk,
+            matches=p.stats_matches,
+            match_wins=p.stats_match_wins,
+            match_losses=p.stats_match_losses,
+            friendlies_single=p.stats_friendlies_single,
+            single_wins=p.stats_single_wins,
+            single_losses=p.stats_single_losses,
+            friendlies_double=p.stats_friendlies_double,
+            double_wins=p.stats_double_wins,
+            double_losses=p.stats_double_losses,
+            parties=parties.get(p.pk, 0),
+            parties_with_doubles=p.stats_total_parties,
+            scored_points=p.stats_scored_points,
+        )
+    return rows
+
+
+def refresh_player_stats(player_ids):
+    """Пересчитывает и сохраняет PlayerStats указанных игроков. Возвращает {player_id: PlayerStats}.
+
+    Игрокам, чья строка создается впервые, помесячная статистика строится
+    целиком: вызывающий обычно пересчитывает только месяц новой игры, и
+    прежние месяцы иначе остались бы пустыми.
+    """
+    player_ids = set(player_ids) - {None}
+    if not player_ids:
+        return {}
+    with transaction.atomic():
+        existing = set(PlayerStats.objects.filter(player_id__in=player_ids).values_list('player_id', flat=True))
+        rows = compute_player_stats(player_ids)
+        PlayerStats.objects.bulk_create(
+            rows.values(), update_conflicts=True, unique_fields=['player'],
+            update_fields=STATS_FIELDS + ['updated_at'],
+        )
+        created = rows.keys() - existing
+        if created:
+            rebuild_monthly_stats(created)
+    return rows
+
+
+def add_scored_points(player_id, delta):
+    """Атомарно сдвигает счетчик набранных очков (создание/удаление Point)."""
+    PlayerStats.objects.filter(player_id=player_id).update(scored_points=F('scored_points') + delta)
+
+
+def ensure_player_stats(players):
+    """Возвращает {player_id: PlayerStats}, достраивая отсутствующие строки одним пакетом."""
+    rows, missing = {}, []
+    for player in players:
+        try:
+            rows[player.pk] = player.stats_row
+        except PlayerStats.DoesNotExist:
+            missing.append(player.pk)
+    if missing:
+        # Для новых строк помесячная статистика строится тут же (refresh_player_stats)
+        rows.update(refresh_player_stats(missing))
+    return rows
+
+
+def player_stats_map(players, include_doubles=True):
+    """{player_id: dict в формате get_stats()} из PlayerStats."""
+    return {pk: row.as_dict(include_doubles) for pk, row in ensure_player_stats(players).items()}
+
+
+# ------------------ Помесячная статистика ------------------
+
+def _month_start(year, month):
+    return timezone.make_aware(datetime(year, month, 1))
+
+
+def _next_month_start(year, month):
+    return _month_start(year + month // 12, month % 12 + 1)
+
+
+def _slot_counts(queryset, slot, win_q, loss_q):
+    return (
+        queryset.order_by()
+        .values(slot, bucket=TruncMonth('played_at'))
+        .annotate(games=Count('pk'), wins=Count('pk', filter=win_q), losses=Count('pk', filter=loss_q))
+        .values_list(slot, 'bucket', 'games', 'wins', 'losses')
+    )
+
+
+def monthly_buckets(player_ids=None, start=None, end=None):
+    """Группированный подсчет игр/побед/поражений по (игрок, год, месяц).
+
+    Возвращает {(player_id, year, month): [single_games, single_wins, single_losses,
+    double_games, double_wins, double_losses]}. Один запрос по индексу участия.
+    """
+    qs = PlayerParticipation.objects.all()
+    if player_ids is not None:
+        qs = qs.filter(player_id__in=player_ids)
+    if start is not None:
+        qs = qs.filter(played_at__gte=start)
+    if end is not None:
+        qs = qs.filter(played_at__lt=end)
+    rows = qs.order_by().values('player_id', 'game_type', bucket=TruncMonth('played_at')).annotate(
+        games=Count('pk'), wins=Count('pk', filter=Q(won=True)), losses=Count('pk', filter=Q(won=False)),
+    ).values_list('player_id', 'game_type', 'bucket', 'games', 'wins', 'losses')
+
+    buckets = defaultdict(lambda: [0] * len(MONTHLY_FIELDS))
+    for pid, game_type, bucket, games, wins, losses in rows:
+        offset = 3 if game_type == 'double' else 0
+        counters = buckets[(pid, bucket.year, bucket.month)]
+        counters[offset] += games
+        counters[offset + 1] += wins
+        counters[offset + 2] += losses
+    return buckets
+
+
+def monthly_buckets_from_games(player_ids=None, start=None, end=None):
+    """Эталон monthly_buckets() по таблицам игр, со сдвигом по каждому слоту.
+
+    Каждая игра учитывается у игрока один раз, даже если он по ошибке занимает
+    несколько слотов.
+    """
+    buckets = defaultdict(lambda: [0] * len(MONTHLY_FIELDS))
+
+    def scope(qs, slot):
+        qs = qs.filter(**{f'{slot}__isnull': False})
+        if player_ids is not None:
+            qs = qs.filter(**{f'{slot}__in': player_ids})
+        if start is not None:
+            qs = qs.filter(played_at__gte=start)
+        if end is not None:
+            qs = qs.filter(played_at__lt=end)
+        return qs
+
+    def collect(rows, offset):
+        for pid, bucket, games, wins, losses in rows:
+            counters = buckets[(pid, bucket.year, bucket.month)]
+            counters[offset] += games
+            counters[offset + 1] += wins
+            counters[offset + 2] += losses
+
+    singles = [Match.objects.all(), FriendlyGame.objects.filter(game_type='single')]
+    for qs in singles:
+        for slot, other in (('player1', None), ('player2', 'player1')):
+            slot_qs = scope(qs, slot)
+            if other:
+                slot_qs = slot_qs.exclude(**{other: F(slot)})
+            collect(_slot_counts(
+                slot_qs, slot,
+                Q(winner=F(slot)),
+                Q(winner__isnull=False) & ~Q(winner=F(slot)),
+            ), 0)
+
+    doubles = FriendlyGame.objects.filter(game_type='double')
+    for idx, (slot, team) in enumerate(DOUBLES_SLOTS):
+        slot_qs = scope(doubles, slot)
+        for earlier, _ in DOUBLES_SLOTS[:idx]:
+            slot_qs = slot_qs.exclude(**{earlier: F(slot)})
+        collect(_slot_counts(
+            slot_qs, slot,
+            Q(winning_team=team),
+            Q(winning_team__isnull=False) & ~Q(winning_team=team),
+        ), 3)
+    return buckets
+
+
+def _monthly_rows(buckets):
+    return [
+        PlayerMonthlyStats(player_id=pid, year=year, month=month, **dict(zip(MONTHLY_FIELDS, counters)))
+        for (pid, year, month), counters in buckets.items()
+    ]
+
+
+def refresh_monthly_stats(player_ids, months):
+    """Пересчитывает PlayerMonthlyStats для игроков в указанных (год, месяц)."""
+    player_ids = set(player_ids) - {None}
+    if not player_ids or not months:
+        return
+    with transaction.atomic():
+        for year, month in set(months):
+            buckets = monthly_buckets(player_ids, _month_start(year, month), _next_month_start(year, month))
+            PlayerMonthlyStats.objects.filter(player_id__in=player_ids, year=year, month=month).delete()
+            PlayerMonthlyStats.objects.bulk_create(_monthly_rows(buckets))
+
+
+def rebuild_monthly_stats(player_ids=None):
+    """Полностью пересобирает помесячную статистику игроков (None — всех)."""
+    with transaction.atomic():
+        rows = PlayerMonthlyStats.objects.all()
+        if player_ids is not None:
+            rows = rows.filter(player_id__in=player_ids)
+        rows.delete()
+        PlayerMonthlyStats.objects.bulk_create(_monthly_rows(monthly_buckets(player_ids)), batch_size=500)
+
+
+def iter_months(first, last):
+    """Месяцы (год, месяц) от first до last включительно."""
+    year, month = first
+    while (year, month) <= tuple(last):
+        yield year, month
+        year, month = (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def monthly_series(counters_by_month, first, last, include_doubles=True):
+    """Ряд для графика: по записи на каждый месяц диапазона, включая пустые.
+
+    counters_by_month — {(год, месяц): счетчики в порядке MONTHLY_FIELDS}.
+    """
+    result = []
+    for year, month in iter_months(first, last):
+        games, wins, losses, d_games, d_wins, d_losses = counters_by_month.get((year, month), (0,) * 6)
+        if include_doubles:
+            games, wins, losses = games + d_games, wins + d_wins, losses + d_losses
+        completed = wins + losses
+        result.append({
+            'year': year,
+            'month': month,
+            'month_name': datetime(year, month, 1).strftime('%B'),
+            'total_games': games,
+            'wins': wins,
+            'losses': losses,
+            'win_percent': round((wins / completed) * 100, 1) if completed else 0,
+        })
+    return result
+
+
+def live_monthly_stats(player_id, first, last, include_doubles=True):
+    """Помесячная статистика по индексу участия (группировка на стороне БД)."""
+    buckets = monthly_buckets([player_id], _month_start(*first), _next_month_start(*last))
+    counters = {(year, month): values for (_, year, month), values in buckets.items()}
+    return monthly_series(counters, first, last, include_doubles)
+
+
+def first_recorded_month(player):
+    """Первый месяц, в котором у игрока есть игры (по PlayerMonthlyStats), или None."""
+    ensure_player_stats([player])
+    return PlayerMonthlyStats.objects.filter(player=player).order_by('year', 'month').values_list('year', 'month').first()
+
+
+@caching.versioned('monthly_stats', lambda player, first, last, include_doubles=True: (
+    [('player', player.pk)], (tuple(first), tuple(last), include_doubles)))
+def monthly_stats_from_table(player, first, last, include_doubles=True):
+    """То же, что live_monthly_stats, но из PlayerMonthlyStats."""
+    ensure_player_stats([player])
+    rows = PlayerMonthlyStats.objects.filter(player=player, year__gte=first[0], year__lte=last[0]).values_list(
+        'year', 'month', *MONTHLY_FIELDS
+    )
+    counters = {(row[0], row[1]): row[2:] for row in rows}
+    return monthly_series(counters, first, last, include_doubles)
+
+
+# ------------------ Пересборка и сверка ------------------
+
+def rebuild_all():
+    with transaction.atomic():
+        rebuild_participations()
+        PlayerStats.objects.all().delete()
+        PlayerStats.objects.bulk_create(compute_player_stats().values(), batch_size=500)
+        rebuild_monthly_stats()
+        # Пересборка нужна после правок в обход сигналов — кэш игроков тоже мог устареть
+        caching.bump_many('player', Player.objects.values_list('pk', flat=True))
+
+
+def check_consistency():
+    """Сравнивает сохраненные агрегаты с расчетом по таблицам игр. Возвращает список расхождений."""
+    problems = []
+    stored = {row.player_id: row for row in PlayerStats.objects.all()}
+    for pid, live in compute_player_stats_from_games().items():
+        row = stored.get(pid)
+        if row is None:
+            problems.append(f'player={pid}: нет строки PlayerStats')
+            continue
+        for field in STATS_FIELDS:
+            if getattr(row, field) != getattr(live, field):
+                problems.append(f'player={pid} {field}: {getattr(row, field)} != {getattr(live, field)}')
+
+    stored_monthly = {
+        (row.player_id, row.year, row.month): [getattr(row, f) for f in MONTHLY_FIELDS]
+        for row in PlayerMonthlyStats.objects.all()
+    }
+    live_monthly = {key: list(value) for key, value in monthly_buckets_from_games().items()}
+    for key in sorted(set(stored_monthly) | set(live_monthly)):
+        zero = [0] * len(MONTHLY_FIELDS)
+        if stored_monthly.get(key, zero) != live_monthly.get(key, zero):
+            problems.append(f'player={key[0]} {key[1]}-{key[2]:02d}: {stored_monthly.get(key)} != {live_monthly.get(key)}')
+    return problems
+
+
+# ------------------ Взаимные встречи ------------------
+
+def head_to_head(player, opponents, include_doubles=False):
+    """Строки H2H для player_detail за один проход по играм игрока.
+
+    Двумя запросами к индексу участия берутся игры игрока и все остальные
+    участники этих игр, затем они раскладываются по соперникам в памяти.
+    Соперник — участник другой стороны (в парной игре оба игрока другой
+    команды). Сортировка — по числу игр, затем по имени.
+    """
+    rows = {opp.pk: {'opponent': opp, 'games': 0, 'wins': 0, 'completed': 0} for opp in opponents}
+
+    mine = PlayerParticipation.objects.filter(player=player)
+    if not include_doubles:
+        mine = mine.exclude(game_type='double')
+    my_games = {
+        (source_type, source_id): (team, won)
+        for source_type, source_id, team, won in mine.values_list('source_type', 'source_id', 'team', 'won')
+    }
+    sources = Q()
+    for source_type, _ in PlayerParticipation.SOURCE_TYPES:
+        ids = mine.filter(source_type=source_type).values('source_id')
+        sources |= Q(source_type=source_type, source_id__in=ids)
+    others = PlayerParticipation.objects.filter(sources).exclude(player=player).values_list(
+        'source_type', 'source_id', 'player_id', 'team'
+    )
+    for source_type, source_id, opp_id, team in others:
+        my_team, won = my_games[(source_type, source_id)]
+        row = rows.get(opp_id)
+        if row is None or team == my_team:
+            continue
+        row['games'] += 1
+        if won is not None:
+            row['completed'] += 1
+            if won:
+                row['wins'] += 1
+
+    h2h_rows = []
+    for row in rows.values():
+        completed = row.pop('completed')
+        row['losses'] = completed - row['wins']
+        row['win_pct'] = round((row['wins'] / completed) * 100, 1) if completed else 0
+        h2h_rows.append(row)
+    h2h_rows.sort(key=lambda r: (-r['games'], r['opponent'].full_name.lower()))
+    return h2h_rows
+
+
+@caching.versioned('club_head_to_head', lambda player, include_doubles=False: (
+    [('player', player.pk), ('club', player.club_id)], include_doubles))
+def club_head_to_head(player, include_doubles=False):
+    """head_to_head против всех остальных игроков клуба (страница игрока)."""
+    opponents = Player.objects.filter(club_id=player.club_id).exclude(pk=player.pk).order_by('full_name')
+    return head_to_head(player, opponents, include_doubles=include_doubles)
@@ -1,6 +1,19 @@
-from django.test import TestCase
+import json
+import os
+from datetime import timedelta
+import unittest
+from unittest import mock
+from django.conf import settings
+from django.test import TestCase, override_settings
 from django.contrib.auth.models import User
-from .models import Club, Player, Tournament, Match, Game, Point, ClubAdminInvite, ClubAdmin, ClubMembership
+from io import StringIO
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from .models import Club, Player, Tournament, Match, Game, Point, ClubAdminInvite, ClubAdmin, ClubMembership, FriendlyGame, PlayerStats, PlayerMonthlyStats, PlayerParticipation, Standing
+from . import live, stats
+from .management.commands import redis_standin
 from django.utils import timezone
 
 class MatchLogicTestCase(TestCase):
@@ -125,6 +138,8 @@ class MatchViewTestCase(TestCase):
             player1=self.player1,
             player2=self.player2
         )
+        live.reset()
+        self.addCleanup(live.reset)
 
     def test_live_match_page_loads(self):
         """Тест загрузки страницы live-матча"""
@@ -188,3 +203,1439 @@ class MultiAdminTestCase(TestCase):
         self.client.login(username='user3', password='pass3')
         resp2 = self.client.get(f'/club/{self.club.id}/')
         self.assertContains(resp2, 'Вы не администратор клуба')
+
+
+class SeededClubMixin:
+    """Клуб с турнирными матчами, одиночными и парными товарищескими играми."""
+
+    def seed_club(self):
+        self.club = Club.objects.create(name='Seeded Club')
+        self.other_club = Club.objects.create(name='Other Club')
+        self.players = [Player.objects.create(full_name=f'Игрок {i}', club=self.club) for i in range(6)]
+        self.outsider = Player.objects.create(full_name='Чужой', club=self.other_club)
+        a, b, c, d, e, f = self.players
+        self.tournament = Tournament.objects.create(club=self.club, name='Seeded Cup', start_date='2025-01-01')
+        # Турнирные матчи: завершенные и незавершенные
+        for p1, p2, winner in [(a, b, a), (a, c, c), (b, c, None), (d, e, e), (a, d, None), (f, a, f)]:
+            match = Match.objects.create(tournament=self.tournament, player1=p1, player2=p2, winner=winner,
+                                         finished=winner is not None)
+            game = Game.objects.create(match=match)
+            for order, scorer in enumerate([p1, p2, p1], start=1):
+                Point.objects.create(game=game, scored_by=scorer, order=order)
+            game.recalculate_score()
+        # Одиночные товарищеские
+        for p1, p2, winner in [(a, b, b), (b, a, b), (c, d, None), (a, e, a)]:
+            friendly = FriendlyGame.objects.create(club=self.club, game_type='single', player1=p1, player2=p2,
+                                                   winner=winner, score_team1=11, score_team2=7)
+            Game.objects.create(friendly=friendly, score_player1=11, score_player2=7)
+        # Парные товарищеские (player1/player2 дублируют первых игроков команд)
+        for t1, t2, winning_team in [((a, b), (c, d), 1), ((c, a), (e, f), 2), ((b, e), (a, f), None), ((d, f), (b, c), 2)]:
+            friendly = FriendlyGame.objects.create(
+                club=self.club, game_type='double', player1=t1[0], player2=t2[0],
+                team1_player1=t1[0], team1_player2=t1[1], team2_player1=t2[0], team2_player2=t2[1],
+                winning_team=winning_team, score_team1=11, score_team2=9,
+            )
+            Game.objects.create(friendly=friendly, score_player1=11, score_player2=9)
+
+
+class PlayerBulkStatsTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+
+    def test_get_stats_matches_games(self):
+        reference = stats.compute_player_stats_from_games()
+        for player in self.players:
+            for include_doubles in (True, False):
+                self.assertEqual(
+                    player.get_stats(include_doubles=include_doubles), reference[player.pk].as_dict(include_doubles),
+                    f'{player} include_doubles={include_doubles}'
+                )
+
+    def test_with_stats_single_query(self):
+        with self.assertNumQueries(1):
+            players = list(Player.objects.filter(club=self.club).with_stats())
+        self.assertEqual(len(players), len(self.players))
+
+    def test_club_detail_query_count_independent_of_roster(self):
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(f'/club/{self.club.id}/')
+        for i in range(10):
+            Player.objects.create(full_name=f'Новичок {i}', club=self.club)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.client.get(f'/club/{self.club.id}/')
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class PlayerStatsAggregateTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+
+    def assertAggregatesMatchLive(self):
+        year = timezone.now().year
+        for player in Player.objects.select_related('stats_row'):
+            for include_doubles in (True, False):
+                self.assertEqual(player.get_stats(include_doubles=include_doubles),
+                                 stats.compute_player_stats([player.pk])[player.pk].as_dict(include_doubles))
+                self.assertEqual(
+                    player.get_monthly_stats(year, include_doubles=include_doubles),
+                    stats.live_monthly_stats(player.pk, (year, 1), (year, 12), include_doubles),
+                )
+        self.assertEqual(stats.check_consistency(), [])
+
+    def test_aggregates_follow_writes(self):
+        self.assertAggregatesMatchLive()
+        a, b, c = self.players[:3]
+        match = Match.objects.get(player1=b, player2=c)
+        match.set_winner(c)
+        game = Game.objects.filter(match=match).first()
+        point = Point.objects.create(game=game, scored_by=b, order=10)
+        self.assertAggregatesMatchLive()
+        point.delete()
+        FriendlyGame.objects.filter(game_type='double', winning_team__isnull=True).update(winning_team=1)
+        stats.rebuild_all()
+        self.assertAggregatesMatchLive()
+
+    def test_live_points_update_scored_points(self):
+        live.reset()
+        self.addCleanup(live.reset)
+        user = User.objects.create_user(username='ref', password='pass')
+        ClubAdmin.objects.create(user=user, club=self.club)
+        self.client.login(username='ref', password='pass')
+        match = Match.objects.create(tournament=self.tournament, player1=self.players[0], player2=self.players[1])
+        url = f'/match/{match.id}/play/'
+        self.client.post(url, {'action': 'start_set'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.post(url, {'action': 'p1'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.post(url, {'action': 'p2'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.client.post(url, {'action': 'undo_p2'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+        self.assertAggregatesMatchLive()
+
+    def test_rebuild_command_check(self):
+        PlayerStats.objects.filter(player=self.players[0]).update(scored_points=999)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_player_stats', '--check', stdout=StringIO())
+        call_command('rebuild_player_stats', stdout=StringIO())
+        call_command('rebuild_player_stats', '--check', stdout=StringIO())
+
+    def drop_aggregates_with_history(self):
+        """Состояние после 0007: таблицы агрегатов пусты, часть игр — в прошлом году."""
+        past = timezone.now() - timedelta(days=400)
+        Match.objects.filter(player1=self.players[0]).update(played_at=past)
+        stats.rebuild_all()
+        PlayerStats.objects.all().delete()
+        PlayerMonthlyStats.objects.all().delete()
+
+    def test_first_new_result_keeps_earlier_months(self):
+        self.drop_aggregates_with_history()
+        a, b = self.players[:2]
+        FriendlyGame.objects.create(club=self.club, game_type='single', player1=a, player2=b, winner=a)
+        stored = {
+            (row.player_id, row.year, row.month): [getattr(row, field) for field in stats.MONTHLY_FIELDS]
+            for row in PlayerMonthlyStats.objects.filter(player__in=[a, b])
+        }
+        self.assertEqual(stored, {key: list(value) for key, value in stats.monthly_buckets_from_games([a.pk, b.pk]).items()})
+
+    def test_migration_backfills_aggregates(self):
+        from importlib import import_module
+        from django.apps import apps
+        self.drop_aggregates_with_history()
+        import_module('tennis_app.migrations.0015_backfill_player_stats').backfill_player_stats(apps, None)
+        self.assertEqual(stats.check_consistency(), [])
+
+
+def legacy_h2h_row(player, opp, include_doubles):
+    """Прежний расчет строки H2H запросами COUNT — эталон для stats.head_to_head."""
+    from django.db.models import Q
+    matches = Match.objects.filter(Q(player1__in=[player, opp]) & Q(player2__in=[player, opp]))
+    single = FriendlyGame.objects.filter(game_type='single').filter(
+        (Q(player1=player) & Q(player2=opp)) | (Q(player1=opp) & Q(player2=player)))
+    double = FriendlyGame.objects.none()
+    if include_doubles:
+        double = FriendlyGame.objects.filter(game_type='double').filter(
+            ((Q(team1_player1=player) | Q(team1_player2=player)) & (Q(team2_player1=opp) | Q(team2_player2=opp))) |
+            ((Q(team2_player1=player) | Q(team2_player2=player)) & (Q(team1_player1=opp) | Q(team1_player2=opp))))
+    finished = [matches.exclude(winner__isnull=True), single.exclude(winner__isnull=True), double.exclude(winning_team__isnull=True)]
+    completed = sum(qs.count() for qs in finished)
+    wins = finished[0].filter(winner=player).count() + finished[1].filter(winner=player).count()
+    wins += finished[2].filter(
+        ((Q(team1_player1=player) | Q(team1_player2=player)) & Q(winning_team=1)) |
+        ((Q(team2_player1=player) | Q(team2_player2=player)) & Q(winning_team=2))).count()
+    return {
+        'opponent': opp,
+        'games': matches.count() + single.count() + double.count(),
+        'wins': wins,
+        'losses': completed - wins,
+        'win_pct': round((wins / completed) * 100, 1) if completed else 0,
+    }
+
+
+class HeadToHeadTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+
+    def test_matches_legacy_rows(self):
+        for player in self.players:
+            opponents = Player.objects.filter(club=self.club).exclude(id=player.id).order_by('full_name')
+            for include_doubles in (True, False):
+                expected = [legacy_h2h_row(player, opp, include_doubles) for opp in opponents]
+                expected.sort(key=lambda r: (-r['games'], r['opponent'].full_name.lower()))
+                self.assertEqual(stats.head_to_head(player, opponents, include_doubles), expected)
+
+    def test_player_detail_query_count_independent_of_club_size(self):
+        url = f'/player/{self.players[0].id}/?include_doubles=true'
+        with CaptureQueriesContext(connection) as small:
+            self.client.get(url)
+        for i in range(10):
+            Player.objects.create(full_name=f'Новичок {i}', club=self.club)
+        with CaptureQueriesContext(connection) as large:
+            resp = self.client.get(url)
+        self.assertEqual(resp.status_code, 200)
+        self.assertEqual(len(small.captured_queries), len(large.captured_queries))
+
+
+class MonthlyStatsRangeTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+        self.year = timezone.now().year
+        # Часть игр переносим на два года назад
+        past = timezone.now().replace(year=self.year - 2, month=3, day=15)
+        Match.objects.filter(player1=self.players[0]).update(played_at=past)
+        FriendlyGame.objects.filter(game_type='double', winning_team=1).update(played_at=past)
+        stats.rebuild_all()
+
+    def test_get_monthly_stats_query_count_independent_of_games(self):
+        player = self.players[0]
+        with CaptureQueriesContext(connection) as before:
+            player.get_monthly_stats(self.year)
+        for _ in range(5):
+            FriendlyGame.objects.create(club=self.club, game_type='single', player1=player, player2=self.players[1], winner=player)
+        with CaptureQueriesContext(connection) as after:
+            player.get_monthly_stats(self.year)
+        self.assertEqual(len(before.captured_queries), len(after.captured_queries))
+
+    def test_range_endpoint_spans_years(self):
+        player = self.players[0]
+        resp = self.client.get(f'/api/player/{player.id}/monthly_stats/', {
+            'from': f'{self.year - 2}-01', 'to': f'{self.year}-12', 'include_doubles': 'true',
+        })
+        self.assertEqual(resp.status_code, 200)
+        data = resp.json()
+        expected = []
+        for year in range(self.year - 2, self.year + 1):
+            expected += player.get_monthly_stats(year, include_doubles=True)
+        self.assertEqual(data['monthly_stats'], expected)
+        self.assertEqual(len(data['monthly_stats']), 36)
+
+    def test_career_range_starts_at_first_game_year(self):
+        resp = self.client.get(f'/api/player/{self.players[0].id}/monthly_stats/', {'to': f'{self.year}-12'})
+        data = resp.json()
+        self.assertEqual(data['from'], f'{self.year - 2}-01')
+        self.assertEqual(data['to'], f'{self.year}-12')
+
+    def test_legacy_year_parameter_and_bad_range(self):
+        player = self.players[1]
+        resp = self.client.get(f'/api/player/{player.id}/monthly_stats/', {'year': self.year})
+        self.assertEqual(resp.json()['year'], self.year)
+        self.assertEqual(resp.json()['monthly_stats'], player.get_monthly_stats(self.year, include_doubles=False))
+        resp = self.client.get(f'/api/player/{player.id}/monthly_stats/', {'from': '2025-13', 'to': '2025-12'})
+        self.assertEqual(resp.status_code, 400)
+
+
+class PlayerParticipationTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+
+    def snapshot(self):
+        return sorted(PlayerParticipation.objects.values_list(
+            'player_id', 'source_type', 'source_id', 'game_type', 'team', 'won', 'played_at', 'club_id'))
+
+    def test_rows_follow_writes(self):
+        a, b, c, d = self.players[:4]
+        Match.objects.get(player1=b, player2=c).set_winner(b)
+        friendly = FriendlyGame.objects.get(game_type='double', team1_player1=a, team1_player2=b)
+        friendly.team2_player2 = self.players[5]
+        friendly.winning_team = 2
+        friendly.save()
+        FriendlyGame.objects.filter(game_type='single', player1=c).delete()
+        live = self.snapshot()
+        stats.rebuild_participations()
+        self.assertEqual(live, self.snapshot())
+        self.assertEqual(stats.check_consistency(), [])
+
+    def test_doubles_rows_use_team_slots(self):
+        friendly = FriendlyGame.objects.get(game_type='double', team1_player1=self.players[2], team1_player2=self.players[0])
+        rows = dict(PlayerParticipation.objects.filter(source_type='friendly', source_id=friendly.id).values_list('player_id', 'won'))
+        self.assertEqual(rows, {self.players[2].id: False, self.players[0].id: False, self.players[4].id: True, self.players[5].id: True})
+
+    def test_game_history_lists_every_game(self):
+        from django.db.models import Q
+        player = self.players[0]
+        expected = (
+            Match.objects.filter(Q(player1=player) | Q(player2=player)).count() +
+            FriendlyGame.objects.filter(game_type='single').filter(Q(player1=player) | Q(player2=player)).count() +
+            FriendlyGame.objects.filter(game_type='double').filter(
+                Q(team1_player1=player) | Q(team1_player2=player) | Q(team2_player1=player) | Q(team2_player2=player)).count()
+        )
+        resp = self.client.get(f'/player/{player.id}/')
+        page = resp.context['games_page']
+        self.assertEqual(page['total'], expected)
+        self.assertEqual(len(page['entries']), min(expected, 10))
+        dates = [game['date'] for game in page['entries']]
+        self.assertEqual(dates, sorted(dates, reverse=True))
+
+    def test_game_history_keyset_pages(self):
+        from .views import history_page
+        player = self.players[0]
+        # Одинаковое время у нескольких игр: порядок между ними решает id
+        player.participations.filter(source_type='friendly').update(played_at=timezone.now())
+        expected = list(player.participations.order_by('-played_at', '-id').values_list('id', flat=True))
+        self.assertGreater(len(expected), 3)
+
+        pages, cursor = [], None
+        while True:
+            with CaptureQueriesContext(connection) as queries:
+                page = history_page(player, before=cursor, size=3)
+            self.assertLessEqual(len(queries), 3)  # записи индекса + матчи + товарищеские страницы
+            pages.append(page)
+            cursor = page['older']
+            if cursor is None:
+                break
+        seen = [len(page['entries']) for page in pages]
+        self.assertEqual(sum(seen), len(expected))
+        self.assertIsNone(pages[0]['newer'])
+
+        # Назад от последней страницы — та же предпоследняя
+        back = history_page(player, after=pages[-1]['newer'], size=3)
+        self.assertEqual(back['entries'], pages[-2]['entries'])
+        self.assertEqual(history_page(player, after=pages[1]['newer'], size=3)['entries'], pages[0]['entries'])
+
+
+class QueryPlanTestCase(SeededClubMixin, TestCase):
+    """Горячие запросы не должны превращаться в полный просмотр таблицы (SQLite EXPLAIN QUERY PLAN)."""
+
+    def setUp(self):
+        self.seed_club()
+
+    def plans(self, action):
+        with CaptureQueriesContext(connection) as ctx:
+            action()
+        selects = [q['sql'] for q in ctx.captured_queries if q['sql'].lstrip().upper().startswith('SELECT')]
+        self.assertTrue(selects)
+        with connection.cursor() as cursor:
+            for sql in selects:
+                cursor.execute('EXPLAIN QUERY PLAN ' + sql)
+                yield sql, [row[-1] for row in cursor.fetchall()]
+
+    def assertNoFullScan(self, action):
+        for sql, plan in self.plans(action):
+            full_scans = [step for step in plan if step.startswith('SCAN') and 'INDEX' not in step]
+            self.assertEqual(full_scans, [], f'{sql}\n{plan}')
+
+    def test_game_score_recount(self):
+        game = Game.objects.filter(match__isnull=False).first()
+        self.assertNoFullScan(game.recalculate_score)
+
+    def test_undo_last_point(self):
+        game = Game.objects.filter(match__isnull=False).first()
+        self.assertNoFullScan(lambda: game.points.filter(scored_by=game.match.player1).order_by('-order').first())
+
+    def test_current_and_completed_games(self):
+        match = Match.objects.first()
+        self.assertNoFullScan(lambda: (match.get_current_game(), list(match.get_completed_games())))
+
+    def test_duplicate_match_check(self):
+        a, b = self.players[:2]
+        self.assertNoFullScan(lambda: Match.objects.filter(
+            tournament=self.tournament, player1__in=[a, b], player2__in=[a, b]).first())
+
+    def test_friendlies_by_type_and_date(self):
+        year = timezone.now().year
+        self.assertNoFullScan(lambda: list(FriendlyGame.objects.filter(game_type='single', played_at__year=year)))
+
+    def test_doubles_by_team_slots(self):
+        from django.db.models import Q
+        p = self.players[0]
+        self.assertNoFullScan(lambda: FriendlyGame.objects.filter(game_type='double').filter(
+            Q(team1_player1=p) | Q(team1_player2=p) | Q(team2_player1=p) | Q(team2_player2=p)).count())
+
+    def test_participation_reads(self):
+        player = self.players[0]
+        opponents = Player.objects.filter(club=self.club).exclude(id=player.id)
+        self.assertNoFullScan(lambda: stats.head_to_head(player, list(opponents), include_doubles=True))
+        self.assertNoFullScan(lambda: list(player.participations.order_by('-played_at', '-id')[:10]))
+        year = timezone.now().year
+        self.assertNoFullScan(lambda: stats.live_monthly_stats(player.pk, (year, 1), (year, 12)))
+
+    def test_with_stats_searches_only(self):
+        # Даже перебор индекса целиком (SCAN ... USING INDEX) на игрока — это проход по всем партиям
+        for include_doubles in (True, False):
+            for sql, plan in self.plans(lambda: list(Player.objects.filter(club=self.club).with_stats(include_doubles))):
+                self.assertEqual([step for step in plan if step.startswith('SCAN')], [], f'{sql}\n{plan}')
+
+
+class LiveScoringTestCase(SeededClubMixin, TestCase):
+    """Счет в памяти: очки пишутся пакетами, состояние восстанавливается из БД."""
+
+    def setUp(self):
+        self.seed_club()
+        live.reset()
+        self.addCleanup(live.reset)
+        user = User.objects.create_user(username='ref', password='pass')
+        ClubAdmin.objects.create(user=user, club=self.club)
+        self.client.login(username='ref', password='pass')
+        self.match = Match.objects.create(tournament=self.tournament, player1=self.players[0], player2=self.players[1])
+        self.url = f'/match/{self.match.id}/play/'
+
+    def post(self, action):
+        return self.client.post(self.url, {'action': action}, HTTP_X_REQUESTED_WITH='XMLHttpRequest').json()
+
+    def test_points_are_written_in_batches(self):
+        self.post('start_set')
+        game = self.match.get_current_game()
+        with self.settings(LIVE_SCORING_BATCH_SIZE=3, LIVE_SCORING_FLUSH_SECONDS=3600):
+            self.assertEqual(self.post('p1')['score'], [1, 0])
+            self.assertEqual(self.post('p2')['score'], [1, 1])
+            self.assertEqual(game.points.count(), 0)
+            self.assertEqual(self.post('undo_p2')['score'], [1, 0])
+            self.post('p1')
+            self.post('p1')
+            self.assertEqual(game.points.count(), 3)
+            game.refresh_from_db()
+            self.assertEqual((game.score_player1, game.score_player2), (3, 0))
+            self.post('p2')
+            # Страница дописывает ожидающие очки перед отрисовкой
+            self.client.get(self.url)
+            self.assertEqual(game.points.count(), 4)
+        self.assertEqual(stats.check_consistency(), [])
+
+    def test_state_recovers_from_db(self):
+        self.post('start_set')
+        for _ in range(7):
+            self.post('p1')
+        live.flush_all()
+        live.reset()
+        self.addCleanup(live.reset)
+        data = self.post('p2')
+        self.assertEqual(data['score'], [7, 1])
+        undo = self.post('undo_p1')
+        self.assertEqual(undo['score'], [6, 1])
+        game = self.match.get_current_game()
+        self.assertEqual(game.points.filter(scored_by=self.players[0]).count(), 6)
+
+    def test_match_played_to_the_end(self):
+        for _ in range(2):
+            self.post('start_set')
+            for _ in range(10):
+                self.post('p1')
+            data = self.post('p1')
+            self.assertTrue(data['set_finished'])
+        self.assertTrue(data['match_finished'])
+        self.match.refresh_from_db()
+        self.assertEqual((self.match.sets_player1, self.match.sets_player2), (2, 0))
+        self.assertEqual(self.match.winner, self.players[0])
+        for game in self.match.games.all():
+            self.assertEqual(game.points.count(), 11)
+            self.assertEqual(game.score_player1, 11)
+            self.assertIsNotNone(game.end_time)
+        self.assertEqual(stats.check_consistency(), [])
+
+
+class ScoreCountersTestCase(SeededClubMixin, TestCase):
+    """Счетчики партии ведутся F-инкрементами и всегда равны числу очков."""
+
+    def setUp(self):
+        self.seed_club()
+
+    def assertCountersMatchPoints(self):
+        for game in Game.objects.select_related('match', 'friendly'):
+            owner = game.match or game.friendly
+            if not game.points.exists() and game.friendly_id:
+                continue  # счет товарищеских игр вводится без очков
+            self.assertEqual(
+                (game.score_player1, game.score_player2),
+                (game.points.filter(scored_by=owner.player1).count(), game.points.filter(scored_by=owner.player2).count()),
+            )
+
+    def test_counters_follow_point_inserts_and_deletes(self):
+        import random
+        rng = random.Random(7)
+        games = list(Game.objects.filter(match__isnull=False).select_related('match'))
+        for order in range(100, 160):
+            game = rng.choice(games)
+            if rng.random() < 0.3 and game.points.exists():
+                game.points.order_by('?').first().delete()
+            else:
+                Point.objects.create(game=game, scored_by=rng.choice([game.match.player1, game.match.player2]), order=order)
+            self.assertCountersMatchPoints()
+        # Переназначение очка другому игроку
+        point = Point.objects.filter(game__match__isnull=False).first()
+        game = point.game
+        point.scored_by = game.match.player2 if point.scored_by_id == game.match.player1_id else game.match.player1
+        point.save()
+        self.assertCountersMatchPoints()
+        self.assertEqual(stats.check_consistency(), [])
+
+    def test_point_insert_does_not_recount(self):
+        game = Game.objects.filter(match__isnull=False).select_related('match').first()
+        with CaptureQueriesContext(connection) as ctx:
+            Point.objects.create(game=game, scored_by=game.match.player1, order=50)
+        self.assertFalse([q for q in ctx.captured_queries if 'COUNT' in q['sql'].upper()])
+
+    def test_repair_recount(self):
+        Game.objects.update(score_player1=99, score_player2=99)
+        Game.recalculate_scores(Game.objects.filter(match__isnull=False))
+        self.assertCountersMatchPoints()
+
+
+class MatchScoreApiTestCase(SeededClubMixin, TestCase):
+    def setUp(self):
+        self.seed_club()
+        live.reset()
+        self.addCleanup(live.reset)
+        user = User.objects.create_user(username='ref', password='pass')
+        ClubAdmin.objects.create(user=user, club=self.club)
+        self.client.login(username='ref', password='pass')
+        self.match = Match.objects.create(tournament=self.tournament, player1=self.players[0], player2=self.players[1])
+        self.url = f'/api/match/{self.match.id}/score/'
+
+    def send(self, payload):
+        import json
+        return self.client.post(self.url, json.dumps(payload), content_type='application/json')
+
+    def test_batch_is_applied_once(self):
+        batch = {'key': 'a1', 'actions': [
+            {'seq': 1, 'action': 'start_set'}, {'seq': 2, 'action': 'p1'},
+            {'seq': 3, 'action': 'p1'}, {'seq': 4, 'action': 'p2'},
+        ]}
+        data = self.send(batch).json()
+        self.assertEqual(data['score'], [2, 1])
+        self.assertEqual((data['seq'], data['applied']), (4, 4))
+        self.assertTrue(data['game'])
+        # Повтор того же пакета и пакет с уже примененными номерами не меняют счет
+        self.assertEqual(self.send(batch).json(), data)
+        retry = self.send({'key': 'a2', 'actions': [{'seq': 4, 'action': 'p2'}, {'seq': 5, 'action': 'undo_p1'}]}).json()
+        self.assertEqual(retry['score'], [1, 1])
+        self.assertEqual(retry['applied'], 1)
+
+    def test_retry_after_restart(self):
+        # Пакет из 6 очков: 5 записаны пакетом, шестое ждет записи и теряется при перезапуске
+        batch = {'key': 'r1', 'actions': [{'seq': 1, 'action': 'start_set'}] + [
+            {'seq': seq, 'action': 'p1'} for seq in range(2, 8)]}
+        self.assertEqual(self.send(batch).json()['score'], [6, 0])
+        live.reset()
+        data = self.send(batch).json()
+        self.assertEqual((data['score'], data['applied']), ([6, 0], 1))
+        # После записи ключа повтор без номеров тоже не засчитывается
+        keyed = {'key': 'r2', 'actions': ['p2', 'p2']}
+        self.send(keyed)
+        live.flush_all()
+        live.reset()
+        data = self.send(keyed).json()
+        self.assertEqual((data['score'], data['applied']), ([6, 2], 0))
+        game = self.match.games.get()
+        self.assertEqual((game.score_player1, game.score_player2), (6, 2))
+
+    def test_game_end_in_batch(self):
+        actions = [{'seq': 1, 'action': 'start_set'}] + [{'seq': i, 'action': 'p2'} for i in range(2, 13)]
+        data = self.send({'actions': actions}).json()
+        self.assertEqual(data['sets'], [0, 1])
+        self.assertFalse(data['game'])
+        self.assertTrue(data['set_finished'])
+        game = self.match.games.get()
+        self.assertEqual((game.score_player1, game.score_player2), (0, 11))
+        self.assertEqual(game.points.count(), 11)
+
+    def test_rejects_bad_requests(self):
+        self.assertEqual(self.send({'actions': [{'action': 'serve'}]}).status_code, 400)
+        self.assertEqual(self.client.post(self.url, 'not json', content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.get(self.url).status_code, 405)
+        self.client.logout()
+        response = self.send({'actions': ['p1']})
+        self.assertEqual((response.status_code, response['Content-Type']), (401, 'application/json'))
+        User.objects.create_user(username='fan', password='pass')
+        self.client.login(username='fan', password='pass')
+        self.assertEqual(self.send({'actions': ['p1']}).status_code, 403)
+
+
+class MatchConsumerTestCase(SeededClubMixin, TestCase):
+    """Счет по WebSocket: судья ведет матч, зрители матча и турнира получают рассылку."""
+
+    def setUp(self):
+        self.seed_club()
+        live.reset()
+        self.addCleanup(live.reset)
+        self.referee = User.objects.create_user(username='ref', password='pass')
+        ClubAdmin.objects.create(user=self.referee, club=self.club)
+        self.match = Match.objects.create(tournament=self.tournament, player1=self.players[0], player2=self.players[1])
+
+    def communicator(self, path, user=None):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from django.contrib.auth.models import AnonymousUser
+        from .routing import websocket_urlpatterns
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        communicator.scope['user'] = user or AnonymousUser()
+        return communicator
+
+    async def test_scoring_fans_out_to_match_and_tournament(self):
+        referee = self.communicator(f'/ws/match/{self.match.id}/', self.referee)
+        viewer = self.communicator(f'/ws/match/{self.match.id}/')
+        board = self.communicator(f'/ws/tournament/{self.tournament.id}/')
+        for communicator in (referee, viewer, board):
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+        await referee.send_json_to({'type': 'score', 'key': 'k1', 'actions': [
+            {'seq': 1, 'action': 'start_set'}, {'seq': 2, 'action': 'p1'}, {'seq': 3, 'action': 'p2'}, {'seq': 4, 'action': 'p1'}]})
+        ack = await referee.receive_json_from()
+        self.assertEqual((ack['type'], ack['key'], ack['score'], ack['applied']), ('ack', 'k1', [2, 1], 4))
+        for communicator in (viewer, board):
+            event = await communicator.receive_json_from()
+            self.assertEqual(event['type'], 'match_score')
+            self.assertEqual((event['match_id'], event['score'], event['sets']), (self.match.id, [2, 1], [0, 0]))
+        await referee.receive_json_from()  # собственная рассылка судье
+
+        # Зритель не может вести счет
+        await viewer.send_json_to({'type': 'score', 'key': 'k2', 'actions': ['p2']})
+        error = await viewer.receive_json_from()
+        self.assertEqual(error['type'], 'error')
+        # Бинарный кадр отклоняется явно
+        await referee.send_to(bytes_data=b'\x81\xa4type')
+        self.assertEqual((await referee.receive_json_from())['type'], 'error')
+        # Каждый кадр счета приходит один раз: сокет матча не подписан на группу турнира
+        for communicator in (referee, viewer, board):
+            self.assertTrue(await communicator.receive_nothing())
+        for communicator in (referee, viewer, board):
+            await communicator.disconnect()
+
+    def test_http_scoring_is_broadcast(self):
+        from asgiref.sync import async_to_sync, sync_to_async
+
+        async def scenario():
+            board = self.communicator(f'/ws/tournament/{self.tournament.id}/')
+            await board.connect()
+            await sync_to_async(self.client.force_login)(self.referee)
+            await sync_to_async(self.client.post)(
+                f'/match/{self.match.id}/play/', {'action': 'start_set'}, HTTP_X_REQUESTED_WITH='XMLHttpRequest')
+            event = await board.receive_json_from()
+            await board.disconnect()
+            return event
+
+        event = async_to_sync(scenario)()
+        self.assertTrue(event['game'])
+        self.assertEqual(event['players'], [self.players[0].id, self.players[1].id])
+
+
+class ChannelLayerTestCase(TestCase):
+    def test_bench_requires_shared_layer(self):
+        with self.settings(CHANNEL_LAYERS={'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}):
+            with self.assertRaises(CommandError):
+                call_command('bench_channel_layer', stdout=StringIO())
+
+
+@unittest.skipUnless(settings.CHANNEL_REDIS_URL or redis_standin.TcpFakeServer,
+                     'нужен Redis (CHANNEL_REDIS_URL=redis://127.0.0.1:6379/15) или fakeredis[lua] из requirements-dev.txt')
+class RedisChannelLayerTestCase(TestCase):
+    """Группы общие для независимых экземпляров слоя (как у разных воркеров daphne).
+
+    Без CHANNEL_REDIS_URL слой подключается к заменителю Redis (redis_standin).
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        if settings.CHANNEL_REDIS_URL:
+            return
+        url, server = redis_standin.start()
+        cls.addClassCleanup(server.shutdown)
+        # Процессы bench_channel_layer заново читают settings.py — адрес передается через окружение
+        cls.enterClassContext(mock.patch.dict(os.environ, {'CHANNEL_REDIS_URL': url}))
+        cls.enterClassContext(override_settings(CHANNEL_LAYERS={'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [url], 'prefix': os.environ.get('CHANNEL_REDIS_PREFIX', 'tennis')},
+        }}))
+
+    def test_group_send_reaches_other_layer_instance(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import channel_layers
+
+        async def scenario():
+            worker_a = channel_layers.make_backend('default')
+            worker_b = channel_layers.make_backend('default')
+            channel = await worker_a.new_channel()
+            await worker_a.group_add('friendly_game_test', channel)
+            await worker_b.group_send('friendly_game_test', {'type': 'game_update_message', 'game_data': {'score1': 3}})
+            message = await worker_a.receive(channel)
+            await worker_a.group_discard('friendly_game_test', channel)
+            return message
+
+        message = async_to_sync(scenario)()
+        self.assertEqual(message['game_data'], {'score1': 3})
+
+    def test_bench_across_processes(self):
+        out = StringIO()
+        call_command('bench_channel_layer', workers=4, messages=20, interval=1, stdout=out)
+        self.assertIn('Доставлено: 80 из 80', out.getvalue())
+
+
+class FriendlySnapshotTestCase(TestCase):
+    """Снимок идущих товарищеских игр: отправляется при подключении и рисуется на странице клуба."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='Snapshot Club')
+
+    def communicator(self):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/friendly_game/{self.club.id}/')
+
+    async def test_late_joiner_gets_snapshot(self):
+        scorer = self.communicator()
+        await scorer.connect()
+        self.assertEqual(await scorer.receive_json_from(), {'type': 'snapshot', 'games': []})
+        await scorer.send_json_to({'type': 'game_update', 'game_data': {
+            'game_id': 'g1', 'player1': 'Анна', 'player2': 'Борис', 'score1': 4, 'score2': 2, 'server': 2, 'extra': 'x'}})
+        update = await scorer.receive_json_from()
+        self.assertNotIn('extra', update['game_data'])
+
+        spectator = self.communicator()
+        await spectator.connect()
+        snapshot = await spectator.receive_json_from()
+        self.assertEqual([game['score1'] for game in snapshot['games']], [4])
+
+        await scorer.send_json_to({'type': 'game_end', 'game_data': {'game_id': 'g1', 'winner': 'Анна'}})
+        await spectator.receive_json_from()
+        late = self.communicator()
+        await late.connect()
+        self.assertEqual((await late.receive_json_from())['games'], [])
+        for communicator in (scorer, spectator, late):
+            await communicator.disconnect()
+
+    def test_snapshot_is_bounded_and_expires(self):
+        from . import scoreboard
+        with self.settings(FRIENDLY_SNAPSHOT_MAX_GAMES=2, FRIENDLY_SNAPSHOT_TTL=60):
+            for n in range(3):
+                scoreboard.update_snapshot(self.club.id, scoreboard.clean_game_data({'player1': f'P{n}', 'player2': 'Q'}))
+            self.assertEqual([game['game_id'] for game in scoreboard.club_snapshot(self.club.id)], ['P1|Q', 'P2|Q'])
+        with self.settings(FRIENDLY_SNAPSHOT_TTL=0):
+            self.assertEqual(scoreboard.club_snapshot(self.club.id), [])
+
+    def test_concurrent_updates_are_not_lost(self):
+        # Разные игры клуба обновляются одновременно (как из разных воркеров):
+        # без лока последняя запись снимка затирает остальные
+        import threading
+        import time
+        from . import scoreboard
+        read = scoreboard._live_games
+
+        def slow_read(*args):
+            games = read(*args)
+            time.sleep(0.02)
+            return games
+
+        with mock.patch.object(scoreboard, '_live_games', slow_read):
+            threads = [threading.Thread(target=scoreboard.update_snapshot, args=(
+                self.club.id, scoreboard.clean_game_data({'game_id': f'g{n}', 'player1': f'P{n}'}))) for n in range(6)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        entries = scoreboard.club_snapshot_entries(self.club.id)
+        self.assertEqual(sorted(entry['game_data']['game_id'] for entry in entries), [f'g{n}' for n in range(6)])
+        self.assertEqual(sorted(entry['n'] for entry in entries), list(range(1, 7)))
+
+    def test_club_page_renders_snapshot(self):
+        from . import scoreboard
+        scoreboard.update_snapshot(self.club.id, scoreboard.clean_game_data(
+            {'game_id': 'g2', 'player1': 'Вера', 'player2': 'Глеб', 'score1': 7, 'score2': 9}))
+        response = self.client.get(f'/club/{self.club.id}/')
+        self.assertContains(response, 'data-game-id="g2"')
+        self.assertContains(response, 'Вера')
+
+
+class FriendlyFanoutTestCase(TestCase):
+    """Всплеск game_update одной игры сливается: зрители получают первое и последнее состояние."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='Fanout Club')
+
+    async def test_burst_is_coalesced(self):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .consumers import fanout_counters
+        from .routing import websocket_urlpatterns
+        path = f'/ws/friendly_game/{self.club.id}/'
+        scorer = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        spectator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), path)
+        for communicator in (scorer, spectator):
+            await communicator.connect()
+            await communicator.receive_json_from()  # snapshot
+        before = fanout_counters.copy()
+
+        with self.settings(FRIENDLY_BROADCAST_TICK=0.2):
+            for score in range(1, 6):
+                await scorer.send_json_to({'type': 'game_update', 'game_data': {'game_id': 'g', 'score1': score, 'score2': 0}})
+            first = await spectator.receive_json_from()
+            last = await spectator.receive_json_from(timeout=2)
+            self.assertTrue(await spectator.receive_nothing(timeout=0.3))
+        self.assertEqual((first['game_data']['score1'], last['game_data']['score1']), (1, 5))
+        self.assertEqual(fanout_counters['received'] - before['received'], 5)
+        self.assertEqual(fanout_counters['broadcast'] - before['broadcast'], 2)
+        self.assertEqual(fanout_counters['merged'] - before['merged'], 3)
+        for communicator in (scorer, spectator):
+            await communicator.disconnect()
+
+
+class FriendlyWireProtocolTestCase(TestCase):
+    """Протокол v2: снимок, затем короткие дельты; прежние клиенты получают полный game_data."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='Wire Club')
+
+    def communicator(self, query=''):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+        return WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/friendly_game/{self.club.id}/{query}')
+
+    async def test_delta_frames_and_legacy_clients(self):
+        import msgpack
+        scorer, legacy, compact, binary = (self.communicator(), self.communicator(),
+                                           self.communicator('?v=2'), self.communicator('?v=2&enc=msgpack'))
+        for communicator in (scorer, legacy, compact, binary):
+            await communicator.connect()
+        await scorer.receive_json_from()
+        await legacy.receive_json_from()
+        self.assertEqual(await compact.receive_json_from(), {'t': 's', 'v': 2, 'enc': 'json', 'g': []})
+        self.assertEqual(msgpack.unpackb(await binary.receive_from())['enc'], 'msgpack')
+
+        game = {'game_id': '1718000000000-a1b2c3', 'game_type': 'single', 'player1': 'Александр Иванов',
+                'player2': 'Екатерина Смирнова', 'score1': 0, 'score2': 0, 'server': 1, 'is_finished': False}
+        with self.settings(FRIENDLY_BROADCAST_TICK=0):
+            await scorer.send_json_to({'type': 'game_update', 'game_data': game})
+            self.assertEqual((await compact.receive_json_from())[:3], ['f', 1, 1])
+            await binary.receive_from()
+            await legacy.receive_from()
+
+            await scorer.send_json_to({'type': 'game_update', 'game_data': {**game, 'score1': 1}})
+            delta_text = await compact.receive_from()
+            delta_bin = await binary.receive_from()
+            legacy_text = await legacy.receive_from()
+        self.assertEqual(json.loads(delta_text), ['u', 1, 2, 1, 0, 1])
+        self.assertEqual(msgpack.unpackb(delta_bin), ['u', 1, 2, 1, 0, 1])
+        self.assertEqual(json.loads(legacy_text)['game_data']['score1'], 1)
+        self.assertLessEqual(len(delta_text.encode()) * 10, len(legacy_text.encode()))
+
+        # Поздний клиент v2 получает снимок с номером обновления
+        late = self.communicator('?v=2')
+        await late.connect()
+        snapshot = await late.receive_json_from()
+        self.assertEqual([(g['n'], g['q'], g['d']['score1']) for g in snapshot['g']], [(1, 2, 1)])
+
+        await scorer.send_json_to({'type': 'game_end', 'game_data': {**game, 'score1': 11, 'winner': 'Александр Иванов'}})
+        self.assertEqual(await compact.receive_json_from(), ['e', 1, 3, 'Александр Иванов'])
+        self.assertEqual((await legacy.receive_json_from())['type'], 'game_end')
+        for communicator in (scorer, legacy, compact, binary, late):
+            await communicator.disconnect()
+
+
+    def test_doubles_round_trip(self):
+        # Клиент v2 собирает состояние из кадров так же, как club_detail.html
+        from . import scoreboard, wire
+        game = scoreboard.clean_game_data({
+            'game_id': 'd1', 'game_type': 'double', 'player1': 'Анна / Борис', 'player2': 'Вера / Глеб',
+            'team1_player1': 'Анна', 'team1_player2': 'Борис', 'team2_player1': 'Вера', 'team2_player2': 'Глеб',
+            'score1': 0, 'score2': 0, 'server': 1,
+        })
+        states = [game, {**game, 'score1': 1}, {**game, 'score1': 1, 'team1_player2': 'Дарья'},
+                  {**game, 'score1': 2, 'team1_player2': 'Дарья', 'server': 2}]
+        client, previous, kinds = None, None, []
+        for state in states:
+            entry, _ = scoreboard.update_snapshot(self.club.id, state)
+            frame = json.loads(wire.encode_json(wire.update_frame(entry, previous)))
+            kinds.append(frame[0])
+            if frame[0] == 'f':
+                client = frame[3]
+            else:
+                client.update(zip(wire.DELTA_FIELDS, frame[3:]))
+            self.assertEqual(client, state)
+            previous = state
+        # Замена игрока в паре — полный кадр, изменения счета — дельты
+        self.assertEqual(kinds, ['f', 'u', 'f', 'u'])
+
+
+class FriendlyPersistenceTestCase(TestCase):
+    """Товарищеская игра участника клуба сохраняется сервером из WebSocket-трансляции."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='Persist Club')
+        self.member = User.objects.create_user(username='member', password='pass')
+        ClubMembership.objects.create(user=self.member, club=self.club)
+        self.game = {'game_id': '1718000000000-x1y2z3', 'game_type': 'single',
+                     'player1': 'Иван', 'player2': 'Петр', 'score1': 0, 'score2': 0, 'server': 1}
+
+    def communicator(self, user):
+        from channels.routing import URLRouter
+        from channels.testing import WebsocketCommunicator
+        from .routing import websocket_urlpatterns
+        communicator = WebsocketCommunicator(URLRouter(websocket_urlpatterns), f'/ws/friendly_game/{self.club.id}/')
+        communicator.scope['user'] = user
+        return communicator
+
+    async def reply(self, scorer):
+        """Ответ сокету отправителя (ack/error); его собственная рассылка пропускается."""
+        messages = [await scorer.receive_json_from(), await scorer.receive_json_from()]
+        return next(message for message in messages if message['type'] in ('ack', 'error'))
+
+    async def test_stream_is_persisted_once(self):
+        from .models import LiveFriendlyGame
+        scorer = self.communicator(self.member)
+        await scorer.connect()
+        await scorer.receive_json_from()  # snapshot
+
+        with self.settings(FRIENDLY_BROADCAST_TICK=0, FRIENDLY_PERSIST_INTERVAL=0):
+            await scorer.send_json_to({'type': 'game_update', 'game_data': self.game})
+            ack = await self.reply(scorer)
+            self.assertEqual((ack['type'], ack['game_id']), ('ack', self.game['game_id']))
+
+            # Незавершенная партия не сохраняется как результат
+            await scorer.send_json_to({'type': 'game_end', 'game_data': {**self.game, 'score1': 5, 'winner': 'Иван'}})
+            self.assertEqual((await self.reply(scorer))['type'], 'error')
+
+            final = {**self.game, 'score1': 11, 'score2': 7, 'winner': 'Иван'}
+            await scorer.send_json_to({'type': 'game_end', 'game_data': final})
+            ack = await self.reply(scorer)
+        await scorer.disconnect()
+        self.assertTrue(ack['finished'])
+
+        live_game = await LiveFriendlyGame.objects.select_related('friendly__winner').aget(game_key=self.game['game_id'])
+        self.assertEqual(live_game.friendly_id, ack['friendly_id'])
+        self.assertEqual(live_game.friendly.winner.full_name, 'Иван')
+        self.assertEqual(await Game.objects.filter(friendly_id=ack['friendly_id'], score_player1=11, score_player2=7).acount(), 1)
+
+    def test_finish_is_idempotent_and_http_fallback_skips_duplicate(self):
+        from .friendlies import finish_friendly
+        game = {'game_id': 'double-1', 'game_type': 'double', 'player1': 'А / Б', 'player2': 'В / Г',
+                'team1_player1': 'А', 'team1_player2': 'Б', 'team2_player1': 'В', 'team2_player2': 'Г',
+                'score1': 9, 'score2': 11, 'winner': 'В / Г'}
+        friendly_id = finish_friendly(self.club.id, self.member.id, game)
+        self.assertEqual(finish_friendly(self.club.id, self.member.id, game), friendly_id)
+        friendly = FriendlyGame.objects.get(pk=friendly_id)
+        self.assertEqual((friendly.game_type, friendly.winning_team, friendly.team2_player2.full_name), ('double', 2, 'Г'))
+
+        self.client.force_login(self.member)
+        payload = {**game, 'winning_team': 2, 'club_id': self.club.id}
+        response = self.client.post('/api/save_friendly_game/', data=json.dumps(payload), content_type='application/json')
+        self.assertEqual(response.json()['friendly_id'], friendly_id)
+        self.assertEqual(FriendlyGame.objects.count(), 1)
+
+        # Ключ присылает клиент: игра другого клуба или другого пользователя с тем же ключом не подставляется
+        other_club = Club.objects.create(name='Other Club')
+        other_user = User.objects.create_user(username='other', password='pass')
+        for user, club_id in ((self.member, other_club.id), (other_user, self.club.id)):
+            self.client.force_login(user)
+            response = self.client.post('/api/save_friendly_game/', data=json.dumps({**payload, 'club_id': club_id}),
+                                        content_type='application/json')
+            self.assertNotEqual(response.json().get('friendly_id'), friendly_id)
+        self.assertEqual(FriendlyGame.objects.count(), 3)
+
+
+class FanoutBenchmarkTestCase(TestCase):
+    """bench_fanout прогоняет поток счета через зрителей и выдает JSON."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+
+    def test_report(self):
+        out = StringIO()
+        call_command('bench_fanout', sizes='3,6', clubs=2, points=4, interval=0, tick=0, stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertEqual([result['sockets'] for result in report['results']], [3, 6])
+        for result in report['results']:
+            self.assertEqual(result['delivered'], result['expected'])
+            self.assertEqual(set(result['latency_ms']), {'p50', 'p95', 'p99', 'max'})
+        self.assertEqual(report['fanout_counters']['broadcast'], 2 * 2 * 4)
+
+    def test_match_consumers(self):
+        for consumer in ('match', 'tournament'):
+            with self.subTest(consumer=consumer):
+                out = StringIO()
+                call_command('bench_fanout', consumer=consumer, sizes='3,6', clubs=2, points=4, interval=0,
+                             stdout=out)
+                report = json.loads(out.getvalue())
+                self.assertEqual(report['consumer'], consumer)
+                for result in report['results']:
+                    # start_set и 4 очка на каждый из двух матчей; каждый зритель получает кадры своего матча
+                    self.assertEqual(result['updates_sent'], 2 * 5)
+                    self.assertEqual(result['delivered'], result['expected'])
+                    self.assertEqual(result['expected'], 5 * result['sockets'])
+        # Клубы, матчи и очки прогона откатываются
+        self.assertFalse(Club.objects.filter(name__startswith='bench_fanout').exists())
+        self.assertFalse(Point.objects.exists())
+        self.assertFalse(live._registry)
+
+
+class MatchGenerationTestCase(TestCase):
+    """generate_matches пишет сетку пакетно и поддерживает индекс участия и статистику."""
+
+    def setUp(self):
+        from .models import TournamentParticipant
+        self.club = Club.objects.create(name='Generation Club')
+        self.players = [Player.objects.create(full_name=f'Игрок {i}', club=self.club) for i in range(5)]
+        self.tournaments = {}
+        for tournament_type in (Tournament.ROUND_ROBIN, Tournament.ELIMINATION):
+            tournament = Tournament.objects.create(club=self.club, name=tournament_type, start_date='2025-01-01',
+                                                   tournament_type=tournament_type)
+            for seed, player in enumerate(self.players):
+                TournamentParticipant.objects.create(tournament=tournament, player=player, seed=seed)
+            self.tournaments[tournament_type] = tournament
+
+    def test_round_robin(self):
+        tournament = self.tournaments[Tournament.ROUND_ROBIN]
+        tournament.generate_matches()
+        pairs = {frozenset(pair) for pair in tournament.matches.values_list('player1_id', 'player2_id')}
+        self.assertEqual(len(pairs), 10)
+        self.assertEqual(PlayerStats.objects.get(player=self.players[0]).matches, 4)
+        self.assertEqual(stats.check_consistency(), [])
+
+    def test_round_robin_adds_to_existing_stats(self):
+        # У игроков уже есть игры в этом месяце: приращения ложатся поверх сохраненных агрегатов
+        friendly = FriendlyGame.objects.create(club=self.club, player1=self.players[0], player2=self.players[1],
+                                               winner=self.players[0])
+        Match.objects.create(tournament=self.tournaments[Tournament.ELIMINATION],
+                             player1=self.players[2], player2=self.players[3]).set_winner(self.players[3])
+        stats.ensure_player_stats(Player.objects.all())
+        self.tournaments[Tournament.ROUND_ROBIN].generate_matches()
+        self.assertEqual(stats.check_consistency(), [])
+        row = PlayerStats.objects.get(player=self.players[3])
+        self.assertEqual((row.matches, row.match_wins, row.match_losses), (5, 1, 4))
+        monthly = PlayerMonthlyStats.objects.get(player=self.players[0], year=friendly.played_at.year,
+                                                 month=friendly.played_at.month)
+        self.assertEqual((monthly.single_games, monthly.single_wins, monthly.single_losses), (5, 1, 0))
+
+    def test_elimination_bracket(self):
+        tournament = self.tournaments[Tournament.ELIMINATION]
+        # Число запросов не зависит от размера сетки: один INSERT матчей, один UPDATE ссылок,
+        # статистика сдвигается UPDATE на группу игроков с одинаковым приращением
+        with self.assertNumQueries(21):
+            tournament.generate_matches()
+        rounds = {}
+        for match in tournament.matches.all():
+            rounds.setdefault(match.round_number, []).append(match)
+        self.assertEqual([len(rounds[r]) for r in (1, 2, 3)], [4, 2, 1])
+        final = rounds[3][0]
+        for idx, match in enumerate(rounds[1]):
+            self.assertEqual(match.next_match_id, rounds[2][idx // 2].id)
+        self.assertTrue(all(match.next_match_id == final.id for match in rounds[2]))
+        self.assertIsNone(final.next_match_id)
+        # Bye: пятый посев сразу проходит во второй раунд
+        self.assertEqual((rounds[1][2].winner, rounds[2][1].player1), (self.players[4], self.players[4]))
+        self.assertEqual(stats.check_consistency(), [])
+
+        tournament.generate_matches()  # повторный вызов ничего не создает
+        self.assertEqual(tournament.matches.count(), 7)
+
+
+class StandingsTestCase(TestCase):
+    """Очки таблицы переносятся инкрементально и совпадают с полной пересборкой."""
+
+    def setUp(self):
+        self.club = Club.objects.create(name='Standings Club')
+        self.tournament = Tournament.objects.create(club=self.club, name='Round', start_date='2025-01-01')
+        self.a, self.b, self.c = (Player.objects.create(full_name=name, club=self.club) for name in ('Анна', 'Борис', 'Вера'))
+        for player in (self.a, self.b, self.c):
+            Standing.objects.create(tournament=self.tournament, player=player)
+        self.ab = Match.objects.create(tournament=self.tournament, player1=self.a, player2=self.b)
+        self.bc = Match.objects.create(tournament=self.tournament, player1=self.b, player2=self.c)
+
+    def table(self):
+        return list(self.tournament.standings.order_by('rank').values_list('player__full_name', 'points', 'rank'))
+
+    def test_incremental_matches_full_rebuild(self):
+        self.ab.set_winner(self.b)
+        self.bc.set_winner(self.c)
+        # Равные по очкам Борис и Вера разделяются личной встречей
+        self.assertEqual(self.table(), [('Вера', 2, 1), ('Борис', 2, 2), ('Анна', 0, 3)])
+
+        # Смена победителя: очки уходят от прежнего победителя, меняются только сдвинутые места
+        self.ab.set_winner(self.a)
+        incremental = self.table()
+        self.assertEqual(incremental, [('Анна', 2, 1), ('Вера', 2, 2), ('Борис', 0, 3)])
+        Standing.objects.filter(tournament=self.tournament).update(points=0, rank=0)
+        self.tournament.recalculate_standings()
+        self.assertEqual(self.table(), incremental)
+
+    def test_rank_rewrites_only_moved_rows(self):
+        self.tournament.recalculate_standings()
+        with CaptureQueriesContext(connection) as queries:
+            self.tournament.recalculate_standings()
+        self.assertFalse([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')])
+
+    def test_full_rebuild_writes_once(self):
+        self.ab.set_winner(self.b)
+        self.bc.set_winner(self.c)
+        expected = self.table()
+        Standing.objects.filter(tournament=self.tournament).update(points=0, rank=0)
+        with CaptureQueriesContext(connection) as queries:
+            self.tournament.recalculate_standings()
+        self.assertEqual(len([q for q in queries.captured_queries if q['sql'].startswith('UPDATE')]), 1)
+        self.assertEqual(self.table(), expected)
+
+
+class TiebreakTestCase(TestCase):
+    """Дополнительные показатели: личные встречи, круговая ничья, соотношение сетов и мячей."""
+
+    def test_circular_tie_is_resolved_by_sets_then_balls(self):
+        from .tiebreaks import TiebreakTable
+        players = [(1, 'А', 4), (2, 'Б', 4), (3, 'В', 4), (4, 'Г', 0)]
+        results = [
+            # Круг А > Б > В > А: личные очки равны, решают сеты среди троих
+            (1, 2, 1, 2, 0, 22, 10),
+            (2, 3, 2, 2, 1, 30, 28),
+            (3, 1, 3, 2, 1, 31, 29),
+            (1, 4, 1, 2, 0, 22, 5),
+            (2, 4, 2, 2, 0, 22, 5),
+            (3, 4, 3, 2, 0, 22, 5),
+        ]
+        # Сеты среди троих: А 3:2, Б 2:3, В 3:3 — места А, В, Б
+        self.assertEqual(TiebreakTable(players, results).ranking(), [1, 3, 2, 4])
+
+    def test_partial_separation_reapplies_head_to_head(self):
+        from .tiebreaks import TiebreakTable
+        players = [(1, 'А', 2), (2, 'Б', 2), (3, 'В', 2)]
+        # Все выиграли по разу и равны по сетам; по мячам среди троих А впереди (42:6),
+        # а Б и В равны (24:42) — для них правило применяется заново: Б обыграл В
+        results = [(1, 2, 1, 2, 0, 22, 2), (2, 3, 2, 2, 0, 22, 20), (3, 1, 3, 2, 0, 4, 20)]
+        table = TiebreakTable(players, results)
+        self.assertEqual(table.ranking(), [1, 2, 3])
+
+    def test_large_round_robin(self):
+        import random
+        import time
+        from .tiebreaks import TiebreakTable
+        rng = random.Random(7)
+        n = 300
+        results, wins = [], [0] * n
+        for i in range(n):
+            for j in range(i + 1, n):
+                winner = rng.choice((i, j))
+                wins[winner] += 1
+                results.append((i, j, winner, 2 if winner == i else rng.randint(0, 1),
+                                2 if winner == j else rng.randint(0, 1), rng.randint(10, 40), rng.randint(10, 40)))
+        started = time.perf_counter()
+        ranking = TiebreakTable([(i, f'Игрок {i}', wins[i] * 2) for i in range(n)], results).ranking()
+        self.assertLess(time.perf_counter() - started, 2)
+        self.assertEqual(sorted(ranking), list(range(n)))
+        self.assertEqual([wins[i] for i in ranking], sorted(wins, reverse=True))
+
+
+class TournamentDetailCacheTestCase(TestCase):
+    """Таблицы tournament_detail берутся из кэша, пока результаты турнира не изменились."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from .models import TournamentParticipant
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='Cache Club')
+        self.tournament = Tournament.objects.create(club=self.club, name='Cached Cup', start_date='2025-01-01')
+        self.players = [Player.objects.create(full_name=f'Игрок {i}', club=self.club) for i in range(4)]
+        for player in self.players[:3]:
+            TournamentParticipant.objects.create(tournament=self.tournament, player=player)
+            Standing.objects.create(tournament=self.tournament, player=player)
+        self.tournament.generate_matches()
+        self.url = f'/tournament/{self.tournament.id}/'
+
+    def test_repeated_views_hit_cache_until_result(self):
+        from .models import TournamentParticipant
+        self.client.get(self.url)
+        with self.assertNumQueries(2):  # сам турнир и его клуб в шаблоне; таблицы — из кэша
+            response = self.client.get(self.url)
+        self.assertEqual(len(response.context['rr_matrix']), 3)
+
+        match = self.tournament.matches.get(player1=self.players[0], player2=self.players[1])
+        match.set_winner(self.players[1])
+        response = self.client.get(self.url)
+        self.assertEqual(response.context['standings'][0].player, self.players[1])
+        self.assertEqual(response.context['rr_matrix'][0]['results'][1]['status'], 'L')
+
+        TournamentParticipant.objects.create(tournament=self.tournament, player=self.players[3])
+        self.assertEqual(len(self.client.get(self.url).context['participants']), 4)
+
+    def test_admin_view_hits_cache(self):
+        user = User.objects.create_user(username='admin', password='pass')
+        admin = ClubAdmin.objects.create(user=user, club=self.club)
+        self.client.login(username='admin', password='pass')
+        self.client.get(self.url)
+        with self.assertNumQueries(4):  # сессия и пользователь, турнир и клуб; без ClubAdmin и участников
+            response = self.client.get(self.url)
+        self.assertTrue(response.context['is_club_admin'])
+        choices = [label for _, label in response.context['match_form'].fields['player1'].choices]
+        self.assertEqual(choices[1:], [player.full_name for player in self.players[:3]])
+
+        admin.delete()
+        self.assertFalse(self.client.get(self.url).context['is_club_admin'])
+        self.assertFalse(self.client.get(f'/club/{self.club.id}/').context['is_club_admin'])
+
+
+class PlayerCacheTestCase(TestCase):
+    """Статистика и H2H игрока кэшируются до следующего результата с его участием."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        from . import caching
+        cache.clear()
+        self.addCleanup(cache.clear)
+        caching.counters.clear()
+        self.club = Club.objects.create(name='Cache Club')
+        self.player1 = Player.objects.create(full_name='Первый', club=self.club)
+        self.player2 = Player.objects.create(full_name='Второй', club=self.club)
+        FriendlyGame.objects.create(club=self.club, player1=self.player1, player2=self.player2, winner=self.player1)
+
+    def test_monthly_stats_invalidated_by_result(self):
+        month = timezone.localtime().month
+        self.assertEqual(self.player1.get_monthly_stats()[month - 1]['wins'], 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.player1.get_monthly_stats()[month - 1]['wins'], 1)
+        FriendlyGame.objects.create(club=self.club, player1=self.player1, player2=self.player2, winner=self.player2)
+        self.assertEqual(self.player1.get_monthly_stats()[month - 1]['losses'], 1)
+        # Точный ответ без кэша совпадает с кэшированным
+        year = timezone.localtime().year
+        self.assertEqual(self.player1.get_monthly_stats(),
+                         stats.live_monthly_stats(self.player1.pk, (year, 1), (year, 12)))
+
+    def test_point_invalidates_scorer(self):
+        game = Game.objects.create(friendly=FriendlyGame.objects.get())
+        self.assertEqual(self.player2.get_stats()['scored_points'], 0)
+        Point.objects.create(game=game, scored_by=self.player2, order=1)
+        self.assertEqual(self.player2.get_stats()['scored_points'], 1)
+
+    def test_player_detail_h2h_cached(self):
+        url = f'/player/{self.player1.id}/'
+        self.client.get(url)
+        rows = self.client.get(url).context['h2h_rows']
+        self.assertEqual((rows[0]['games'], rows[0]['wins']), (1, 1))
+
+        # Переименование соперника меняет версию клуба
+        self.player2.full_name = 'Второй (новый)'
+        self.player2.save()
+        rows = self.client.get(url).context['h2h_rows']
+        self.assertEqual(rows[0]['opponent'].full_name, 'Второй (новый)')
+
+        from . import caching
+        self.assertEqual(caching.report()['club_head_to_head'], {'hits': 1, 'misses': 2, 'hit_ratio': 0.333})
+
+    def test_cache_stats_staff_only(self):
+        self.assertEqual(self.client.get('/api/cache_stats/').status_code, 302)
+        User.objects.create_user(username='staff', password='pass', is_staff=True)
+        self.client.login(username='staff', password='pass')
+        self.player1.get_monthly_stats()
+        self.player1.get_monthly_stats()
+        data = self.client.get('/api/cache_stats/').json()
+        self.assertEqual(data['caches']['monthly_stats']['hits'], 1)
+
+
+class RatingTestCase(TestCase):
+    """Рейтинг Эло меняется с каждым результатом и совпадает с полным пересчетом."""
+
+    def setUp(self):
+        self.club = Club.objects.create(name='Rating Club')
+        self.players = [Player.objects.create(full_name=f'Игрок {i}', club=self.club) for i in range(4)]
+        self.tournament = Tournament.objects.create(club=self.club, name='Rating Cup', start_date='2025-01-01')
+
+    def ratings(self):
+        return [player.rating for player in Player.objects.filter(club=self.club).order_by('id')]
+
+    def test_singles_and_doubles(self):
+        a, b, c, d = self.players
+        FriendlyGame.objects.create(club=self.club, player1=a, player2=b, winner=a)
+        self.assertEqual(self.ratings(), [1016, 984, 1000, 1000])
+        # Команда (1016 + 1000) / 2 против (984 + 1000) / 2: фаворит получает меньше
+        FriendlyGame.objects.create(club=self.club, game_type='double', player1=a, player2=b, team1_player1=a, team1_player2=c,
+                                    team2_player1=b, team2_player2=d, winning_team=1)
+        self.assertEqual(self.ratings(), [1031, 969, 1015, 985])
+
+    def test_changed_match_result(self):
+        a, b = self.players[:2]
+        match = Match.objects.create(tournament=self.tournament, player1=a, player2=b)
+        match.set_winner(a)
+        match.set_winner(a)  # повторный отчет о том же результате ничего не меняет
+        self.assertEqual(self.ratings()[:2], [1016, 984])
+        match.set_winner(b)
+        # Отмена приближенная (от текущих рейтингов), точный результат дает replay_ratings
+        self.assertEqual(self.ratings()[:2], [983, 1017])
+        call_command('replay_ratings', stdout=StringIO())
+        self.assertEqual(self.ratings()[:2], [984, 1016])
+
+    def test_replay_matches_incremental(self):
+        a, b, c, d = self.players
+        for p1, p2, winner in ((a, b, a), (c, d, d), (a, c, c), (b, d, b), (a, d, a)):
+            Match.objects.create(tournament=self.tournament, player1=p1, player2=p2).set_winner(winner)
+        FriendlyGame.objects.create(club=self.club, game_type='double', player1=a, player2=b, team1_player1=a, team1_player2=b,
+                                    team2_player1=c, team2_player2=d, winning_team=2)
+        incremental = self.ratings()
+
+        Player.objects.update(rating=1000)
+        call_command('replay_ratings', '--dry-run', stdout=StringIO())
+        self.assertEqual(self.ratings(), [1000] * 4)
+        call_command('replay_ratings', stdout=StringIO())
+        self.assertEqual(self.ratings(), incremental)
+
+        call_command('replay_ratings', '--k', '16', stdout=StringIO())
+        self.assertLess(max(self.ratings()) - 1000, max(incremental) - 1000)
+
+    def test_replay_follows_report_order(self):
+        # Круговой турнир: матчи создаются разом, а результаты приходят в другом порядке
+        from itertools import combinations
+        from . import ratings
+        players = self.players + [Player.objects.create(full_name=f'Игрок {i}', club=self.club) for i in (4, 5)]
+        matches = [Match.objects.create(tournament=self.tournament, player1=p1, player2=p2)
+                   for p1, p2 in combinations(players, 2)]
+        order = [7, 2, 13, 0, 9, 4, 14, 11, 1, 6, 12, 3, 10, 5, 8]
+        for idx in order:
+            match = matches[idx]
+            match.set_winner(match.player2 if idx % 3 else match.player1)
+        self.assertEqual(ratings.replay(dry_run=True)['changed'], 0)
+        incremental = [player.rating for player in Player.objects.filter(club=self.club).order_by('id')]
+        self.assertNotEqual(incremental, [1000] * 6)
+        call_command('replay_ratings', stdout=StringIO())
+        self.assertEqual([player.rating for player in Player.objects.filter(club=self.club).order_by('id')],
+                         incremental)
+
+
+class RatingHistoryTestCase(TestCase):
+    """История рейтинга хранится упакованными массивами и отдается прореженной."""
+
+    def setUp(self):
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.club = Club.objects.create(name='History Club')
+        self.a = Player.objects.create(full_name='Первый', club=self.club)
+        self.b = Player.objects.create(full_name='Второй', club=self.club)
+
+    def play(self, winner, count=1):
+        for _ in range(count):
+            FriendlyGame.objects.create(club=self.club, player1=self.a, player2=self.b, winner=winner)
+
+    def test_history_follows_results_and_replay(self):
+        from . import ratings
+        self.play(self.a, 3)
+        self.play(self.b)
+        series = ratings.rating_series(self.a.pk)
+        self.assertEqual([rating for _, rating in series], [1016, 1031, 1044, 1024])
+        self.assertEqual(len(self.a.rating_history.times), 4 * 8)
+
+        call_command('replay_ratings', stdout=StringIO())
+        self.assertEqual(ratings.rating_series(self.a.pk), series)
+
+    def test_history_uses_result_time(self):
+        # Точка истории получает момент результата, а не время записи, — как и при replay
+        from datetime import datetime, timezone as dt_timezone
+        from . import ratings
+        played_at = datetime(2025, 3, 1, 12, 30, tzinfo=dt_timezone.utc)
+        game = FriendlyGame(club=self.club, player1=self.a, player2=self.b, winner=self.a, played_at=played_at)
+        ratings.record_result(game)
+        self.assertEqual(ratings.rating_series(self.a.pk), [(int(played_at.timestamp()), 1016)])
+        match = Match.objects.create(tournament=Tournament.objects.create(club=self.club, name='Cup', start_date='2025-01-01'),
+                                     player1=self.a, player2=self.b)
+        match.set_winner(self.b)
+        self.assertEqual(ratings.rating_series(self.b.pk)[-1][0], int(match.decided_at.timestamp()))
+
+    def test_downsample_keeps_extremes(self):
+        from . import ratings
+        series = [(t, 1000 + (t % 50) * (1 if t != 333 else 10)) for t in range(1000)]
+        sampled = ratings.downsample(series, 20)
+        self.assertLessEqual(len(sampled), 20)
+        self.assertEqual((sampled[0], sampled[-1]), (series[0], series[-1]))
+        self.assertIn((333, 1000 + 33 * 10), sampled)
+        self.assertEqual(sampled, sorted(sampled))
+
+    def test_api(self):
+        self.play(self.a, 10)
+        url = f'/api/player/{self.a.id}/rating_history/'
+        data = self.client.get(url, {'points': 6}).json()
+        self.assertEqual(data['rating'], Player.objects.get(pk=self.a.pk).rating)
+        self.assertLessEqual(len(data['points']), 6)
+        self.assertEqual(data['points'][-1][1], data['rating'])
+
+        today = timezone.now().date()
+        self.assertEqual(len(self.client.get(url, {'from': today.isoformat()}).json()['points']), 10)
+        self.assertEqual(self.client.get(url, {'to': '2000-01-01'}).json()['points'], [])
+        self.assertEqual(self.client.get(url, {'from': 'вчера'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'points': 1}).status_code, 400)
+
+
+class LeaderboardTestCase(TestCase):
+    """Рейтинг-лист листается курсором, места совпадают с полным ранжированием."""
+
+    def setUp(self):
+        self.club1 = Club.objects.create(name='Leader Club 1')
+        self.club2 = Club.objects.create(name='Leader Club 2')
+        ratings = [1200, 1100, 1100, 1100, 1050, 1000, 1000, 950, 1300, 900]
+        self.players = [
+            Player.objects.create(full_name=f'Игрок {i}', club=self.club1 if i % 2 else self.club2, rating=rating,
+                                  dominant_hand='left' if i % 3 == 0 else 'right')
+            for i, rating in enumerate(ratings)
+        ]
+
+    def walk(self, **params):
+        rows, cursor = [], None
+        while True:
+            # Номер и место продолжаются из подписанного курсора — без подсчета строк выше
+            with self.assertNumQueries(1):
+                data = self.client.get('/api/leaderboard/', {**params, 'limit': 3, **({'after': cursor} if cursor else {})}).json()
+            rows += data['results']
+            cursor = data['next']
+            if not cursor:
+                return rows
+
+    def expected(self, players):
+        ordered = sorted(players, key=lambda p: (-p.rating, -p.id))
+        return [(i + 1, 1 + sum(other.rating > p.rating for other in ordered), p.id) for i, p in enumerate(ordered)]
+
+    def test_pages_and_ranks(self):
+        rows = self.walk()
+        self.assertEqual([(r['position'], r['rank'], r['id']) for r in rows], self.expected(self.players))
+        self.assertEqual([r['rank'] for r in rows[:5]], [1, 2, 3, 3, 3])
+
+    def test_filters(self):
+        rows = self.walk(club=self.club1.id)
+        self.assertEqual([(r['position'], r['rank'], r['id']) for r in rows],
+                         self.expected([p for p in self.players if p.club_id == self.club1.id]))
+        rows = self.walk(hand='left')
+        self.assertEqual([r['id'] for r in rows],
+                         [p.id for p in sorted(self.players, key=lambda p: (-p.rating, -p.id)) if p.dominant_hand == 'left'])
+
+    def test_bad_params(self):
+        for params in ({'after': 'abc'}, {'after': '1000:1:0:0'}, {'hand': 'both'}, {'limit': 0}, {'club': 'x'}):
+            self.assertEqual(self.client.get('/api/leaderboard/', params).status_code, 400, params)
+
+    def test_ranks_do_not_trust_cursor(self):
+        ordered = sorted(self.players, key=lambda p: (-p.rating, -p.id))
+        # Курсор, собранный клиентом сам, — явный переход: места считаются, как при листании с начала
+        with self.assertNumQueries(2):
+            data = self.client.get('/api/leaderboard/', {'after': f'{ordered[2].rating}:{ordered[2].id}', 'limit': 3}).json()
+        self.assertEqual([(r['position'], r['rank'], r['id']) for r in data['results']], self.expected(self.players)[3:6])
+
+        # Подписанный курсор нельзя подправить или перенести в список с другими фильтрами
+        cursor = self.client.get('/api/leaderboard/', {'limit': 3}).json()['next']
+        forged = cursor.replace(f':{ordered[2].id}:3:', f':{ordered[2].id}:1:', 1)
+        self.assertNotEqual(forged, cursor)
+        for params in ({'after': forged}, {'after': cursor, 'club': self.club1.id}, {'after': cursor, 'hand': 'left'}):
+            self.assertEqual(self.client.get('/api/leaderboard/', {**params, 'limit': 3}).status_code, 400, params)
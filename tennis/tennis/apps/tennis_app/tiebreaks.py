@@ -0,0 +1,119 @@
+"""Ранжирование таблицы кругового турнира с дополнительными показателями.
+
+Порядок, как в регламенте ITTF: очки таблицы (Standing.points); при равенстве очков — очки,
+соотношение сетов и мячей во встречах только между равными игроками. Если
+группа равных разделилась частично, правило заново применяется к оставшимся
+(так разрешаются круговые ничьи). Если не разделилась совсем — общее
+соотношение сетов, затем мячей, затем имя.
+
+Результаты турнира загружаются двумя запросами в плотные списки по индексу
+участника (и матрицу встреч участник × участник); дальше расчет идет в памяти.
+"""
+from itertools import groupby
+
+from django.db.models import Sum
+
+from .models import Game
+
+
+def _ratio(won, lost):
+    """Доля выигранного: монотонна по won/lost и определена при lost = 0."""
+    total = won + lost
+    return won / total if total else 0.0
+
+
+class TiebreakTable:
+    # Показатели встречи в матрице: победы, сеты за/против, мячи за/против
+    WINS, SETS_FOR, SETS_AGAINST, BALLS_FOR, BALLS_AGAINST = range(5)
+
+    def __init__(self, players, results):
+        """players — [(player_id, имя, очки в таблице)], results — [(p1, p2, winner, sets1, sets2, balls1, balls2)]."""
+        self.player_ids = [pid for pid, _, _ in players]
+        self.names = [name for _, name, _ in players]
+        self.points = [points for _, _, points in players]
+        index = {pid: i for i, pid in enumerate(self.player_ids)}
+        n = len(players)
+        self.sets = [[0, 0] for _ in range(n)]
+        self.balls = [[0, 0] for _ in range(n)]
+        self.h2h = [[None] * n for _ in range(n)]
+        for p1, p2, winner, sets1, sets2, balls1, balls2 in results:
+            i, j = index.get(p1), index.get(p2)
+            if i is None or j is None or i == j:
+                continue
+            for me, other, won, s_for, s_against, b_for, b_against in (
+                (i, j, winner == p1, sets1, sets2, balls1, balls2),
+                (j, i, winner == p2, sets2, sets1, balls2, balls1),
+            ):
+                self.sets[me][0] += s_for
+                self.sets[me][1] += s_against
+                self.balls[me][0] += b_for
+                self.balls[me][1] += b_against
+                cell = self.h2h[me][other]
+                if cell is None:
+                    cell = self.h2h[me][other] = [0] * 5
+                cell[self.WINS] += won
+                cell[self.SETS_FOR] += s_for
+                cell[self.SETS_AGAINST] += s_against
+                cell[self.BALLS_FOR] += b_for
+                cell[self.BALLS_AGAINST] += b_against
+
+    def _mini_key(self, i, group):
+        """Показатели игрока i во встречах только с игроками группы (по убыванию — лучше)."""
+        total = [0] * 5
+        row = self.h2h[i]
+        for j in group:
+            cell = row[j]
+            if cell is not None:
+                for k in range(5):
+                    total[k] += cell[k]
+        return (total[self.WINS], _ratio(total[self.SETS_FOR], total[self.SETS_AGAINST]),
+                _ratio(total[self.BALLS_FOR], total[self.BALLS_AGAINST]))
+
+    def _overall_key(self, i):
+        return (-_ratio(*self.sets[i]), -_ratio(*self.balls[i]), self.names[i])
+
+    def _order_tied(self, group):
+        if len(group) == 1:
+            return group
+        keys = {i: self._mini_key(i, group) for i in group}
+        ordered = []
+        for _, bucket in groupby(sorted(group, key=keys.get, reverse=True), key=keys.get):
+            bucket = list(bucket)
+            if len(bucket) == 1:
+                ordered += bucket
+            elif len(bucket) < len(group):
+                # Группа разделилась частично — правило применяется заново к оставшимся
+                ordered += self._order_tied(bucket)
+            else:
+                ordered += sorted(bucket, key=self._overall_key)
+        return ordered
+
+    def ranking(self):
+        """Id игроков в порядке мест."""
+        by_points = sorted(range(len(self.player_ids)), key=lambda i: -self.points[i])
+        ordered = []
+        for _, group in groupby(by_points, key=lambda i: self.points[i]):
+            ordered += self._order_tied(list(group))
+        return [self.player_ids[i] for i in ordered]
+
+
+def load_table(tournament, points=None):
+    """TiebreakTable по участникам таблицы и завершенным матчам турнира.
+
+    points — {player_id: очки} вместо сохраненных Standing.points (еще не записанные).
+    """
+    players = list(tournament.standings.values_list('player_id', 'player__full_name', 'points'))
+    if points is not None:
+        players = [(player_id, name, points.get(player_id, stored)) for player_id, name, stored in players]
+    balls = {
+        match_id: (s1 or 0, s2 or 0)
+        for match_id, s1, s2 in Game.objects.filter(match__tournament=tournament, match__winner__isnull=False)
+        .order_by().values('match_id').annotate(s1=Sum('score_player1'), s2=Sum('score_player2'))
+        .values_list('match_id', 's1', 's2')
+    }
+    results = [
+        (p1, p2, winner, sets1, sets2, *balls.get(match_id, (0, 0)))
+        for match_id, p1, p2, winner, sets1, sets2 in tournament.matches.filter(winner__isnull=False).values_list(
+            'id', 'player1_id', 'player2_id', 'winner_id', 'sets_player1', 'sets_player2')
+    ]
+    return TiebreakTable(players, results)
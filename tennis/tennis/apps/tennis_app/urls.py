@@ -19,16 +19,20 @@ urlpatterns = [
     path('club/<int:club_id>/add_player/', views.add_player, name='add_player'), 
     path('player/<int:player_id>/', views.player_detail, name='player_detail'),
     path('api/player/<int:player_id>/monthly_stats/', views.player_monthly_stats, name='player_monthly_stats'),
+    path('api/player/<int:player_id>/rating_history/', views.player_rating_history, name='player_rating_history'),
+    path('api/leaderboard/', views.leaderboard_api, name='leaderboard_api'),
     path('tournament/<int:tournament_id>/', views.tournament_detail, name='tournament_detail'),
     path('tournament/<int:tournament_id>/add_participant/', views.add_participant, name='add_participant'),
     path('tournament/<int:tournament_id>/generate_matches/', views.generate_matches, name='generate_matches'),
     path('match/<int:match_id>/report/', views.report_match_result, name='report_match_result'),
     path('match/<int:match_id>/play/', views.play_match_live, name='play_match_live'),
+    path('api/match/<int:match_id>/score/', views.match_score_api, name='match_score_api'),
     path('club/<int:club_id>/invite_admin/', views.invite_admin, name='invite_admin'),
     path('invite/accept/', views.accept_invite, name='accept_invite'),
     path('invite/accept/<int:invite_id>/', views.accept_invite_direct, name='accept_invite_direct'),
     path('friend_play', views.friend_play, name='friend_play'),
     path('api/save_friendly_game/', views.save_friendly_game, name='save_friendly_game'),
+    path('api/cache_stats/', views.cache_stats, name='cache_stats'),
     # Removed direct references to old templates for clarity
     # path('old_template_path/', views.old_template_view, name='old_template'),
     # path('another_old_template/', views.another_old_template_view, name='another_old_template'),
@@ -5,7 +5,7 @@ from django.contrib import messages
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
-from django.core.paginator import Paginator
+from django.db import transaction
 import json
 
 from .forms import LoginForm, RegisterForm
@@ -116,256 +116,268 @@ def logout_view(request):
 
 from django.shortcuts import render, get_object_or_404
 from .models import Club, ClubEvent, Tournament, Player
+from .stats import player_stats_map, monthly_stats_from_table, first_recorded_month, club_head_to_head
+from . import scoreboard
+from .caching import cached_result
+
+
+def is_club_admin(request, club_id):
+    """Администрирует ли пользователь запроса клуб (флаг для кнопок на страницах).
+
+    Администраторы клуба кэшируются под версией клуба (ее сдвигают сигналы
+    ClubAdmin), а ответ запоминается на самом запросе, так что повторный
+    просмотр страницы администратором не обращается к ClubAdmin.
+    """
+    if not request.user.is_authenticated:
+        return False
+    answers = request.__dict__.setdefault('_club_admin', {})
+    if club_id not in answers:
+        from .models import ClubAdmin
+        admins = cached_result('club_admins', [('club', club_id)], None, lambda: set(
+            ClubAdmin.objects.filter(club_id=club_id).values_list('user_id', flat=True)
+        ))
+        answers[club_id] = request.user.pk in admins
+    return answers[club_id]
+
 
 def club_detail(request, club_id):
     club = get_object_or_404(Club, id=club_id)
     events = ClubEvent.objects.filter(club=club).order_by('-date')
     tournaments = Tournament.objects.filter(club=club).order_by('-start_date')
-    players = Player.objects.filter(club=club).order_by('-rating')
+    players = list(Player.objects.filter(club=club).select_related('stats_row').order_by('-rating'))
+    stats_map = player_stats_map(players)
 
     for player in players:
-        stats = player.get_stats()
+        stats = stats_map[player.pk]
         stats['win_percent'] = round((stats['wins'] / stats['total_games']) * 100, 1) if stats['total_games'] > 0 else 0
         player.stats = stats
 
-    # Флаг администратора клуба (кнопки добавления скрываем для не админов / неавторизованных)
-    from .models import ClubAdmin  # локальный импорт чтобы избежать циклов при старте
-    is_club_admin = False
-    if request.user.is_authenticated:
-        is_club_admin = ClubAdmin.objects.filter(user=request.user, club=club).exists()
-
     context = {
         'club': club,
         'events': events,
         'tournaments': tournaments,
         'players': players,
-        'is_club_admin': is_club_admin,
+        # Флаг администратора клуба (кнопки добавления скрываем для не админов / неавторизованных)
+        'is_club_admin': is_club_admin(request, club.id),
+        # Идущие товарищеские игры из снимка трансляции (без запросов к БД)
+        'live_games': scoreboard.club_snapshot(club.id),
     }
 
     return render(request, 'club_detail.html', context)
 
 
+def _match_history_entry(match, player):
+    opponent = match.player2 if match.player1 == player else match.player1
+    # Определяем результат
+    if match.winner == player:
+        result = 'Победа'
+        result_class = 'win'
+    elif match.winner is not None:
+        result = 'Поражение'
+        result_class = 'loss'
+    else:
+        result = 'Не завершен'
+        result_class = 'incomplete'
+
+    # Определяем судью (того, кто сохранил результат)
+    referee = match.tournament.created_by.username if match.tournament.created_by else 'Система'
+
+    return {
+        'date': match.played_at,
+        'type': 'tournament',
+        'tournament_name': match.tournament.name,
+        'opponent': opponent.full_name if opponent else 'TBA',
+        'score': f"{match.sets_player1}:{match.sets_player2}" if match.finished else 'В процессе',
+        'result': result,
+        'result_class': result_class,
+        'referee': referee
+    }
+
+
+def _friendly_single_history_entry(friendly, player):
+    opponent = friendly.player2 if friendly.player1 == player else friendly.player1
+
+    # Определяем результат
+    if friendly.winner == player:
+        result = 'Победа'
+        result_class = 'win'
+    elif friendly.winner is not None:
+        result = 'Поражение'
+        result_class = 'loss'
+    else:
+        result = 'Не завершена'
+        result_class = 'incomplete'
+
+    # Определяем счет для одиночных игр
+    if friendly.player1 == player:
+        score = f"{friendly.score_team1}:{friendly.score_team2}"
+    else:
+        score = f"{friendly.score_team2}:{friendly.score_team1}"
+
+    # Определяем судью
+    referee = friendly.recorded_by.username if friendly.recorded_by else 'Н/Д'
+
+    return {
+        'date': friendly.played_at,
+        'type': 'friendly_single',
+        'tournament_name': 'Товарищеская (одиночная)',
+        'opponent': opponent.full_name if opponent else 'Неизвестно',
+        'score': score if friendly.score_team1 > 0 or friendly.score_team2 > 0 else 'Н/Д',
+        'result': result,
+        'result_class': result_class,
+        'referee': referee
+    }
+
+
+def _friendly_double_history_entry(friendly, player):
+    # Определяем команду игрока и команду соперника
+    if friendly.team1_player1 == player or friendly.team1_player2 == player:
+        player_team = 1
+        partner = friendly.team1_player2 if friendly.team1_player1 == player else friendly.team1_player1
+        opponents = [friendly.team2_player1, friendly.team2_player2]
+        score = f"{friendly.score_team1}:{friendly.score_team2}"
+    else:
+        player_team = 2
+        partner = friendly.team2_player2 if friendly.team2_player1 == player else friendly.team2_player1
+        opponents = [friendly.team1_player1, friendly.team1_player2]
+        score = f"{friendly.score_team2}:{friendly.score_team1}"
+
+    # Формируем строку с соперниками
+    opponent_names = " / ".join([p.full_name for p in opponents if p])
+    partner_name = partner.full_name if partner else 'Неизвестно'
+
+    # Определяем результат
+    if friendly.winning_team == player_team:
+        result = 'Победа'
+        result_class = 'win'
+    elif friendly.winning_team is not None:
+        result = 'Поражение'
+        result_class = 'loss'
+    else:
+        result = 'Не завершена'
+        result_class = 'incomplete'
+
+    # Определяем судью
+    referee = friendly.recorded_by.username if friendly.recorded_by else 'Н/Д'
+
+    return {
+        'date': friendly.played_at,
+        'type': 'friendly_double',
+        'tournament_name': 'Товарищеская (парная)',
+        'opponent': f"{opponent_names} (партнер: {partner_name})",
+        'score': score if friendly.score_team1 > 0 or friendly.score_team2 > 0 else 'Н/Д',
+        'result': result,
+        'result_class': result_class,
+        'referee': referee
+    }
+
+
+def game_history_entries(player, participations):
+    """Строки истории игр для указанных записей PlayerParticipation (в их порядке)."""
+    from .models import Match, FriendlyGame, PlayerParticipation
+
+    participations = list(participations)
+    ids = {source_type: [] for source_type, _ in PlayerParticipation.SOURCE_TYPES}
+    for row in participations:
+        ids[row.source_type].append(row.source_id)
+    matches = Match.objects.select_related('tournament__created_by', 'player1', 'player2', 'winner').in_bulk(
+        ids[PlayerParticipation.SOURCE_MATCH]
+    )
+    friendlies = FriendlyGame.objects.select_related(
+        'player1', 'player2', 'winner', 'team1_player1', 'team1_player2', 'team2_player1', 'team2_player2', 'recorded_by'
+    ).in_bulk(ids[PlayerParticipation.SOURCE_FRIENDLY])
+
+    entries = []
+    for row in participations:
+        if row.source_type == PlayerParticipation.SOURCE_MATCH:
+            match = matches.get(row.source_id)
+            if match:
+                entries.append(_match_history_entry(match, player))
+            continue
+        friendly = friendlies.get(row.source_id)
+        if friendly is None:
+            continue
+        if friendly.game_type == 'double':
+            entries.append(_friendly_double_history_entry(friendly, player))
+        else:
+            entries.append(_friendly_single_history_entry(friendly, player))
+    return entries
+
+
+HISTORY_PAGE_SIZE = 10
+
+
+def _history_cursor(row):
+    """Курсор записи истории: микросекунды played_at и id записи участия."""
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    epoch = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+    return f'{(row.played_at - epoch) // timedelta(microseconds=1)}:{row.pk}'
+
+
+def _parse_history_cursor(cursor):
+    """(played_at, id) из курсора; ValueError для неверной строки."""
+    from datetime import datetime, timedelta, timezone as dt_timezone
+    micros, pk = map(int, cursor.split(':'))
+    return datetime(1970, 1, 1, tzinfo=dt_timezone.utc) + timedelta(microseconds=micros), pk
+
+
+def history_page(player, before=None, after=None, size=HISTORY_PAGE_SIZE):
+    """Страница истории игр по курсору (keyset) вместо OFFSET.
+
+    before — курсор: страница старше него, after — новее него, без обоих —
+    самые новые игры. Читается size + 1 запись индекса (player, played_at),
+    детали — только для страницы, поэтому стоимость не зависит от длины карьеры.
+    Возвращает {'entries', 'newer', 'older'}: курсоры соседних страниц или None.
+    """
+    from django.db.models import Q
+
+    participations = player.participations.all()
+    if after is not None:
+        played_at, pk = _parse_history_cursor(after)
+        rows = list(participations.filter(
+            Q(played_at__gte=played_at) & (Q(played_at__gt=played_at) | Q(id__gt=pk))
+        ).order_by('played_at', 'id')[:size + 1])
+        if len(rows) > size:
+            rows = rows[:size][::-1]
+            return {'entries': game_history_entries(player, rows), 'newer': _history_cursor(rows[0]),
+                    'older': _history_cursor(rows[-1])}
+        # Дошли до начала списка — показываем первую страницу целиком
+        before = None
+
+    newest = participations.order_by('-played_at', '-id')
+    if before is not None:
+        played_at, pk = _parse_history_cursor(before)
+        newest = newest.filter(Q(played_at__lte=played_at) & (Q(played_at__lt=played_at) | Q(id__lt=pk)))
+    rows = list(newest[:size + 1])
+    has_older, rows = len(rows) > size, rows[:size]
+    return {
+        'entries': game_history_entries(player, rows),
+        'newer': _history_cursor(rows[0]) if before is not None and rows else None,
+        'older': _history_cursor(rows[-1]) if has_older else None,
+    }
+
+
 def player_detail(request, player_id):
     """Страница статистики игрока: сверху общая статистика, ниже — список игроков клуба с H2H."""
-    player = get_object_or_404(Player.objects.select_related('club'), id=player_id)
-    club = player.club
-
     # Получаем параметр для включения парных игр (по умолчанию False - только одиночные)
     include_doubles = request.GET.get('include_doubles', 'false').lower() == 'true'
 
+    player = get_object_or_404(Player.objects.select_related('club', 'stats_row'), id=player_id)
+    club = player.club
+
     # Общая статистика игрока с учетом фильтра парных игр
-    overall = player.get_stats(include_doubles=include_doubles)
+    overall = player_stats_map([player], include_doubles=include_doubles)[player.pk]
     overall['win_percent'] = round((overall['wins'] / overall['total_games']) * 100, 1) if overall.get('total_games') else 0
 
     # Head-to-head по игрокам клуба
-    from django.db.models import Q
-    from .models import Match, FriendlyGame
-
-    club_players = list(Player.objects.filter(club=club).exclude(id=player.id).order_by('full_name'))
-    h2h_rows = []
-
-    # Собираем одиночные товарищеские и матчи, где оба игрока заданы
-    for opp in club_players:
-        # Матчи турниров между player и opp
-        matches = Match.objects.filter(
-            Q(player1__in=[player, opp]) & Q(player2__in=[player, opp])
-        )
-        # Одиночные товарищеские между player и opp
-        friend_single = FriendlyGame.objects.filter(
-            game_type='single'
-        ).filter(
-            (Q(player1=player) & Q(player2=opp)) | (Q(player1=opp) & Q(player2=player))
-        )
-
-        # Парные товарищеские: считаем только если include_doubles=True
-        if include_doubles:
-            # Для H2H считаем игру, если оба игрока участвовали и были в разных командах
-            friend_double = FriendlyGame.objects.filter(game_type='double').filter(
-                (
-                    (Q(team1_player1=player) | Q(team1_player2=player)) &
-                    (Q(team2_player1=opp) | Q(team2_player2=opp))
-                ) | (
-                    (Q(team2_player1=player) | Q(team2_player2=player)) &
-                    (Q(team1_player1=opp) | Q(team1_player2=opp))
-                )
-            )
-        else:
-            friend_double = FriendlyGame.objects.none()
-
-        total = matches.count() + friend_single.count() + friend_double.count()
-
-        # Считаем только завершенные для вин/лосс и процента
-        finished_matches = matches.exclude(winner__isnull=True)
-        finished_friend_single = friend_single.exclude(winner__isnull=True)
-        finished_friend_double = friend_double.exclude(winning_team__isnull=True) if include_doubles else FriendlyGame.objects.none()
-        
-        completed = (
-            finished_matches.count() +
-            finished_friend_single.count() +
-            (finished_friend_double.count() if include_doubles else 0)
-        )
-
-        # Победы игрока
-        wins = 0
-        wins += finished_matches.filter(winner=player).count()
-        wins += finished_friend_single.filter(winner=player).count()
-        
-        # Победы в парных — только если include_doubles=True
-        if include_doubles:
-            wins += FriendlyGame.objects.filter(id__in=finished_friend_double.values('id')).filter(
-                (
-                    (Q(team1_player1=player) | Q(team1_player2=player)) & Q(winning_team=1)
-                ) | (
-                    (Q(team2_player1=player) | Q(team2_player2=player)) & Q(winning_team=2)
-                )
-            ).count()
-
-        losses = completed - wins
-        win_pct = round((wins / completed) * 100, 1) if completed else 0
-        h2h_rows.append({
-            'opponent': opp,
-            'games': total,
-            'wins': wins,
-            'losses': losses,
-            'win_pct': win_pct,
-        })
-
-    # Сортировка по количеству игр, затем по названию
-    h2h_rows.sort(key=lambda r: (-r['games'], r['opponent'].full_name.lower()))
+    h2h_rows = club_head_to_head(player, include_doubles=include_doubles)
 
-    # Получаем все игры игрока для списка игр с деталями
-    all_games = []
-    
-    # Турнирные матчи
-    tournament_matches = Match.objects.filter(
-        Q(player1=player) | Q(player2=player)
-    ).select_related('tournament', 'player1', 'player2', 'winner').order_by('-played_at')
-    
-    for match in tournament_matches:
-        opponent = match.player2 if match.player1 == player else match.player1
-        # Определяем результат
-        if match.winner == player:
-            result = 'Победа'
-            result_class = 'win'
-        elif match.winner is not None:
-            result = 'Поражение'
-            result_class = 'loss'
-        else:
-            result = 'Не завершен'
-            result_class = 'incomplete'
-        
-        # Определяем судью (того, кто сохранил результат)
-        referee = match.tournament.created_by.username if match.tournament.created_by else 'Система'
-        
-        all_games.append({
-            'date': match.played_at,
-            'type': 'tournament',
-            'tournament_name': match.tournament.name,
-            'opponent': opponent.full_name if opponent else 'TBA',
-            'score': f"{match.sets_player1}:{match.sets_player2}" if match.finished else 'В процессе',
-            'result': result,
-            'result_class': result_class,
-            'referee': referee
-        })
-    
-    # Одиночные товарищеские игры
-    friendly_singles = FriendlyGame.objects.filter(
-        game_type='single'
-    ).filter(
-        Q(player1=player) | Q(player2=player)
-    ).select_related('player1', 'player2', 'winner', 'recorded_by').order_by('-played_at')
-    
-    for friendly in friendly_singles:
-        opponent = friendly.player2 if friendly.player1 == player else friendly.player1
-        
-        # Определяем результат
-        if friendly.winner == player:
-            result = 'Победа'
-            result_class = 'win'
-        elif friendly.winner is not None:
-            result = 'Поражение'
-            result_class = 'loss'
-        else:
-            result = 'Не завершена'
-            result_class = 'incomplete'
-        
-        # Определяем счет для одиночных игр
-        if friendly.player1 == player:
-            score = f"{friendly.score_team1}:{friendly.score_team2}"
-        else:
-            score = f"{friendly.score_team2}:{friendly.score_team1}"
-        
-        # Определяем судью
-        referee = friendly.recorded_by.username if friendly.recorded_by else 'Н/Д'
-        
-        all_games.append({
-            'date': friendly.played_at,
-            'type': 'friendly_single',
-            'tournament_name': 'Товарищеская (одиночная)',
-            'opponent': opponent.full_name if opponent else 'Неизвестно',
-            'score': score if friendly.score_team1 > 0 or friendly.score_team2 > 0 else 'Н/Д',
-            'result': result,
-            'result_class': result_class,
-            'referee': referee
-        })
-    
-    # Парные товарищеские игры
-    friendly_doubles = FriendlyGame.objects.filter(
-        game_type='double'
-    ).filter(
-        Q(team1_player1=player) | Q(team1_player2=player) | 
-        Q(team2_player1=player) | Q(team2_player2=player)
-    ).select_related('team1_player1', 'team1_player2', 'team2_player1', 'team2_player2', 'recorded_by').order_by('-played_at')
-    
-    for friendly in friendly_doubles:
-        # Определяем команду игрока и команду соперника
-        if friendly.team1_player1 == player or friendly.team1_player2 == player:
-            player_team = 1
-            partner = friendly.team1_player2 if friendly.team1_player1 == player else friendly.team1_player1
-            opponents = [friendly.team2_player1, friendly.team2_player2]
-            score = f"{friendly.score_team1}:{friendly.score_team2}"
-        else:
-            player_team = 2
-            partner = friendly.team2_player2 if friendly.team2_player1 == player else friendly.team2_player1
-            opponents = [friendly.team1_player1, friendly.team1_player2]
-            score = f"{friendly.score_team2}:{friendly.score_team1}"
-        
-        # Формируем строку с соперниками
-        opponent_names = " / ".join([p.full_name for p in opponents if p])
-        partner_name = partner.full_name if partner else 'Неизвестно'
-        
-        # Определяем результат
-        if friendly.winning_team == player_team:
-            result = 'Победа'
-            result_class = 'win'
-        elif friendly.winning_team is not None:
-            result = 'Поражение'
-            result_class = 'loss'
-        else:
-            result = 'Не завершена'
-            result_class = 'incomplete'
-        
-        # Определяем судью
-        referee = friendly.recorded_by.username if friendly.recorded_by else 'Н/Д'
-        
-        all_games.append({
-            'date': friendly.played_at,
-            'type': 'friendly_double',
-            'tournament_name': 'Товарищеская (парная)',
-            'opponent': f"{opponent_names} (партнер: {partner_name})",
-            'score': score if friendly.score_team1 > 0 or friendly.score_team2 > 0 else 'Н/Д',
-            'result': result,
-            'result_class': result_class,
-            'referee': referee
-        })
-    
-    # Сортируем все игры по дате (новые первые)
-    all_games.sort(key=lambda x: x['date'], reverse=True)
-    
-    # Пагинация для списка игр
-    page_number = request.GET.get('page', 1)
-    paginator = Paginator(all_games, 10)  # 10 игр на страницу
-    games_page = paginator.get_page(page_number)
+    # История игр: курсорная пагинация по индексу участия; число игр — из PlayerStats
+    try:
+        games_page = history_page(player, before=request.GET.get('before') or None, after=request.GET.get('after') or None)
+    except ValueError:
+        games_page = history_page(player)
+    games_page['total'] = player_stats_map([player])[player.pk]['total_games']
 
     return render(request, 'player_detail.html', {
         'player': player,
@@ -379,32 +391,131 @@ def player_detail(request, player_id):
 
 from django.http import JsonResponse
 
+MONTHLY_STATS_MAX_MONTHS = 50 * 12
+
+
+def _parse_month(value, end_of_year=False):
+    """'2024' или '2024-05' -> (год, месяц). Для одного года берется январь или декабрь."""
+    parts = value.split('-')
+    if len(parts) == 1:
+        return int(parts[0]), 12 if end_of_year else 1
+    if len(parts) == 2 and 1 <= int(parts[1]) <= 12:
+        return int(parts[0]), int(parts[1])
+    raise ValueError(value)
+
+
 def player_monthly_stats(request, player_id):
-    """API endpoint для получения месячной статистики игрока"""
+    """API endpoint для получения месячной статистики игрока.
+
+    ?year=2025 — один год (как раньше); ?from=2023-01&to=2025-12 — произвольный
+    диапазон за один запрос. Без from диапазон начинается с января первого года,
+    в котором у игрока есть игры (вся карьера), без to — текущий месяц.
+    """
     try:
         player = get_object_or_404(Player, id=player_id)
         year = request.GET.get('year')
+        range_from = request.GET.get('from')
+        range_to = request.GET.get('to')
         include_doubles = request.GET.get('include_doubles', 'false').lower() == 'true'
-        
-        if year:
+        now_ts = timezone.now()
+
+        if range_from or range_to:
             try:
-                year = int(year)
+                last = _parse_month(range_to, end_of_year=True) if range_to else (now_ts.year, now_ts.month)
+                if range_from:
+                    first = _parse_month(range_from)
+                else:
+                    career_start = first_recorded_month(player)
+                    first = (career_start[0], 1) if career_start else (last[0], 1)
             except ValueError:
-                return JsonResponse({'error': 'Неверный формат года'}, status=400)
-        
-        monthly_stats = player.get_monthly_stats(year, include_doubles=include_doubles)
-        
-        return JsonResponse({
+                return JsonResponse({'error': 'Неверный формат диапазона (ожидается ГГГГ или ГГГГ-ММ)'}, status=400)
+            months = (last[0] - first[0]) * 12 + last[1] - first[1] + 1
+            if months < 1 or months > MONTHLY_STATS_MAX_MONTHS:
+                return JsonResponse({'error': 'Неверный диапазон месяцев'}, status=400)
+        else:
+            if year:
+                try:
+                    year = int(year)
+                except ValueError:
+                    return JsonResponse({'error': 'Неверный формат года'}, status=400)
+            year = year or now_ts.year
+            first, last = (year, 1), (year, 12)
+
+        monthly_stats = monthly_stats_from_table(player, first, last, include_doubles=include_doubles)
+
+        response = {
             'player_name': player.full_name,
-            'year': year or timezone.now().year,
+            'from': '%04d-%02d' % first,
+            'to': '%04d-%02d' % last,
             'monthly_stats': monthly_stats,
             'include_doubles': include_doubles
-        })
+        }
+        if not (range_from or range_to):
+            response['year'] = year
+        return JsonResponse(response)
     except Exception as e:
         return JsonResponse({'error': str(e)}, status=500)
 
 
 
+RATING_HISTORY_DEFAULT_POINTS = 500
+RATING_HISTORY_MAX_POINTS = 5000
+
+
+def player_rating_history(request, player_id):
+    """API: кривая рейтинга игрока для графика.
+
+    ?from=2024-01-01&to=2025-06-30 — диапазон дат (по умолчанию вся карьера),
+    ?points=N — не больше N точек (мин./макс. по корзинам, см. ratings.downsample).
+    Точки — [миллисекунды Unix, рейтинг].
+    """
+    from datetime import date, datetime, time as dt_time
+    from . import caching, ratings
+
+    player = get_object_or_404(Player, id=player_id)
+    try:
+        start = date.fromisoformat(request.GET['from']) if request.GET.get('from') else None
+        end = date.fromisoformat(request.GET['to']) if request.GET.get('to') else None
+        limit = int(request.GET.get('points', RATING_HISTORY_DEFAULT_POINTS))
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры (ожидается from/to ГГГГ-ММ-ДД и целое points)'}, status=400)
+    if not 4 <= limit <= RATING_HISTORY_MAX_POINTS or (start and end and start > end):
+        return JsonResponse({'error': 'Неверный диапазон'}, status=400)
+
+    start_at = timezone.make_aware(datetime.combine(start, dt_time.min)) if start else None
+    end_at = timezone.make_aware(datetime.combine(end, dt_time.max)) if end else None
+    series = caching.cached_result(
+        'rating_history', [('player', player.pk)], (start, end, limit),
+        lambda: ratings.rating_series(player.pk, start_at, end_at, limit),
+    )
+    return JsonResponse({
+        'player_id': player.pk,
+        'rating': player.rating,
+        'from': start.isoformat() if start else None,
+        'to': end.isoformat() if end else None,
+        'points': [[ts * 1000, rating] for ts, rating in series],
+    })
+
+
+
+def leaderboard_api(request):
+    """API: рейтинг-лист. ?club=<id>&hand=right|left&limit=50&after=<курсор из next или rating:id>."""
+    from . import leaderboard
+
+    hand = request.GET.get('hand') or None
+    if hand is not None and hand not in leaderboard.HANDS:
+        return JsonResponse({'error': 'hand: ожидается right или left'}, status=400)
+    try:
+        club_id = int(request.GET['club']) if request.GET.get('club') else None
+        limit = int(request.GET.get('limit', leaderboard.DEFAULT_LIMIT))
+        after = leaderboard.decode_cursor(request.GET['after'], club_id, hand) if request.GET.get('after') else None
+    except ValueError:
+        return JsonResponse({'error': 'Неверные параметры club, limit или after'}, status=400)
+    if not 1 <= limit <= leaderboard.MAX_LIMIT:
+        return JsonResponse({'error': f'limit: от 1 до {leaderboard.MAX_LIMIT}'}, status=400)
+    return JsonResponse(leaderboard.page(club_id=club_id, hand=hand, after=after, limit=limit))
+
+
 from django.contrib.auth.decorators import login_required
 from .models import Club, ClubMembership
 from django import forms
@@ -540,66 +651,11 @@ def add_player(request, club_id):
 
 # ------------------ Турниры расширенно ------------------
 
-def tournament_detail(request, tournament_id):
-    tournament = get_object_or_404(Tournament, id=tournament_id)
+def _tournament_tables(tournament):
+    """Участники, матчи, таблица и матрица результатов турнира (кэшируются в tournament_detail)."""
     participants = list(TournamentParticipant.objects.filter(tournament=tournament).select_related('player'))
     matches = list(tournament.matches.select_related('player1','player2','winner').all())
-    standings = tournament.standings.select_related('player').order_by('rank') if tournament.tournament_type == Tournament.ROUND_ROBIN else []
-
-    # Форма создания матча вручную
-    match_form = TournamentMatchForm()
-    if request.method == 'POST' and 'create_match' in request.POST:
-        from .models import ClubAdmin
-        if not (request.user.is_authenticated and ClubAdmin.objects.filter(user=request.user, club=tournament.club).exists()):
-            messages.error(request, 'Недостаточно прав')
-            return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
-        match_form = TournamentMatchForm(request.POST)
-        # Ограничим выбор списком участников
-        allowed_players = Player.objects.filter(tournamentparticipant__tournament=tournament)
-        match_form.fields['player1'].queryset = allowed_players
-        match_form.fields['player2'].queryset = allowed_players
-        
-        # Получаем player1 и player2 из формы
-        player1_id = request.POST.get('player1')
-        player2_id = request.POST.get('player2')
-        
-        try:
-            player1 = Player.objects.get(id=player1_id, tournamentparticipant__tournament=tournament)
-            player2 = Player.objects.get(id=player2_id, tournamentparticipant__tournament=tournament)
-            
-            if player1.id == player2.id:
-                messages.error(request, 'Игроки должны быть разными')
-            else:
-                # Проверяем, что матча между этими игроками еще нет
-                existing_match = Match.objects.filter(
-                    tournament=tournament,
-                    player1__in=[player1, player2],
-                    player2__in=[player1, player2]
-                ).first()
-                
-                if existing_match:
-                    messages.error(request, 'Матч между этими игроками уже существует')
-                else:
-                    # Создаем новый матч
-                    new_match = Match.objects.create(
-                        tournament=tournament,
-                        player1=player1,
-                        player2=player2,
-                        round_number=1  # для круговых турниров всегда 1
-                    )
-                    messages.success(request, f'Матч создан: {player1.full_name} vs {player2.full_name}')
-                    return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
-                    
-        except Player.DoesNotExist:
-            messages.error(request, 'Неверные игроки')
-        except Exception as e:
-            messages.error(request, f'Ошибка создания матча: {str(e)}')
-            
-        return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
-    else:
-        allowed_players = Player.objects.filter(tournamentparticipant__tournament=tournament)
-        match_form.fields['player1'].queryset = allowed_players
-        match_form.fields['player2'].queryset = allowed_players
+    standings = list(tournament.standings.select_related('player').order_by('rank')) if tournament.tournament_type == Tournament.ROUND_ROBIN else []
 
     # Матрица результатов для кругового турнира
     rr_matrix = []
@@ -670,20 +726,89 @@ def tournament_detail(request, tournament_id):
                 row.append(cell)
             rr_matrix.append({'player': row_player, 'results': row})
 
-    # Флаг администратора клуба турнира
-    from .models import ClubAdmin
-    is_club_admin = False
-    if request.user.is_authenticated:
-        is_club_admin = ClubAdmin.objects.filter(user=request.user, club=tournament.club).exists()
-
-    return render(request, 'tournament_detail.html', {
-        'tournament': tournament,
+    return {
         'participants': participants,
         'matches': matches,
         'standings': standings,
-        'match_form': match_form,
         'rr_matrix': rr_matrix,
-        'is_club_admin': is_club_admin,
+    }
+
+
+def tournament_detail(request, tournament_id):
+    tournament = get_object_or_404(Tournament, id=tournament_id)
+
+    # Форма создания матча вручную
+    match_form = TournamentMatchForm()
+    if request.method == 'POST' and 'create_match' in request.POST:
+        from .models import ClubAdmin
+        if not (request.user.is_authenticated and ClubAdmin.objects.filter(user=request.user, club=tournament.club).exists()):
+            messages.error(request, 'Недостаточно прав')
+            return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
+        match_form = TournamentMatchForm(request.POST)
+        # Ограничим выбор списком участников
+        allowed_players = Player.objects.filter(tournamentparticipant__tournament=tournament)
+        match_form.fields['player1'].queryset = allowed_players
+        match_form.fields['player2'].queryset = allowed_players
+        
+        # Получаем player1 и player2 из формы
+        player1_id = request.POST.get('player1')
+        player2_id = request.POST.get('player2')
+        
+        try:
+            player1 = Player.objects.get(id=player1_id, tournamentparticipant__tournament=tournament)
+            player2 = Player.objects.get(id=player2_id, tournamentparticipant__tournament=tournament)
+            
+            if player1.id == player2.id:
+                messages.error(request, 'Игроки должны быть разными')
+            else:
+                # Проверяем, что матча между этими игроками еще нет
+                existing_match = Match.objects.filter(
+                    tournament=tournament,
+                    player1__in=[player1, player2],
+                    player2__in=[player1, player2]
+                ).first()
+                
+                if existing_match:
+                    messages.error(request, 'Матч между этими игроками уже существует')
+                else:
+                    # Создаем новый матч
+                    new_match = Match.objects.create(
+                        tournament=tournament,
+                        player1=player1,
+                        player2=player2,
+                        round_number=1  # для круговых турниров всегда 1
+                    )
+                    messages.success(request, f'Матч создан: {player1.full_name} vs {player2.full_name}')
+                    return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
+                    
+        except Player.DoesNotExist:
+            messages.error(request, 'Неверные игроки')
+        except Exception as e:
+            messages.error(request, f'Ошибка создания матча: {str(e)}')
+            
+        return redirect('tennis_app:tournament_detail', tournament_id=tournament.id)
+
+    # Таблицы турнира пересчитываются только после изменения результатов (см. caching.bump)
+    tables = cached_result(
+        'tournament_detail', [('tournament', tournament.id), ('club', tournament.club_id)], None,
+        lambda: _tournament_tables(tournament),
+    )
+
+    # Флаг администратора клуба турнира; форма матча видна только ему
+    club_admin = is_club_admin(request, tournament.club_id)
+    if club_admin:
+        # Выбор ограничен участниками; варианты — из закэшированного списка, без запроса
+        choices = [('', match_form.fields['player1'].empty_label)]
+        choices += [(link.player.pk, str(link.player)) for link in tables['participants']]
+        for name in ('player1', 'player2'):
+            match_form.fields[name].queryset = Player.objects.filter(tournamentparticipant__tournament=tournament)
+            match_form.fields[name].choices = choices
+
+    return render(request, 'tournament_detail.html', {
+        'tournament': tournament,
+        'match_form': match_form,
+        'is_club_admin': club_admin,
+        **tables,
     })
 
 
@@ -755,123 +880,17 @@ def play_match_live(request, match_id):
         messages.error(request, 'Невозможно начать: не оба игрока заданы')
         return redirect('tennis_app:tournament_detail', tournament_id=match.tournament.id)
     
-    # Получаем текущую партию (последняя незавершенная)
-    current_game = match.get_current_game()
-    
-    # Получаем все завершенные партии для отображения истории
-    completed_games = match.get_completed_games()
+    # Счет активной партии ведется в памяти процесса (live.py), очки пишутся в БД пакетами
+    from .live import broadcast, get_live_match
+    live = get_live_match(match)
 
     if request.method == 'POST':
         action = request.POST.get('action')
         is_ajax = request.headers.get('X-Requested-With') == 'XMLHttpRequest'
-        
-        response_data = {
-            'success': False,
-            'message': '',
-            'message_type': 'info',
-            'match_finished': False,
-            'set_finished': False,
-            'current_game': bool(current_game),
-            'score': [0, 0],
-            'sets': {'p1': match.sets_player1, 'p2': match.sets_player2},
-            'player1_name': match.player1.full_name,
-            'player2_name': match.player2.full_name,
-            'first_server': current_game.first_server if current_game else 1
-        }
-        
-        # Начало новой партии
-        if action == 'start_set' and not current_game and not match.finished:
-            first_server = int(request.POST.get('first_server', 1))  # По умолчанию первый игрок
-            from django.utils import timezone
-            current_game = Game.objects.create(
-                match=match,
-                start_time=timezone.now(),
-                first_server=first_server
-            )
-            response_data['success'] = True
-            response_data['message'] = 'Новая партия начата!'
-            response_data['current_game'] = True
-            response_data['set_finished'] = True  # Чтобы обновить страницу
-            
-        elif action in ['p1', 'p2'] and current_game and not match.finished:
-            # Добавление очка
-            scorer = match.player1 if action == 'p1' else match.player2
-            order = current_game.points.count() + 1
-            Point.objects.create(game=current_game, scored_by=scorer, order=order)
-            current_game.recalculate_score()
-            
-            response_data['success'] = True
-            response_data['score'] = [current_game.score_player1, current_game.score_player2]
-            response_data['message'] = f'Очко для {scorer.full_name}!'
-            
-            # Проверяем завершение партии (до 11 с разницей >=2)
-            s1, s2 = current_game.score_player1, current_game.score_player2
-            if (s1 >= 11 or s2 >= 11) and abs(s1 - s2) >= 2:
-                # Партия завершена
-                from django.utils import timezone
-                current_game.end_time = timezone.now()
-                current_game.save(update_fields=['end_time'])
-                
-                # Начисляем сет победителю партии
-                if s1 > s2:
-                    match.sets_player1 += 1
-                    response_data['message'] = f'Партия завершена! Победитель: {match.player1.full_name} ({s1}:{s2})'
-                    response_data['message_type'] = 'success'
-                else:
-                    match.sets_player2 += 1
-                    response_data['message'] = f'Партия завершена! Победитель: {match.player2.full_name} ({s2}:{s1})'
-                    response_data['message_type'] = 'success'
-                
-                match.save(update_fields=['sets_player1','sets_player2'])
-                response_data['sets'] = {'p1': match.sets_player1, 'p2': match.sets_player2}
-                response_data['set_finished'] = True
-                
-                # Проверка победы в матче (до 2 выигранных партий)
-                if match.sets_player1 == 2:
-                    match.set_winner(match.player1)
-                    match.finished = True
-                    match.save(update_fields=['finished'])
-                    response_data['message'] = f'Матч завершен! Победитель: {match.player1.full_name} (2:{match.sets_player2})'
-                    response_data['match_finished'] = True
-                elif match.sets_player2 == 2:
-                    match.set_winner(match.player2)
-                    match.finished = True
-                    match.save(update_fields=['finished'])
-                    response_data['message'] = f'Матч завершен! Победитель: {match.player2.full_name} (2:{match.sets_player1})'
-                    response_data['match_finished'] = True
-                else:
-                    # Матч продолжается, партия завершена
-                    current_game = None
-                    response_data['current_game'] = False
-                    
-        elif action in ['undo_p1', 'undo_p2'] and current_game and not match.finished:
-            # Откат последнего очка
-            scorer = match.player1 if action == 'undo_p1' else match.player2
-            last_point = current_game.points.filter(scored_by=scorer).order_by('-order').first()
-            if last_point:
-                last_point.delete()
-                current_game.recalculate_score()
-                response_data['success'] = True
-                response_data['score'] = [current_game.score_player1, current_game.score_player2]
-                response_data['message'] = f'Очко отменено для {scorer.full_name}'
-                response_data['message_type'] = 'info'
-            else:
-                response_data['message'] = f'Нет очков для отмены у {scorer.full_name}'
-                response_data['message_type'] = 'error'
-                    
-        elif action == 'new_set' and not current_game and not match.finished:
-            first_server = int(request.POST.get('first_server', 1))  # По умолчанию первый игрок
-            from django.utils import timezone
-            current_game = Game.objects.create(
-                match=match,
-                start_time=timezone.now(),
-                first_server=first_server
-            )
-            response_data['success'] = True
-            response_data['message'] = 'Новая партия начата!'
-            response_data['current_game'] = True
-            response_data['set_finished'] = True  # Чтобы обновить страницу
-        
+        response_data = live.apply(action, first_server=request.POST.get('first_server', 1))
+        if response_data['success']:
+            broadcast(live)
+
         # Если это AJAX запрос, возвращаем JSON
         if is_ajax:
             if not response_data['success'] and not response_data['message']:
@@ -889,6 +908,15 @@ def play_match_live(request, match_id):
                     messages.info(request, response_data['message'])
             return redirect('tennis_app:play_match_live', match_id=match.id)
 
+    # Перед отрисовкой страницы дописываем ожидающие очки, чтобы история в БД была полной
+    live.flush()
+
+    # Получаем текущую партию (последняя незавершенная)
+    current_game = match.get_current_game()
+
+    # Получаем все завершенные партии для отображения истории
+    completed_games = match.get_completed_games()
+
     # Подготовка данных для шаблона
     sets = {
         'p1': match.sets_player1,
@@ -911,12 +939,48 @@ def play_match_live(request, match_id):
         'score': score,
         'sets': sets,
         'games_history': games_history,
+        'score_seq': live.last_seq,
         'is_tournament': True,
         'title': 'Живой матч',
         'header': f'Матч: {match.player1.full_name} vs {match.player2.full_name}',
     })
 
 
+def match_score_api(request, match_id):
+    """JSON API судьи: пакет упорядоченных действий, в ответ — сжатое состояние счета.
+
+    Тело запроса: {"key": "<ключ идемпотентности>", "actions": [{"seq": 1, "action": "p1"}, ...]}.
+    Без входа — 401 в JSON (а не перенаправление на страницу входа, как у @login_required).
+    """
+    from .live import broadcast, get_live_match, parse_actions
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Требуется вход'}, status=401)
+    if request.method != 'POST':
+        return JsonResponse({'error': 'Invalid method'}, status=405)
+    match = Match.objects.select_related('tournament', 'player1', 'player2').filter(id=match_id).first()
+    if match is None:
+        return JsonResponse({'error': 'Матч не найден'}, status=404)
+    if not ClubAdmin.objects.filter(user=request.user, club_id=match.tournament.club_id).exists():
+        return JsonResponse({'error': 'Недостаточно прав'}, status=403)
+    if not (match.player1_id and match.player2_id):
+        return JsonResponse({'error': 'Не оба игрока заданы'}, status=400)
+
+    try:
+        data = json.loads(request.body)
+        actions = parse_actions(data['actions'])
+        key = data.get('key')
+        if key is not None and not isinstance(key, str):
+            raise ValueError
+    except (ValueError, KeyError, TypeError):
+        return JsonResponse({'error': 'Неверный формат запроса'}, status=400)
+
+    live = get_live_match(match)
+    result = live.apply_batch(actions, key=key, first_server=data.get('first_server', 1))
+    if result['applied']:
+        broadcast(live)
+    return JsonResponse(result)
+
+
 # ------------------ Приглашения администраторов ------------------
 
 @login_required
@@ -1002,62 +1066,82 @@ def save_friendly_game(request):
         start_time = data.get("start_time")
         end_time = data.get("end_time")
 
+        # Игра уже сохранена сервером из WebSocket-трансляции клуба этим же пользователем — не создаем дубликат
+        club_id = data.get("club_id")
+        if data.get("game_id") and str(club_id).isdigit() and request.user.is_authenticated:
+            from .friendlies import finished_friendly_id
+            friendly_id = finished_friendly_id(int(club_id), str(data["game_id"]), request.user.pk)
+            if friendly_id:
+                return JsonResponse({"status": "ok", "game_type": game_type, "friendly_id": friendly_id})
+
         def get_or_create_player(name):
             if not name:
                 return None
             player, _ = Player.objects.get_or_create(full_name=name, defaults={'club': None, 'rating': 1000})
             return player
 
-        if game_type == 'single':
-            name1 = data.get("player1")
-            name2 = data.get("player2")
-            winner_name = data.get("winner")
-            player1 = get_or_create_player(name1)
-            player2 = get_or_create_player(name2)
-            winner = player1 if name1 == winner_name else player2
-            game_obj = FriendlyGame.objects.create(
-                game_type='single',
-                player1=player1,
-                player2=player2,
-                winner=winner,
-                club=player1.club if (player1 and player2 and player1.club == player2.club) else None,
-                played_at=end_time,
-                score_team1=score1,
-                score_team2=score2,
-                recorded_by=request.user if request.user.is_authenticated else None
-            )
-        else:  # double
-            t1p1 = get_or_create_player(data.get("team1_player1"))
-            t1p2 = get_or_create_player(data.get("team1_player2"))
-            t2p1 = get_or_create_player(data.get("team2_player1"))
-            t2p2 = get_or_create_player(data.get("team2_player2"))
-            winning_team = data.get("winning_team")  # 1 или 2
-            # Определим клуб (если все игроки в одном клубе и он одинаковый)
-            clubs = {p.club for p in [t1p1, t1p2, t2p1, t2p2] if p and p.club}
-            club = clubs.pop() if len(clubs) == 1 else None
-            game_obj = FriendlyGame.objects.create(
-                game_type='double',
-                player1=t1p1,  # для совместимости оставим один слот
-                player2=t2p1,  # для совместимости
-                club=club,
-                team1_player1=t1p1,
-                team1_player2=t1p2,
-                team2_player1=t2p1,
-                team2_player2=t2p2,
-                winning_team=winning_team,
-                played_at=end_time,
-                score_team1=score1,
-                score_team2=score2,
-                recorded_by=request.user if request.user.is_authenticated else None
-            )
+        # Результат и партия сохраняются вместе со статистикой игроков в одной транзакции
+        with transaction.atomic():
+            if game_type == 'single':
+                name1 = data.get("player1")
+                name2 = data.get("player2")
+                winner_name = data.get("winner")
+                player1 = get_or_create_player(name1)
+                player2 = get_or_create_player(name2)
+                winner = player1 if name1 == winner_name else player2
+                game_obj = FriendlyGame.objects.create(
+                    game_type='single',
+                    player1=player1,
+                    player2=player2,
+                    winner=winner,
+                    club=player1.club if (player1 and player2 and player1.club == player2.club) else None,
+                    played_at=end_time,
+                    score_team1=score1,
+                    score_team2=score2,
+                    recorded_by=request.user if request.user.is_authenticated else None
+                )
+            else:  # double
+                t1p1 = get_or_create_player(data.get("team1_player1"))
+                t1p2 = get_or_create_player(data.get("team1_player2"))
+                t2p1 = get_or_create_player(data.get("team2_player1"))
+                t2p2 = get_or_create_player(data.get("team2_player2"))
+                winning_team = data.get("winning_team")  # 1 или 2
+                # Определим клуб (если все игроки в одном клубе и он одинаковый)
+                clubs = {p.club for p in [t1p1, t1p2, t2p1, t2p2] if p and p.club}
+                club = clubs.pop() if len(clubs) == 1 else None
+                game_obj = FriendlyGame.objects.create(
+                    game_type='double',
+                    player1=t1p1,  # для совместимости оставим один слот
+                    player2=t2p1,  # для совместимости
+                    club=club,
+                    team1_player1=t1p1,
+                    team1_player2=t1p2,
+                    team2_player1=t2p1,
+                    team2_player2=t2p2,
+                    winning_team=winning_team,
+                    played_at=end_time,
+                    score_team1=score1,
+                    score_team2=score2,
+                    recorded_by=request.user if request.user.is_authenticated else None
+                )
 
-        Game.objects.create(
-            friendly=game_obj,
-            start_time=start_time,
-            end_time=end_time,
-            score_player1=score1,
-            score_player2=score2
-        )
+            Game.objects.create(
+                friendly=game_obj,
+                start_time=start_time,
+                end_time=end_time,
+                score_player1=score1,
+                score_player2=score2
+            )
 
         return JsonResponse({"status": "ok", "game_type": game_type})
     return JsonResponse({"error": "Invalid method"}, status=405)
+
+
+from django.contrib.admin.views.decorators import staff_member_required
+
+
+@staff_member_required
+def cache_stats(request):
+    """Попадания и промахи кэша страниц в этом процессе (caching.report)."""
+    from .caching import report
+    return JsonResponse({'caches': report()})
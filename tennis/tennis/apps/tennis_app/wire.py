@@ -0,0 +1,77 @@
+"""Компактный протокол трансляции товарищеских игр (ws/friendly_game/<club_id>/?v=2).
+
+Клиент без параметра v получает прежние JSON-сообщения game_update/game_end
+с полным game_data. Клиент с v=2 получает:
+
+    {"t": "s", "v": 2, "enc": "json", "g": [{"n": 1, "q": 7, "d": {...game_data}}]}  снимок при подключении
+    ["f", n, q, {...game_data}]      полное состояние (новая игра или сменилось что-то кроме счета и подачи)
+    ["u", n, q, score1, score2, server]   дельта счета
+    ["e", n, q, winner]              окончание игры
+
+n — короткий номер игры в клубе, q — номер обновления игры (устаревшие кадры
+клиент отбрасывает). С enc=msgpack кадры приходят бинарными (msgpack), если
+пакет msgpack установлен; иначе — JSON, что видно по полю enc снимка.
+Клиент может прислать {"type": "sync"}, чтобы получить снимок заново.
+"""
+import json
+
+try:
+    import msgpack
+except ImportError:  # msgpack необязателен: без него v2 идет только в JSON
+    msgpack = None
+
+from .scoreboard import GAME_DATA_FIELDS
+
+PROTOCOL_VERSION = 2
+# Дельта ["u", ...] несет только эти поля
+DELTA_FIELDS = ('score1', 'score2', 'server')
+# Смена любого другого поля (игроки, составы пар, тип) требует полного кадра
+STATIC_FIELDS = tuple(field for field in GAME_DATA_FIELDS if field not in DELTA_FIELDS)
+
+
+def negotiate(query_string):
+    """Версия протокола и кодировка из строки запроса сокета: (1 | 2, 'json' | 'msgpack')."""
+    from urllib.parse import parse_qs
+    params = parse_qs(query_string.decode() if isinstance(query_string, bytes) else query_string)
+    version = PROTOCOL_VERSION if params.get('v') == [str(PROTOCOL_VERSION)] else 1
+    encoding = 'msgpack' if version == PROTOCOL_VERSION and params.get('enc') == ['msgpack'] and msgpack else 'json'
+    return version, encoding
+
+
+def snapshot_frame(entries, encoding):
+    return {
+        't': 's',
+        'v': PROTOCOL_VERSION,
+        'enc': encoding,
+        'g': [{'n': entry['n'], 'q': entry['seq'], 'd': entry['game_data']} for entry in entries],
+    }
+
+
+def update_frame(entry, previous):
+    game_data = entry['game_data']
+    if previous is None or any(previous.get(field) != game_data.get(field) for field in STATIC_FIELDS):
+        return ['f', entry['n'], entry['seq'], game_data]
+    return ['u', entry['n'], entry['seq'], game_data.get('score1', 0), game_data.get('score2', 0), game_data.get('server', 1)]
+
+
+def end_frame(entry, game_data):
+    return ['e', entry['n'], entry['seq'] + 1, game_data.get('winner')]
+
+
+def encode_json(frame):
+    return json.dumps(frame, ensure_ascii=False, separators=(',', ':'))
+
+
+def encode_msgpack(frame):
+    return msgpack.packb(frame, use_bin_type=True) if msgpack else None
+
+
+def frame_event(handler, legacy, frame):
+    """Событие группы: кадр каждой версии сериализован один раз на рассылку."""
+    event = {'type': handler, 'text': json.dumps(legacy)}
+    if frame is not None:
+        event['v2'] = encode_json(frame)
+        packed = encode_msgpack(frame)
+        if packed is not None:
+            event['v2b'] = packed
+    return event
@@ -83,11 +83,65 @@ WSGI_APPLICATION = 'tennis.wsgi.application'
 ASGI_APPLICATION = 'tennis.asgi.application'
 
 # Channels
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer'
+# С CHANNEL_REDIS_URL (например redis://127.0.0.1:6379/0) группы вида friendly_game_<club_id>
+# общие для всех воркеров daphne/uvicorn. Без переменной — слой в памяти одного процесса.
+# Нескольким воркерам нужен и общий кэш: CACHE_REDIS_URL (ниже), например redis://127.0.0.1:6379/1.
+CHANNEL_REDIS_URL = os.environ.get('CHANNEL_REDIS_URL')
+if CHANNEL_REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {
+                'hosts': [CHANNEL_REDIS_URL],
+                'prefix': os.environ.get('CHANNEL_REDIS_PREFIX', 'tennis'),
+                # Очередь сокета: запас на всплеск обновлений счета
+                'capacity': 1000,
+                'expiry': 30,
+            },
+        }
+    }
+else:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer'
+        }
+    }
+
+# Живой счет матчей (apps/tennis_app/live.py): очки пишутся в БД пакетами
+LIVE_SCORING_BATCH_SIZE = int(os.environ.get('LIVE_SCORING_BATCH_SIZE', 5))
+LIVE_SCORING_FLUSH_SECONDS = int(os.environ.get('LIVE_SCORING_FLUSH_SECONDS', 10))
+
+# Рейтинг Эло (apps/tennis_app/ratings.py). После смены K пересчитать: manage.py replay_ratings
+RATING_K_FACTOR = int(os.environ.get('RATING_K_FACTOR', 32))
+
+# Кэш страниц (apps/tennis_app/caching.py): записи с версионными ключами.
+# Версии сбрасываются в том процессе, где изменились данные, поэтому при нескольких
+# воркерах нужен общий кэш — CACHE_REDIS_URL или каталог CACHE_DIR. Без них — память процесса.
+CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+CACHE_DIR = os.environ.get('CACHE_DIR')
+if CACHE_REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': CACHE_REDIS_URL,
+            'KEY_PREFIX': os.environ.get('CACHE_KEY_PREFIX', 'tennis'),
+        }
+    }
+elif CACHE_DIR:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': CACHE_DIR,
+            'OPTIONS': {'MAX_ENTRIES': 50000},
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'OPTIONS': {'MAX_ENTRIES': 10000},
+        }
     }
-}
 
 
 # Database